@@ -1,12 +1,11 @@
 import os
-from flask import Flask, render_template, request, jsonify
+import json
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from flask_cors import CORS
 from extensions import db
-from dock_scheduler import DockScheduler
-from fulfillment_engine import FulfillmentEngine
-from carbon_calculator import CarbonCalculator
-from recommendation_engine import EmotionAwareRecommendation
-import os
+import db_pool
+import instrumentation
+import startup
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,8 +16,9 @@ CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
 db_uri = os.environ.get('DATABASE_URL')
 if not db_uri:
     raise RuntimeError("DATABASE_URL environment variable not set! Please set it in your environment or .env file.")
-app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+db_pool.configure(app, db_uri)
 db.init_app(app)
+instrumentation.init_app(app)
 
 # Import models after db is initialized
 def import_models():
@@ -26,11 +26,40 @@ def import_models():
     from models import Warehouse, DockSchedule, InventoryItem, DeliveryRoute, CustomerProfile, WeatherData
 import_models()
 
-# Initialize components
-dock_scheduler = DockScheduler(db)
-fulfillment_engine = FulfillmentEngine(db)
-carbon_calculator = CarbonCalculator()
-recommendation_engine = EmotionAwareRecommendation(db)
+def build_dock_scheduler():
+    from dock_scheduler import DockScheduler
+    return DockScheduler(db)
+
+def build_fulfillment_engine():
+    from fulfillment_engine import FulfillmentEngine
+    return FulfillmentEngine(db)
+
+def build_carbon_calculator():
+    from carbon_calculator import CarbonCalculator
+    return CarbonCalculator()
+
+def build_recommendation_engine():
+    from recommendation_engine import EmotionAwareRecommendation
+    return EmotionAwareRecommendation(db)
+
+def build_carbon_report():
+    from carbon_reports import CarbonReport
+    return CarbonReport(carbon_calculator)
+
+def build_route_optimizer():
+    from route_optimizer import RouteOptimizer
+    return RouteOptimizer(db, carbon_calculator)
+
+# Initialize components (built now or on first use, per STARTUP_MODE)
+components = startup.Components(app)
+dock_scheduler = components.add('dock_scheduler', build_dock_scheduler)
+fulfillment_engine = components.add('fulfillment_engine', build_fulfillment_engine)
+carbon_calculator = components.add('carbon_calculator', build_carbon_calculator)
+recommendation_engine = components.add('recommendation_engine', build_recommendation_engine)
+route_optimizer = components.add('route_optimizer', build_route_optimizer)
+carbon_report = components.add('carbon_report', build_carbon_report)
+if components.mode == 'background':
+    components.warm_in_background()
 
 @app.route('/')
 def dashboard():
@@ -42,6 +71,26 @@ def api_dock_scheduler():
     result = dock_scheduler.schedule_truck(data)
     return jsonify(result)
 
+@app.route('/api/dock-scheduler/batch', methods=['POST'])
+def api_dock_scheduler_batch():
+    data = request.json
+    trucks = data['trucks'] if isinstance(data, dict) else data
+    warehouse_id = data.get('warehouse_id') if isinstance(data, dict) else None
+    results = dock_scheduler.schedule_batch(trucks, warehouse_id)
+    return jsonify({
+        'scheduled': sum(1 for r in results if r['status'] == 'scheduled'),
+        'assignments': results
+    })
+
+@app.route('/api/heatmap', methods=['GET'])
+def api_heatmap():
+    body, etag = dock_scheduler.heatmap.render()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Dashboards poll this; let them revalidate and get a 304 when unchanged
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/api/fulfillment-engine', methods=['POST'])
 def api_fulfillment_engine():
     data = request.json
@@ -50,10 +99,39 @@ def api_fulfillment_engine():
         data.get('order_items', [])
     )
     return jsonify({
-        'warehouse': result['warehouse']['location'],
+        'warehouse': result['warehouse']['location'] if result['warehouse'] else None,
         'estimated_delivery': result['estimated_delivery_time']
     })
 
+@app.route('/api/fulfillment-engine/batch', methods=['POST'])
+def api_fulfillment_engine_batch():
+    data = request.json
+    orders = data['orders'] if isinstance(data, dict) else data
+    results = fulfillment_engine.select_optimal_warehouses(orders)
+    # One JSON object per line, sent as orders are planned
+    lines = (json.dumps(result) + '\n' for result in results)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+@app.route('/api/route-optimizer', methods=['POST'])
+def api_route_optimizer():
+    data = request.json
+    if data.get('warehouse_id') is None:
+        return jsonify({'error': 'warehouse_id is required'}), 400
+    try:
+        plan = route_optimizer.plan_deliveries(
+            data['warehouse_id'],
+            data.get('stops'),
+            fleet=data.get('fleet'),
+            objective=data.get('objective', 'distance'),
+            time_budget=float(data.get('time_budget', 2.0)),
+            save=data.get('save', True)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if 'error' in plan:
+        return jsonify(plan), 404
+    return jsonify(plan)
+
 @app.route('/api/carbon-calculator', methods=['POST'])
 def api_carbon_calculator():
     data = request.json
@@ -66,6 +144,16 @@ def api_carbon_calculator():
         'suggestions': suggestions
     })
 
+@app.route('/api/carbon-report', methods=['GET'])
+def api_carbon_report():
+    # Served from the Parquet rollups written by carbon_rollup.py, never delivery_route
+    try:
+        return jsonify(carbon_report.report(**carbon_report.report_args(request.args)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 503
+
 @app.route('/api/product-recommendation', methods=['POST'])
 def api_product_recommendation():
     data = request.json
@@ -80,5 +168,27 @@ def api_product_recommendation():
         'emotion_detected': result['emotion_detected']
     })
 
+@app.route('/api/product-recommendation/batch', methods=['POST'])
+def api_product_recommendation_batch():
+    data = request.json
+    items = data['requests'] if isinstance(data, dict) else data
+    results = recommendation_engine.recommend_products_batch([
+        ({'type': 'text', 'content': item.get('user_input', '')}, item.get('user_data', {}))
+        for item in items
+    ])
+    
+    return jsonify({'results': [{
+        'recommendations': [prod['name'] for prod in result['recommendations']],
+        'emotion_detected': result['emotion_detected']
+    } for result in results]})
+
+@app.route('/api/db-pool-stats', methods=['GET'])
+def api_db_pool_stats():
+    return jsonify(db_pool.pool_stats())
+
+@app.route('/api/product-recommendation/cache-stats', methods=['GET'])
+def api_product_recommendation_cache_stats():
+    return jsonify(recommendation_engine.sentiment_cache.stats())
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,439 @@
+"""ASGI entry point: the /api/* endpoints of app.py on an event loop.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8000 --workers 4
+
+Serves the same request and response bodies as the Flask app, which keeps
+working unchanged. Database access goes through SQLAlchemy's asyncio
+engine on asyncpg (PostgreSQL only), pooled with the same DB_POOL_* and
+READ_* variables as db_pool.py, so a request waiting on the database costs
+a coroutine rather than a thread.
+
+Lookups never touch the database per request: the warehouse, stock and
+product indexes, the heatmap summary and the weather cache are refreshed by
+background tasks through the async read engine, at each index's own check
+interval. CPU-bound work - sentiment scoring on a cache miss and route
+optimization - runs in a process pool of ASGI_CPU_WORKERS (default: one
+per CPU), started and shut down with the app. Dock placement (unload-time
+prediction and the batch assignment) works on the in-memory timelines, so
+it runs in a worker thread instead. Either way it never stalls the loop.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.templating import Jinja2Templates
+
+import db_pool
+import instrumentation
+from carbon_calculator import CarbonCalculator
+from carbon_reports import CarbonReport
+from dock_scheduler import DockScheduler
+from extensions import db
+from fulfillment_engine import FulfillmentEngine
+from models import DeliveryRoute, DockSchedule, Warehouse
+from recommendation_engine import EmotionAwareRecommendation
+from route_optimizer import RouteOptimizer, optimize_routes
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def async_url(url):
+    """The asyncpg form of a PostgreSQL URL"""
+    url = make_url(url)
+    if url.get_backend_name() != 'postgresql':
+        raise RuntimeError("The ASGI app needs a PostgreSQL DATABASE_URL (it runs on asyncpg).")
+    return url.set(drivername='postgresql+asyncpg')
+
+
+db_uri = os.environ.get('DATABASE_URL')
+if not db_uri:
+    raise RuntimeError("DATABASE_URL environment variable not set! Please set it in your environment or .env file.")
+engine = create_async_engine(
+    async_url(db_uri), **db_pool.engine_options(db_uri, poolclass=db_pool.TimedAsyncQueuePool))
+read_url = os.environ.get('READ_DATABASE_URL')
+read_engine = create_async_engine(
+    async_url(read_url), **db_pool.engine_options(read_url, 'READ_', db_pool.TimedAsyncQueuePool)
+) if read_url else engine
+Session = async_sessionmaker(engine, expire_on_commit=False)
+ReadSession = async_sessionmaker(read_engine)
+
+# Components are the same classes app.py uses; their own sessions stay unused
+dock_scheduler = DockScheduler(db)
+fulfillment_engine = FulfillmentEngine(db)
+carbon_calculator = CarbonCalculator()
+carbon_report = CarbonReport(carbon_calculator)
+recommendation_engine = EmotionAwareRecommendation(db)
+route_optimizer = RouteOptimizer(db, carbon_calculator)
+
+cpu_workers = int(os.environ.get('ASGI_CPU_WORKERS', os.cpu_count() or 1))
+cpu_pool = None  # started by lifespan()
+# The sentiment log writes from its own thread, so it gets a small synchronous engine
+recommendation_engine.sentiment_log.bind(create_engine(db_uri, pool_size=1, max_overflow=0, pool_pre_ping=True))
+
+# (index, seconds between checks) kept current by refresh tasks
+refreshed_indexes = [
+    (fulfillment_engine.warehouse_index, fulfillment_engine.warehouse_index.check_interval),
+    (fulfillment_engine.stock_index, fulfillment_engine.stock_index.check_interval),
+    (fulfillment_engine.weather_cache, fulfillment_engine.weather_cache.ttl),
+    (recommendation_engine.product_index, recommendation_engine.product_index.check_interval),
+    (dock_scheduler.heatmap, dock_scheduler.heatmap.check_interval),
+]
+
+# Lookups are in memory; only a live traffic feed (HTTP) would block the loop
+traffic_blocks = not fulfillment_engine.traffic.provider.local
+
+# warehouse_id -> asyncio.Lock; the timelines' own locks are for threads
+timeline_locks = {}
+
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+
+
+def load_locked(index, signature, rows):
+    with index.lock:
+        index.load(signature, rows)
+
+
+async def refresh_index(index):
+    """One signature check (and reload when it changed) on the read engine"""
+    async with ReadSession() as session:
+        signature = None
+        if hasattr(index, 'signature_query'):
+            signature = tuple((await session.execute(index.signature_query())).one())
+        if index.needs_reload(signature):
+            rows = (await session.execute(index.rows_query())).all()
+            # Building a BallTree or re-sorting a catalog is CPU work
+            await run_in_threadpool(load_locked, index, signature, rows)
+
+
+async def keep_fresh(index, interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_index(index)
+        except Exception:
+            # Keep serving the last good copy and try again next interval
+            logger.exception("Refreshing %s failed", type(index).__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global cpu_pool
+    # spawn: the workers must not inherit the event loop or open connections
+    cpu_pool = ProcessPoolExecutor(cpu_workers, mp_context=multiprocessing.get_context('spawn'))
+    recommendation_engine.pool, recommendation_engine.pool_workers = cpu_pool, cpu_workers
+    tasks = []
+    try:
+        # Import SciPy, pandas and TextBlob now rather than on the first request
+        for component in (dock_scheduler, fulfillment_engine, carbon_calculator, recommendation_engine,
+                          carbon_report):
+            await run_in_threadpool(component.warm_up, load=False)
+        for index, _ in refreshed_indexes:
+            index.external_refresh = True
+        await asyncio.gather(*(refresh_index(index) for index, _ in refreshed_indexes))
+        tasks = [asyncio.create_task(keep_fresh(index, interval)) for index, interval in refreshed_indexes]
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        cpu_pool.shutdown()
+        recommendation_engine.pool = cpu_pool = None
+        await engine.dispose()
+        if read_engine is not engine:
+            await read_engine.dispose()
+
+
+async def resolve_warehouse_id(session, warehouse_id=None):
+    """Requested warehouse, or the first one when none is given"""
+    query = select(Warehouse.id)
+    if warehouse_id:
+        query = query.where(Warehouse.id == warehouse_id)
+    return await session.scalar(query.limit(1))
+
+
+@asynccontextmanager
+async def locked_timeline(session, warehouse_id):
+    """DockScheduler.locked_timeline for coroutines"""
+    timeline = dock_scheduler.get_timeline(warehouse_id)
+    lock = timeline_locks.setdefault(warehouse_id, asyncio.Lock())
+    # Don't hold a pooled connection while queueing for the lock
+    await session.commit()
+    async with lock:
+        try:
+            await session.execute(select(Warehouse.id).where(Warehouse.id == warehouse_id).with_for_update())
+            bookings = await session.scalars(dock_scheduler.bookings_query(timeline, warehouse_id))
+            dock_scheduler.apply_bookings(timeline, bookings.all())
+            yield timeline
+        except Exception:
+            await session.rollback()
+            raise
+
+
+async def schedule_truck(truck_data):
+    async with Session() as session:
+        warehouse_id = await resolve_warehouse_id(session, truck_data.get('warehouse_id'))
+        if warehouse_id is None:
+            return {'status': 'no_warehouse_available'}
+
+        duration = await run_in_threadpool(dock_scheduler.predict_unload_time, truck_data, warehouse_id)
+        async with locked_timeline(session, warehouse_id) as timeline:
+            dock_number, scheduled_time = timeline.allocate(
+                datetime.now(), timedelta(minutes=duration), dock_scheduler.align_to_slot)
+            if dock_number is None:
+                await session.rollback()
+                return {'status': 'no_slot_available'}
+            row = dock_scheduler.booking_row(warehouse_id, truck_data, dock_number, scheduled_time, duration)
+            booking_id = await session.scalar(insert(DockSchedule).returning(DockSchedule.id), row)
+            await session.commit()
+            timeline.add(dock_number, scheduled_time,
+                         scheduled_time + timedelta(minutes=duration), booking_id)
+    return dock_scheduler.booking_result(row)
+
+
+async def schedule_batch(trucks, warehouse_id=None):
+    if not trucks:
+        return []
+    async with Session() as session:
+        warehouse_id = await resolve_warehouse_id(session, warehouse_id or trucks[0].get('warehouse_id'))
+        if warehouse_id is None:
+            return [{'status': 'no_warehouse_available'} for _ in trucks]
+
+        async with locked_timeline(session, warehouse_id) as timeline:
+            # Prediction and the assignment take ~100 ms for 200 trucks; only
+            # requests for this warehouse wait on the lock meanwhile
+            rows, placed = await run_in_threadpool(dock_scheduler.place_batch, timeline, trucks, warehouse_id)
+            try:
+                if rows:
+                    ids = (await session.scalars(
+                        insert(DockSchedule).returning(DockSchedule.id, sort_by_parameter_order=True),
+                        rows
+                    )).all()
+                    await session.commit()
+                    timeline.last_seen_id = max(timeline.last_seen_id, max(ids))
+            except Exception:
+                dock_scheduler.drop_timeline(warehouse_id)
+                raise
+    return dock_scheduler.batch_results(trucks, rows, placed)
+
+
+async def plan_deliveries(warehouse_id, stops=None, fleet=None, objective='distance',
+                          time_budget=2.0, save=True):
+    """RouteOptimizer.plan_deliveries with the planning done in the process pool"""
+    async with Session() as session:
+        warehouse = await session.get(Warehouse, warehouse_id)
+        if warehouse is None or warehouse.latitude is None or warehouse.longitude is None:
+            return {'error': 'Warehouse not found or has no coordinates'}
+        if stops is None:
+            stops = route_optimizer.stops_from_rows(await session.execute(route_optimizer.pending_query(warehouse_id)))
+        # Hand the connection back to the pool while the plan is computed
+        await session.commit()
+
+        plan = await asyncio.get_running_loop().run_in_executor(
+            cpu_pool, optimize_routes, (warehouse.latitude, warehouse.longitude), stops, fleet,
+            objective, time_budget)
+        updates, inserts = route_optimizer.plan_rows(plan, warehouse_id)
+        if save:
+            if updates:
+                await session.execute(update(DeliveryRoute), updates)
+            if inserts:
+                await session.execute(insert(DeliveryRoute), inserts)
+            await session.commit()
+    return plan
+
+
+def etag_matches(if_none_match, etag):
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or f'"{etag}"' in tags
+
+
+async def dashboard(request):
+    return templates.TemplateResponse(request, 'dashboard.html')
+
+
+async def api_dock_scheduler(request):
+    data = await request.json()
+    return JSONResponse(await schedule_truck(data))
+
+
+async def api_dock_scheduler_batch(request):
+    data = await request.json()
+    trucks = data['trucks'] if isinstance(data, dict) else data
+    warehouse_id = data.get('warehouse_id') if isinstance(data, dict) else None
+    results = await schedule_batch(trucks, warehouse_id)
+    return JSONResponse({
+        'scheduled': sum(1 for r in results if r['status'] == 'scheduled'),
+        'assignments': results
+    })
+
+
+async def api_heatmap(request):
+    body, etag = dock_scheduler.heatmap.render()
+    # Dashboards poll this; let them revalidate and get a 304 when unchanged
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if etag_matches(request.headers.get('if-none-match', ''), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+async def api_fulfillment_engine(request):
+    data = await request.json()
+    args = (data['customer_location'], data.get('order_items', []))
+    if traffic_blocks:
+        result = await run_in_threadpool(fulfillment_engine.select_optimal_warehouse, *args)
+    else:
+        result = fulfillment_engine.select_optimal_warehouse(*args)
+    return JSONResponse({
+        'warehouse': result['warehouse']['location'] if result['warehouse'] else None,
+        'estimated_delivery': result['estimated_delivery_time']
+    })
+
+
+async def api_fulfillment_engine_batch(request):
+    data = await request.json()
+    orders = data['orders'] if isinstance(data, dict) else data
+    results = fulfillment_engine.select_optimal_warehouses(orders)
+    # One JSON object per line, planned in a worker thread; a block of
+    # lines per hop keeps the thread handoffs cheap
+    lines = (json.dumps(result) + '\n' for result in results)
+    blocks = iter(lambda: ''.join(islice(lines, 500)), '')
+    return StreamingResponse(iterate_in_threadpool(blocks), media_type='application/x-ndjson')
+
+
+async def api_route_optimizer(request):
+    data = await request.json()
+    if data.get('warehouse_id') is None:
+        return JSONResponse({'error': 'warehouse_id is required'}, status_code=400)
+    try:
+        plan = await plan_deliveries(
+            data['warehouse_id'],
+            data.get('stops'),
+            fleet=data.get('fleet'),
+            objective=data.get('objective', 'distance'),
+            time_budget=float(data.get('time_budget', 2.0)),
+            save=data.get('save', True)
+        )
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    if 'error' in plan:
+        return JSONResponse(plan, status_code=404)
+    return JSONResponse(plan)
+
+
+async def api_carbon_calculator(request):
+    data = await request.json()
+    emissions = carbon_calculator.calculate_delivery_emissions(data)
+    suggestions = carbon_calculator.suggest_eco_friendly_options(data)
+    return JSONResponse({
+        'carbon_footprint': f"{emissions['emissions_kg_co2']} kg CO2",
+        'eco_friendly_options': len(suggestions) > 0,
+        'suggestions': suggestions
+    })
+
+
+async def api_carbon_report(request):
+    # Reads Parquet files, so off the loop; never touches delivery_route
+    try:
+        result = await run_in_threadpool(carbon_report.report, **carbon_report.report_args(request.query_params))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except FileNotFoundError as e:
+        return JSONResponse({'error': str(e)}, status_code=503)
+    return JSONResponse(result)
+
+
+async def customer_histories(user_datas):
+    """customer_id -> emotion summary for the known customers, cache misses in one read"""
+    summaries = recommendation_engine.emotion_summaries
+    found, missing = summaries.lookup([u['customer_id'] for u in user_datas if u.get('customer_id')])
+    if missing:
+        async with ReadSession() as session:
+            rows = (await session.execute(summaries.query(missing))).scalars().all()
+        found.update(summaries.store(rows, missing))
+    return found
+
+
+async def api_product_recommendation(request):
+    data = await request.json()
+    user_input = {'type': 'text', 'content': data.get('user_input', '')}
+    user_data = data.get('user_data', {})
+    histories = await customer_histories([user_data])
+    result = await recommendation_engine.recommend_products_async(
+        user_input, user_data, histories.get(str(user_data.get('customer_id'))))
+    return JSONResponse({
+        'recommendations': [prod['name'] for prod in result['recommendations']],
+        'emotion_detected': result['emotion_detected']
+    })
+
+
+async def api_product_recommendation_batch(request):
+    data = await request.json()
+    items = data['requests'] if isinstance(data, dict) else data
+    histories = await customer_histories([item.get('user_data', {}) for item in items])
+    # The batch fans out over the process pool; the thread only waits on it
+    results = await run_in_threadpool(recommendation_engine.recommend_products_batch, [
+        ({'type': 'text', 'content': item.get('user_input', '')}, item.get('user_data', {}))
+        for item in items
+    ], histories)
+    return JSONResponse({'results': [{
+        'recommendations': [prod['name'] for prod in result['recommendations']],
+        'emotion_detected': result['emotion_detected']
+    } for result in results]})
+
+
+async def api_db_pool_stats(request):
+    engines = {None: engine.sync_engine}
+    if read_engine is not engine:
+        engines[db_pool.READ_BIND] = read_engine.sync_engine
+    return JSONResponse(db_pool.pool_stats(engines))
+
+
+async def api_product_recommendation_cache_stats(request):
+    return JSONResponse(recommendation_engine.sentiment_cache.stats())
+
+
+async def metrics(request):
+    return Response(instrumentation.render_metrics(), headers={'Content-Type': instrumentation.CONTENT_TYPE})
+
+
+routes = [
+    Route('/', dashboard),
+    Route('/api/dock-scheduler', api_dock_scheduler, methods=['POST']),
+    Route('/api/dock-scheduler/batch', api_dock_scheduler_batch, methods=['POST']),
+    Route('/api/heatmap', api_heatmap, methods=['GET']),
+    Route('/api/fulfillment-engine', api_fulfillment_engine, methods=['POST']),
+    Route('/api/fulfillment-engine/batch', api_fulfillment_engine_batch, methods=['POST']),
+    Route('/api/route-optimizer', api_route_optimizer, methods=['POST']),
+    Route('/api/carbon-calculator', api_carbon_calculator, methods=['POST']),
+    Route('/api/carbon-report', api_carbon_report, methods=['GET']),
+    Route('/api/product-recommendation', api_product_recommendation, methods=['POST']),
+    Route('/api/product-recommendation/batch', api_product_recommendation_batch, methods=['POST']),
+    Route('/api/db-pool-stats', api_db_pool_stats, methods=['GET']),
+    Route('/api/product-recommendation/cache-stats', api_product_recommendation_cache_stats, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[Middleware(instrumentation.MetricsMiddleware, routes=routes),
+                Middleware(CORSMiddleware, allow_origins=['http://localhost:3000'],
+                           allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
@@ -0,0 +1,144 @@
+"""Backfill smartflow.delivery_route.carbon_emissions in fixed-size chunks.
+
+    python backfill_carbon.py [--chunk-size 10000] [--full] [--overlap-minutes 10]
+
+Rows are streamed through a server-side cursor, so memory stays flat no
+matter how large the table is. Each chunk is written back with one
+UPDATE ... FROM (VALUES ...) and committed together with the job's
+checkpoint, so a crashed run resumes after the last committed id.
+
+By default only rows with no emissions are filled in, along with rows
+whose distance or vehicle type may have been edited since the previous
+pass: those with an updated_at (see migrations/0006_carbon_rollups.sql)
+after that pass started, less --overlap-minutes for transactions still
+open then. Rows whose value does not change are not written, so the
+trigger that stamps updated_at does not send this run's own writes back
+to the next one. A full pass over every row runs on the first run, when
+--full is given, or when CarbonCalculator's emission factors have changed
+since the last run (those values are stale).
+"""
+import argparse
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+
+from psycopg2 import extras
+
+from carbon_calculator import CarbonCalculator
+from init_db import get_connection
+
+JOB_NAME = 'backfill_carbon'
+
+
+def factors_hash(calculator):
+    """Fingerprint of the factors the stored emissions were computed with"""
+    return hashlib.sha1(json.dumps(calculator.emission_factors, sort_keys=True).encode()).hexdigest()
+
+
+def load_checkpoint(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT last_id, state FROM smartflow.job_checkpoint WHERE job_name = %s", (JOB_NAME,))
+        row = cur.fetchone()
+    return (row[0], row[1] or {}) if row else None
+
+
+def save_checkpoint(cur, last_id, state):
+    cur.execute("""
+        INSERT INTO smartflow.job_checkpoint (job_name, last_id, state, updated_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (job_name) DO UPDATE
+        SET last_id = EXCLUDED.last_id, state = EXCLUDED.state, updated_at = EXCLUDED.updated_at
+    """, (JOB_NAME, last_id, extras.Json(state)))
+
+
+def backfill(chunk_size=10000, full=False, overlap_minutes=10):
+    calculator = CarbonCalculator()
+    current_hash = factors_hash(calculator)
+
+    writer = get_connection()
+    reader = get_connection()
+    try:
+        checkpoint = load_checkpoint(writer)
+        if checkpoint and not checkpoint[1].get('finished') and checkpoint[1].get('factors_hash') == current_hash \
+                and not full:
+            last_id, state = checkpoint
+            print(f"Resuming {'full' if state['full_pass'] else 'incremental'} pass after id {last_id}")
+        else:
+            full_pass = full or checkpoint is None or checkpoint[1].get('factors_hash') != current_hash
+            with writer.cursor() as cur:
+                cur.execute("SELECT LOCALTIMESTAMP")
+                pass_started = cur.fetchone()[0]
+            previous = None if full_pass else checkpoint[1].get('started_at')
+            since = (datetime.fromisoformat(previous) - timedelta(minutes=overlap_minutes)).isoformat() \
+                if previous else None
+            last_id, state = 0, {'factors_hash': current_hash, 'full_pass': full_pass, 'finished': False,
+                                 'started_at': pass_started.isoformat(), 'changed_since': since}
+            print(f"Starting {'full' if full_pass else 'incremental'} pass"
+                  + (f" (and rows changed since {since})" if since else ''))
+        with writer.cursor() as cur:
+            save_checkpoint(cur, last_id, state)
+        writer.commit()
+
+        query = """
+            SELECT id, distance_km, vehicle_type
+            FROM smartflow.delivery_route
+            WHERE id > %s AND distance_km IS NOT NULL
+        """
+        params = [last_id]
+        if not state['full_pass']:
+            if state.get('changed_since'):
+                query += " AND (carbon_emissions IS NULL OR updated_at > %s::timestamp)"
+                params.append(state['changed_since'])
+            else:
+                query += " AND carbon_emissions IS NULL"
+        query += " ORDER BY id"
+
+        # Named cursor = server-side; rows arrive chunk_size at a time
+        source = reader.cursor(name='carbon_backfill')
+        source.itersize = chunk_size
+        source.execute(query, params)
+
+        total, updated, started = 0, 0, time.monotonic()
+        while True:
+            rows = source.fetchmany(chunk_size)
+            if not rows:
+                break
+            ids = [r[0] for r in rows]
+            emissions = calculator.calculate_emissions_batch([r[1] for r in rows], [r[2] for r in rows])
+            values = list(zip(ids, emissions['emissions_kg_co2'].tolist()))
+
+            with writer.cursor() as cur:
+                extras.execute_values(cur, """
+                    UPDATE smartflow.delivery_route AS d
+                    SET carbon_emissions = v.emissions
+                    FROM (VALUES %s) AS v(id, emissions)
+                    WHERE d.id = v.id AND d.carbon_emissions IS DISTINCT FROM v.emissions
+                """, values, template='(%s::int, %s::float8)', page_size=chunk_size)
+                updated += cur.rowcount
+                save_checkpoint(cur, ids[-1], state)
+            writer.commit()
+
+            total += len(rows)
+            elapsed = time.monotonic() - started
+            print(f"  {total} rows rated, {updated} changed (last id {ids[-1]}, {total / elapsed:,.0f} rows/s)")
+
+        source.close()
+        reader.rollback()
+        state['finished'] = True
+        with writer.cursor() as cur:
+            save_checkpoint(cur, ids[-1] if total else last_id, state)
+        writer.commit()
+        print(f"Backfill complete: {total} rows rated, {updated} updated.")
+    finally:
+        reader.close()
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill delivery_route.carbon_emissions")
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--full', action='store_true', help="recompute every row, not just missing ones")
+    parser.add_argument('--overlap-minutes', type=float, default=10)
+    args = parser.parse_args()
+    backfill(args.chunk_size, args.full, args.overlap_minutes)
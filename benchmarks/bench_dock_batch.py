@@ -0,0 +1,65 @@
+"""Compare DockScheduler.schedule_batch with N sequential schedule_truck calls.
+
+    python -m benchmarks.bench_dock_batch --trucks 200 --repeat 3
+"""
+import argparse
+from datetime import datetime
+
+from benchmarks.common import load_app, timed
+from benchmarks.generators import make_trucks
+
+
+def total_completion_minutes(results, started):
+    """Sum over trucks of (finish time - time of request), in minutes"""
+    total = 0.0
+    for r in results:
+        if r['status'] == 'scheduled':
+            start = datetime.fromisoformat(r['scheduled_time'])
+            total += (start - started).total_seconds() / 60 + r['estimated_duration']
+    return total
+
+
+def reset(app_module, scheduler):
+    from models import DockSchedule
+    app_module.db.session.query(DockSchedule).delete()
+    app_module.db.session.commit()
+    scheduler.timelines.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trucks', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    from dock_scheduler import DockScheduler
+    from models import Warehouse
+
+    with app_module.app.app_context():
+        db = app_module.db
+        if not Warehouse.query.first():
+            db.session.add(Warehouse(name='Bench DC', location='Mumbai',
+                                     latitude=19.076, longitude=72.8777, capacity=1000))
+            db.session.commit()
+        scheduler = DockScheduler(db)
+
+        print(f"{'mode':<12}{'trucks':>8}{'seconds':>10}{'trucks/s':>10}{'sum completion (min)':>24}")
+        for run in range(args.repeat):
+            trucks = make_trucks(args.trucks, seed=run)
+
+            reset(app_module, scheduler)
+            started = datetime.now()
+            results, seconds = timed(lambda: [scheduler.schedule_truck(t) for t in trucks])
+            print(f"{'sequential':<12}{len(trucks):>8}{seconds:>10.3f}{len(trucks) / seconds:>10.0f}"
+                  f"{total_completion_minutes(results, started):>24.0f}")
+
+            reset(app_module, scheduler)
+            started = datetime.now()
+            results, seconds = timed(scheduler.schedule_batch, trucks)
+            print(f"{'batch':<12}{len(trucks):>8}{seconds:>10.3f}{len(trucks) / seconds:>10.0f}"
+                  f"{total_completion_minutes(results, started):>24.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Throughput of FulfillmentEngine.select_optimal_warehouses on a synthetic wave.
+
+    python -m benchmarks.bench_fulfillment_batch --orders 20000 --warehouses 200
+"""
+import argparse
+
+from benchmarks.common import load_app, timed
+from benchmarks.generators import make_orders, seed_network
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--warehouses', type=int, default=200)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--single', type=int, default=1000,
+                        help='orders to run through the one-at-a-time path for comparison')
+    args = parser.parse_args()
+
+    app_module = load_app()
+    from fulfillment_engine import FulfillmentEngine
+
+    with app_module.app.app_context():
+        seed_network(app_module.db, args.warehouses, args.products)
+        engine = FulfillmentEngine(app_module.db)
+        orders = make_orders(args.orders, args.products)
+        engine.warehouse_index.ensure_fresh()
+        engine.stock_index.ensure_fresh()
+
+        results, seconds = timed(lambda: list(engine.select_optimal_warehouses(orders)))
+        served = sum(1 for r in results if not r['unfulfilled_items'])
+        print(f"batch:  {len(orders)} orders in {seconds:.3f}s = {len(orders) / seconds:,.0f} orders/s "
+              f"({served} fully served)")
+
+        subset = orders[:args.single]
+        _, seconds = timed(lambda: [engine.select_optimal_warehouse(o['customer_location'], o['order_items'])
+                                    for o in subset])
+        print(f"single: {len(subset)} orders in {seconds:.3f}s = {len(subset) / seconds:,.0f} orders/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Tour quality against runtime for RouteOptimizer.
+
+    python -m benchmarks.bench_route_optimizer --stops 1000 --budgets 0 0.25 1 3
+
+For each objective and time budget, reports total km and kg CO2 after the
+sweep construction and after local search, and how long planning took.
+"""
+import argparse
+
+from benchmarks.common import load_app
+from benchmarks.generators import DEPOT, make_stops
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stops', type=int, default=1000)
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0, 0.25, 1, 3])
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    from route_optimizer import RouteOptimizer
+
+    optimizer = RouteOptimizer(app_module.db)
+    stops = make_stops(args.stops, args.seed)
+
+    print(f"{'objective':<11}{'budget s':>9}{'routes':>8}{'sweep km':>11}{'final km':>11}"
+          f"{'gain':>7}{'kg CO2':>9}{'runtime s':>11}")
+    for objective in ('distance', 'emissions'):
+        for budget in args.budgets:
+            plan = optimizer.optimize(DEPOT, stops, objective=objective, time_budget=budget)
+            gain = 1 - plan['total_distance_km'] / plan['construction_distance_km']
+            print(f"{objective:<11}{budget:>9.2f}{len(plan['routes']):>8}{plan['construction_distance_km']:>11.1f}"
+                  f"{plan['total_distance_km']:>11.1f}{gain:>7.1%}{plan['total_emissions_kg_co2']:>9.1f}"
+                  f"{plan['runtime_seconds']:>11.3f}")
+            if plan['unassigned']:
+                print(f"  {len(plan['unassigned'])} stops left unassigned")
+
+
+if __name__ == '__main__':
+    main()
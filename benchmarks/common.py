@@ -0,0 +1,54 @@
+"""Shared setup for the benchmark scripts.
+
+Benchmarks run against BENCH_DATABASE_URL when it is set (e.g. a local
+Postgres initialised with init_db.py). Otherwise they use a throwaway
+SQLite file with the `smartflow` schema attached, so they never touch the
+database configured in .env.
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def setup_database():
+    """Point DATABASE_URL at the benchmark database before the app is imported"""
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if url:
+        os.environ['DATABASE_URL'] = url
+        return url
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    workdir = tempfile.mkdtemp(prefix='smartflow-bench-')
+    schema_file = os.path.join(workdir, 'smartflow.db')
+
+    @event.listens_for(Engine, 'connect')
+    def attach_schema(dbapi_connection, connection_record):
+        if type(dbapi_connection).__module__.startswith('sqlite3'):
+            dbapi_connection.execute(f"ATTACH DATABASE '{schema_file}' AS smartflow")
+
+    url = 'sqlite:///' + os.path.join(workdir, 'main.db')
+    os.environ['DATABASE_URL'] = url
+    return url
+
+
+def load_app():
+    """Import the Flask app against the benchmark database and create its tables"""
+    setup_database()
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    return app_module
+
+
+def timed(fn, *args, **kwargs):
+    """Run fn once and return (result, seconds)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,63 @@
+"""Compare two benchmarks.suite result files.
+
+    python -m benchmarks.compare benchmarks/results/base-small.json benchmarks/results/head-small.json
+    python -m benchmarks.compare base.json head.json --metric p95_ms --threshold 0.15
+
+For every case in both files, prints the baseline and candidate values of
+`metric` and the relative change. A case regresses when it got slower by
+more than `threshold` (and by more than `--min-delta-ms`, so sub-microsecond
+jitter is not reported). Exits non-zero if anything regressed, so it can
+gate CI. Environment differences (scale, database, machine) are printed
+first, because they make the numbers incomparable.
+"""
+import argparse
+import json
+import sys
+
+COMPARED_ENVIRONMENT = ('scale', 'database', 'metrics_enabled', 'python', 'platform', 'cpus',
+                        'numpy', 'sqlalchemy', 'flask')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--metric', default='p50_ms', choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'min_ms'])
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown counted as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=0.001)
+    args = parser.parse_args()
+
+    base, cand = load(args.baseline), load(args.candidate)
+    for key in COMPARED_ENVIRONMENT:
+        if base['environment'].get(key) != cand['environment'].get(key):
+            print(f"warning: {key} differs: {base['environment'].get(key)} -> {cand['environment'].get(key)}")
+    print(f"baseline  {base['environment'].get('commit')}\ncandidate {cand['environment'].get('commit')}")
+
+    regressions = 0
+    print(f"{'case':<52}{'base ' + args.metric:>14}{'cand ' + args.metric:>14}{'change':>9}")
+    for name in sorted(set(base['results']) | set(cand['results'])):
+        if name not in base['results'] or name not in cand['results']:
+            print(f"{name:<52}{'only in ' + ('baseline' if name in base['results'] else 'candidate'):>37}")
+            continue
+        b, c = base['results'][name][args.metric], cand['results'][name][args.metric]
+        change = (c - b) / b if b else 0.0
+        mark = ''
+        if change > args.threshold and c - b > args.min_delta_ms:
+            mark = '  REGRESSION'
+            regressions += 1
+        elif change < -args.threshold and b - c > args.min_delta_ms:
+            mark = '  faster'
+        label = base['results'][name].get('kind', '') + ' ' + name
+        print(f"{label:<52}{b:>14.3f}{c:>14.3f}{change:>+9.1%}{mark}")
+
+    print(f"{regressions} regression(s) over {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Synthetic data for the benchmarks.
+
+Everything is seeded, so two runs at the same scale see the same rows and
+requests. Seeders bulk-insert through the Flask-SQLAlchemy session and must
+run inside an app context; the make_* helpers only build request payloads.
+"""
+import random
+
+import numpy as np
+
+DEPOT = (19.076, 72.8777)
+CITIES = ['Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Ahmedabad']
+CATEGORIES = ['electronics', 'games', 'books', 'sports', 'comfort_food', 'music', 'self_care', 'wellness',
+              'tea', 'aromatherapy', 'stress_relief', 'exercise', 'adventure_gear', 'fitness',
+              'essentials', 'home', 'clothing', 'food']
+# Quick-reply chips repeat; free text mostly does not
+PHRASES = ['love it', 'this is terrible', 'ok I guess', 'so stressed today', 'really excited!']
+WORDS = ['great', 'late', 'fine', 'broken', 'amazing', 'slow', 'perfect', 'awful', 'cheap', 'happy']
+
+# Row and request counts per --scale
+SCALES = {
+    'small': {'warehouses': 20, 'products': 500, 'catalog': 200, 'trucks': 200, 'orders': 1000,
+              'texts': 1000, 'stops': 200},
+    'medium': {'warehouses': 200, 'products': 2000, 'catalog': 2000, 'trucks': 1000, 'orders': 10000,
+               'texts': 5000, 'stops': 1000},
+    'large': {'warehouses': 1000, 'products': 20000, 'catalog': 20000, 'trucks': 5000, 'orders': 50000,
+              'texts': 20000, 'stops': 3000},
+}
+
+
+def seed_warehouses(db, n, seed=0):
+    """Warehouses spread over India; returns their ids"""
+    from sqlalchemy import insert
+    from models import Warehouse
+
+    rng = random.Random(seed)
+    db.session.execute(insert(Warehouse), [{
+        'name': f'DC-{i}', 'location': f'DC-{i}',
+        'latitude': rng.uniform(8.0, 32.0), 'longitude': rng.uniform(69.0, 89.0),
+        'capacity': 10000
+    } for i in range(n)])
+    db.session.commit()
+    return [w.id for w in Warehouse.query.order_by(Warehouse.id).all()]
+
+
+def seed_inventory(db, warehouse_ids, n_products, seed=0):
+    """Each warehouse stocks a random quarter of the SKUs"""
+    from sqlalchemy import insert
+    from models import InventoryItem
+
+    rng = random.Random(seed)
+    db.session.execute(insert(InventoryItem), [{
+        'warehouse_id': warehouse_id, 'product_id': f'SKU-{p}', 'product_name': f'Product {p}',
+        'quantity': rng.randint(0, 200)
+    } for warehouse_id in warehouse_ids for p in rng.sample(range(n_products), n_products // 4)])
+    db.session.commit()
+
+
+def seed_network(db, n_warehouses, n_products, seed=0):
+    """Warehouses plus a random stock table"""
+    warehouse_ids = seed_warehouses(db, n_warehouses, seed)
+    seed_inventory(db, warehouse_ids, n_products, seed)
+    return warehouse_ids
+
+
+def seed_catalog(db, n, seed=0):
+    """Rated products across every category the recommender maps emotions to"""
+    from sqlalchemy import insert
+    from models import Product
+
+    rng = random.Random(seed)
+    db.session.execute(insert(Product), [{
+        'name': f'Product {i}', 'category': CATEGORIES[i % len(CATEGORIES)],
+        'price': round(rng.uniform(5, 1500), 2), 'rating': round(rng.uniform(2.5, 5.0), 1)
+    } for i in range(n)])
+    db.session.commit()
+
+
+def seed_all(db, scale, seed=0):
+    """Everything the engines read, at one of SCALES; returns the warehouse ids"""
+    sizes = SCALES[scale]
+    warehouse_ids = seed_network(db, sizes['warehouses'], sizes['products'], seed)
+    seed_catalog(db, sizes['catalog'], seed)
+    return warehouse_ids
+
+
+def make_trucks(n, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'truck_id': f'TRK-{i:05d}',
+        'size': rng.choice(['small', 'medium', 'large']),
+        'cargo_type': rng.choice(['general', 'general', 'fragile'])
+    } for i in range(n)]
+
+
+def make_orders(n, n_products, seed=1):
+    rng = random.Random(seed)
+    return [{
+        'order_id': f'ORD-{i}',
+        'customer_location': (rng.uniform(8.0, 32.0), rng.uniform(69.0, 89.0)),
+        'order_items': [{'product_id': f'SKU-{rng.randrange(n_products)}', 'quantity': rng.randint(1, 3)}
+                        for _ in range(rng.randint(1, 4))]
+    } for i in range(n)]
+
+
+def make_texts(n, repeat_share=0.7, seed=2):
+    """Customer messages: `repeat_share` of them are quick-reply chips"""
+    rng = random.Random(seed)
+    return [rng.choice(PHRASES) if rng.random() < repeat_share else
+            f"order {rng.randrange(10 ** 6)} was {rng.choice(WORDS)} and {rng.choice(WORDS)}"
+            for _ in range(n)]
+
+
+def make_customers(n, seed=3):
+    """Request user_data; each customer_id comes back about four times"""
+    rng = random.Random(seed)
+    return [{'customer_id': f'CUST-{i % max(n // 4, 1):05d}', 'age': rng.randint(18, 70),
+             'location': rng.choice(CITIES), 'income_level': rng.choice(['low', 'middle', 'middle', 'high'])}
+            for i in range(n)]
+
+
+def make_deliveries(n, seed=4):
+    rng = random.Random(seed)
+    return [{'distance': rng.uniform(1, 50),
+             'vehicle_type': rng.choice(['truck', 'truck', 'electric_vehicle', 'bike', 'drone'])}
+            for _ in range(n)]
+
+
+def make_stops(n, seed=7, depot=DEPOT):
+    """Customers in a few dense neighbourhoods plus a scatter around the depot"""
+    rng = np.random.default_rng(seed)
+    centres = depot + rng.normal(0, 0.12, size=(8, 2))
+    clustered = centres[rng.integers(0, len(centres), size=n)] + rng.normal(0, 0.02, size=(n, 2))
+    scattered = depot + rng.normal(0, 0.15, size=(n, 2))
+    points = np.where(rng.random((n, 1)) < 0.7, clustered, scattered)
+    return [{'order_id': f'ORD-{i:05d}', 'lat': float(lat), 'lng': float(lng)}
+            for i, (lat, lng) in enumerate(points)]
@@ -0,0 +1,140 @@
+"""Concurrent load test of the /api/* endpoints, Flask against ASGI.
+
+    gunicorn -w 4 --threads 8 -b 127.0.0.1:5000 app:app
+    uvicorn asgi_app:app --workers 4 --port 8000
+    python -m benchmarks.load_test flask=http://127.0.0.1:5000 asgi=http://127.0.0.1:8000 \\
+        --concurrency 50 500 2000 --duration 15
+
+Both servers should point at the same seeded database. For each target and
+concurrency level, that many clients send a weighted mix of requests back
+to back for `duration` seconds; the report shows throughput, latency
+percentiles and errors (non-2xx responses, timeouts, refused connections).
+Run the client on a different machine from the servers when you can: a
+single client process tops out at a few thousand requests per second.
+"""
+import argparse
+import asyncio
+import random
+import ssl
+import time
+
+import httpx
+import numpy as np
+
+CITIES = ['Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune', 'Ahmedabad']
+# Quick-reply chips repeat; free text mostly does not
+PHRASES = ['love it', 'this is terrible', 'ok I guess', 'so stressed today', 'really excited!']
+
+
+def fulfillment(rng):
+    return 'POST', '/api/fulfillment-engine', {
+        'customer_location': (rng.uniform(8.0, 32.0), rng.uniform(69.0, 89.0)),
+        'order_items': [{'product_id': f'SKU-{rng.randrange(500)}', 'quantity': rng.randint(1, 3)}]
+    }
+
+
+def recommendation(rng):
+    if rng.random() < 0.7:
+        text = rng.choice(PHRASES)
+    else:
+        text = f"order {rng.randrange(10 ** 6)} was {rng.choice(['great', 'late', 'fine', 'broken'])}"
+    return 'POST', '/api/product-recommendation', {
+        'user_input': text,
+        'user_data': {'age': rng.randint(18, 70), 'location': rng.choice(CITIES)}
+    }
+
+
+def heatmap(rng):
+    return 'GET', '/api/heatmap', None
+
+
+def carbon(rng):
+    return 'POST', '/api/carbon-calculator', {
+        'distance': rng.uniform(1, 50), 'vehicle_type': rng.choice(['truck', 'electric_vehicle', 'bike'])
+    }
+
+
+def dock(rng):
+    return 'POST', '/api/dock-scheduler', {
+        'truck_id': f'LOAD-{rng.randrange(10 ** 6)}',
+        'size': rng.choice(['small', 'medium', 'large']),
+        'cargo_type': rng.choice(['general', 'fragile'])
+    }
+
+
+# (request builder, weight); dock bookings write to the database
+MIX = [(fulfillment, 40), (recommendation, 25), (heatmap, 15), (carbon, 10), (dock, 10)]
+
+
+async def client(url, timeout, builders, weights, deadline, seed, samples, tls):
+    rng = random.Random(seed)
+    # One connection per client: a single client with a big shared pool
+    # spends more CPU picking connections than the servers spend answering
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, verify=tls,
+                                 limits=httpx.Limits(max_connections=1)) as http:
+        while time.monotonic() < deadline:
+            method, path, body = rng.choices(builders, weights)[0](rng)
+            started = time.perf_counter()
+            try:
+                response = await http.request(method, path, json=body)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples.append((path, time.perf_counter() - started, ok))
+
+
+async def run(url, concurrency, duration, mix, timeout):
+    builders, weights = zip(*mix)
+    samples = []
+    # Building a TLS context per client costs ~40 ms; share one
+    tls = ssl.create_default_context()
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(url, timeout, builders, weights, deadline, seed, samples, tls)
+                           for seed in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def summarise(samples, elapsed):
+    latencies = np.array([seconds for _, seconds, _ in samples]) * 1000
+    errors = sum(1 for _, _, ok in samples if not ok)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / elapsed,
+        'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+        'max_ms': latencies.max() if len(latencies) else 0,
+        'errors': errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('targets', nargs='+', help='name=base_url, e.g. asgi=http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 500, 2000])
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--no-writes', action='store_true', help='leave dock bookings out of the mix')
+    parser.add_argument('--per-endpoint', action='store_true')
+    args = parser.parse_args()
+
+    mix = [(builder, weight) for builder, weight in MIX if not (args.no_writes and builder is dock)]
+    targets = [target.split('=', 1) for target in args.targets]
+
+    print(f"{'target':<10}{'clients':>8}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    for concurrency in args.concurrency:
+        for name, url in targets:
+            samples, elapsed = asyncio.run(run(url, concurrency, args.duration, mix, args.timeout))
+            s = summarise(samples, elapsed)
+            print(f"{name:<10}{concurrency:>8}{s['requests']:>10}{s['rps']:>9.0f}{s['p50_ms']:>9.1f}"
+                  f"{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.0f}{s['errors']:>8}")
+            if args.per_endpoint:
+                for path in sorted({path for path, _, _ in samples}):
+                    e = summarise([sample for sample in samples if sample[0] == path], elapsed)
+                    print(f"  {path:<36}{e['requests']:>10}{e['rps']:>9.0f}{e['p50_ms']:>9.1f}"
+                          f"{e['p95_ms']:>9.1f}{e['p99_ms']:>9.1f}{e['max_ms']:>9.0f}{e['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""Micro-benchmarks per engine method and end-to-end request benchmarks.
+
+    python -m benchmarks.suite --scale small
+    python -m benchmarks.suite --scale medium --only dock fulfillment --out before.json
+    python -m benchmarks.compare before.json benchmarks/results/<commit>-medium.json
+
+Seeds a fresh database with generators.SCALES[scale] rows (SQLite unless
+BENCH_DATABASE_URL is set; point that at an empty, throwaway database,
+since the dock cases delete every booking between repeats), then times
+every case. `micro` cases call the engine objects the Flask app holds;
+`e2e` cases go through the Flask test client, so routing, JSON and
+instrumentation are included. Each call
+is timed on its own after a warm-up pass; the report gives per-call
+percentiles and throughput. Results are written as JSON (by default to
+benchmarks/results/<commit>-<scale>.json) for benchmarks.compare.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.common import ROOT, load_app
+from benchmarks.generators import (DEPOT, SCALES, make_customers, make_deliveries, make_orders, make_stops,
+                                   make_texts, make_trucks, seed_all)
+
+# (kind, name, setup); setup(ctx) returns the case dict described in measure()
+CASES = []
+
+
+def case(kind, name):
+    def register(setup):
+        CASES.append((kind, name, setup))
+        return setup
+    return register
+
+
+class Context:
+    """Seeded app plus the request payloads every case draws from"""
+
+    def __init__(self, app_module, scale, calls):
+        self.app_module = app_module
+        self.db = app_module.db
+        self.client = app_module.app.test_client()
+        self.sizes = SCALES[scale]
+        self.calls = calls
+        self.warehouse_ids = seed_all(self.db, scale)
+        self.orders = make_orders(self.sizes['orders'], self.sizes['products'])
+        self.texts = make_texts(self.sizes['texts'])
+        self.customers = make_customers(self.sizes['texts'])
+        self.deliveries = make_deliveries(calls)
+        self.stops = make_stops(self.sizes['stops'])
+
+    def reset_docks(self):
+        from models import DockSchedule
+        self.db.session.query(DockSchedule).delete()
+        self.db.session.commit()
+        self.app_module.dock_scheduler.timelines.clear()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        response.get_data()  # drain streamed bodies
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}')
+        return response
+
+
+# -- micro: engine methods ---------------------------------------------------
+
+@case('micro', 'dock.schedule_truck')
+def dock_schedule_truck(ctx):
+    trucks = make_trucks(ctx.calls)
+    return {'call': ctx.app_module.dock_scheduler.schedule_truck, 'args': [(t,) for t in trucks],
+            'reset': ctx.reset_docks}
+
+
+@case('micro', 'dock.schedule_batch')
+def dock_schedule_batch(ctx):
+    trucks = make_trucks(ctx.sizes['trucks'])
+    return {'call': ctx.app_module.dock_scheduler.schedule_batch, 'args': [(trucks,)] * 3,
+            'reset': ctx.reset_docks, 'items': len(trucks)}
+
+
+@case('micro', 'dock.predict_unload_time')
+def dock_predict_unload_time(ctx):
+    trucks = make_trucks(ctx.calls)
+    return {'call': ctx.app_module.dock_scheduler.predict_unload_time, 'args': [(t,) for t in trucks]}
+
+
+@case('micro', 'dock.generate_heatmap_data')
+def dock_generate_heatmap_data(ctx):
+    return {'call': ctx.app_module.dock_scheduler.generate_heatmap_data, 'args': [()] * 20}
+
+
+@case('micro', 'fulfillment.select_optimal_warehouse')
+def fulfillment_select_optimal_warehouse(ctx):
+    return {'call': ctx.app_module.fulfillment_engine.select_optimal_warehouse,
+            'args': [(o['customer_location'], o['order_items']) for o in ctx.orders[:ctx.calls]]}
+
+
+@case('micro', 'fulfillment.select_optimal_warehouses')
+def fulfillment_select_optimal_warehouses(ctx):
+    engine = ctx.app_module.fulfillment_engine
+    return {'call': lambda orders: list(engine.select_optimal_warehouses(orders)),
+            'args': [(ctx.orders,)] * 3, 'items': len(ctx.orders)}
+
+
+@case('micro', 'carbon.calculate_delivery_emissions')
+def carbon_calculate_delivery_emissions(ctx):
+    return {'call': ctx.app_module.carbon_calculator.calculate_delivery_emissions,
+            'args': [(d,) for d in ctx.deliveries]}
+
+
+@case('micro', 'carbon.suggest_eco_friendly_options')
+def carbon_suggest_eco_friendly_options(ctx):
+    return {'call': ctx.app_module.carbon_calculator.suggest_eco_friendly_options,
+            'args': [(d,) for d in ctx.deliveries]}
+
+
+@case('micro', 'carbon.calculate_emissions_batch')
+def carbon_calculate_emissions_batch(ctx):
+    deliveries = make_deliveries(100000)
+    distances = np.array([d['distance'] for d in deliveries])
+    vehicles = np.array([d['vehicle_type'] for d in deliveries], dtype=object)
+    return {'call': ctx.app_module.carbon_calculator.calculate_emissions_batch,
+            'args': [(distances, vehicles)] * 5, 'items': len(deliveries)}
+
+
+@case('micro', 'recommendation.analyze_text_sentiment')
+def recommendation_analyze_text_sentiment(ctx):
+    engine = ctx.app_module.recommendation_engine
+    return {'call': engine.analyze_text_sentiment, 'args': [(t,) for t in ctx.texts[:ctx.calls]],
+            'reset': engine.sentiment_cache.clear}
+
+
+@case('micro', 'recommendation.recommend_products')
+def recommendation_recommend_products(ctx):
+    engine = ctx.app_module.recommendation_engine
+    return {'call': engine.recommend_products,
+            'args': [({'type': 'text', 'content': text}, user)
+                     for text, user in zip(ctx.texts[:ctx.calls], ctx.customers)],
+            'reset': engine.sentiment_cache.clear}
+
+
+@case('micro', 'recommendation.recommend_products_batch')
+def recommendation_recommend_products_batch(ctx):
+    engine = ctx.app_module.recommendation_engine
+    requests = [({'type': 'text', 'content': text}, user) for text, user in zip(ctx.texts, ctx.customers)]
+    return {'call': engine.recommend_products_batch, 'args': [(requests,)] * 3,
+            'reset': engine.sentiment_cache.clear, 'items': len(requests)}
+
+
+@case('micro', 'recommendation.sentiment_log.flush')
+def recommendation_sentiment_log_flush(ctx):
+    engine = ctx.app_module.recommendation_engine
+    engine.sentiment_log.bind(ctx.db.engine)
+    emotions = engine.analyze_text_sentiment_batch(ctx.texts)
+
+    def record_and_flush():
+        for user, emotion in zip(ctx.customers, emotions):
+            engine.sentiment_log.record(user['customer_id'], emotion)
+        return engine.sentiment_log.flush()
+    return {'call': record_and_flush, 'args': [()] * 5, 'items': len(emotions)}
+
+
+@case('micro', 'route.optimize')
+def route_optimize(ctx):
+    optimizer = ctx.app_module.route_optimizer
+    return {'call': lambda stops: optimizer.optimize(DEPOT, stops, time_budget=0.2),
+            'args': [(ctx.stops,)] * 3, 'items': len(ctx.stops)}
+
+
+@case('micro', 'instrumentation.span')
+def instrumentation_span(ctx):
+    from instrumentation import span
+
+    def spans(n):
+        for _ in range(n):
+            with span('bench'):
+                pass
+    return {'call': spans, 'args': [(10000,)] * 20, 'items': 10000}
+
+
+# -- e2e: requests through the Flask test client ----------------------------
+
+@case('e2e', 'POST /api/dock-scheduler')
+def e2e_dock_scheduler(ctx):
+    return {'call': ctx.request, 'reset': ctx.reset_docks,
+            'args': [('POST', '/api/dock-scheduler', t) for t in make_trucks(ctx.calls)]}
+
+
+@case('e2e', 'POST /api/dock-scheduler/batch')
+def e2e_dock_scheduler_batch(ctx):
+    trucks = make_trucks(ctx.sizes['trucks'])
+    return {'call': ctx.request, 'reset': ctx.reset_docks, 'items': len(trucks),
+            'args': [('POST', '/api/dock-scheduler/batch', {'trucks': trucks})] * 3}
+
+
+@case('e2e', 'GET /api/heatmap')
+def e2e_heatmap(ctx):
+    return {'call': ctx.request, 'args': [('GET', '/api/heatmap')] * ctx.calls}
+
+
+@case('e2e', 'POST /api/fulfillment-engine')
+def e2e_fulfillment_engine(ctx):
+    return {'call': ctx.request,
+            'args': [('POST', '/api/fulfillment-engine', o) for o in ctx.orders[:ctx.calls]]}
+
+
+@case('e2e', 'POST /api/fulfillment-engine/batch')
+def e2e_fulfillment_engine_batch(ctx):
+    return {'call': ctx.request, 'items': len(ctx.orders),
+            'args': [('POST', '/api/fulfillment-engine/batch', {'orders': ctx.orders})] * 3}
+
+
+@case('e2e', 'POST /api/route-optimizer')
+def e2e_route_optimizer(ctx):
+    from models import Warehouse
+    warehouse = ctx.db.session.get(Warehouse, ctx.warehouse_ids[0])
+    stops = make_stops(len(ctx.stops), depot=(warehouse.latitude, warehouse.longitude))
+    body = {'warehouse_id': warehouse.id, 'stops': stops, 'time_budget': 0.2, 'save': False}
+    return {'call': ctx.request, 'items': len(stops), 'args': [('POST', '/api/route-optimizer', body)] * 3}
+
+
+@case('e2e', 'POST /api/carbon-calculator')
+def e2e_carbon_calculator(ctx):
+    return {'call': ctx.request, 'args': [('POST', '/api/carbon-calculator', d) for d in ctx.deliveries]}
+
+
+@case('e2e', 'POST /api/product-recommendation')
+def e2e_product_recommendation(ctx):
+    return {'call': ctx.request, 'reset': ctx.app_module.recommendation_engine.sentiment_cache.clear,
+            'args': [('POST', '/api/product-recommendation', {'user_input': text, 'user_data': user})
+                     for text, user in zip(ctx.texts[:ctx.calls], ctx.customers)]}
+
+
+@case('e2e', 'POST /api/product-recommendation/batch')
+def e2e_product_recommendation_batch(ctx):
+    items = [{'user_input': text, 'user_data': user} for text, user in zip(ctx.texts, ctx.customers)]
+    return {'call': ctx.request, 'reset': ctx.app_module.recommendation_engine.sentiment_cache.clear,
+            'items': len(items), 'args': [('POST', '/api/product-recommendation/batch', {'requests': items})] * 3}
+
+
+def measure(bench, repeat, warmup):
+    """Time each call of a case.
+
+    A case is {'call', 'args'} plus optional 'reset' (run before the warm-up
+    and before every repeat, so each repeat sees the same state) and
+    'items' (units of work per call, for batch throughput).
+    """
+    call, args, reset = bench['call'], bench['args'], bench.get('reset')
+    if reset:
+        reset()
+    for a in args[:warmup]:
+        call(*a)
+    samples = []
+    for _ in range(repeat):
+        if reset:
+            reset()
+        for a in args:
+            started = time.perf_counter()
+            call(*a)
+            samples.append(time.perf_counter() - started)
+    return summarise(np.array(samples), bench.get('items', 1))
+
+
+def summarise(samples, items):
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    mean = samples.mean()
+    return {
+        'calls': len(samples), 'items_per_call': items,
+        'mean_ms': mean * 1000, 'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000, 'p99_ms': p99 * 1000,
+        'min_ms': samples.min() * 1000, 'stdev_ms': samples.std() * 1000,
+        'calls_per_second': 1 / mean, 'items_per_second': items / mean
+    }
+
+
+def git(*args):
+    try:
+        return subprocess.run(('git',) + args, cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dirty():
+    return bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def environment(url, args):
+    from importlib.metadata import version
+
+    import sqlalchemy
+    import instrumentation
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': dirty(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'scale': args.scale, 'repeat': args.repeat, 'calls': args.calls,
+        'database': url.split(':', 1)[0],
+        'metrics_enabled': instrumentation.ENABLED,
+        'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        'numpy': np.__version__, 'sqlalchemy': sqlalchemy.__version__, 'flask': version('flask')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--calls', type=int, default=200, help='calls per repeat for single-request cases')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=20, help='untimed calls before measuring')
+    parser.add_argument('--only', nargs='+', help='run cases whose name contains any of these')
+    parser.add_argument('--kind', choices=['micro', 'e2e'])
+    parser.add_argument('--out', help='JSON results path')
+    args = parser.parse_args()
+
+    app_module = load_app()
+    url = os.environ['DATABASE_URL']
+    cases = [(kind, name, setup) for kind, name, setup in CASES
+             if (not args.kind or kind == args.kind) and (not args.only or any(o in name for o in args.only))]
+
+    results = {}
+    with app_module.app.app_context():
+        ctx = Context(app_module, args.scale, args.calls)
+        print(f"{'case':<46}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'items/s':>12}")
+        for kind, name, setup in cases:
+            r = measure(setup(ctx), args.repeat, args.warmup)
+            results[name] = dict(r, kind=kind)
+            print(f"{kind + ' ' + name:<46}{r['calls']:>7}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+                  f"{r['p99_ms']:>10.3f}{r['items_per_second']:>12,.0f}")
+
+    out = args.out
+    if not out:
+        commit = (git('rev-parse', '--short', 'HEAD') or 'nogit') + ('-dirty' if dirty() else '')
+        out = os.path.join(ROOT, 'benchmarks', 'results', f'{commit}-{args.scale}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({'environment': environment(url, args), 'results': results}, f, indent=2, sort_keys=True)
+    print(f"wrote {out}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,41 @@
-import requests
-import json
+import numpy as np
+from instrumentation import timed
+
+# Up to this many values plain Python beats the NumPy and pandas call
+# overhead; the single-delivery methods call the batch code with one value
+SMALL_BATCH = 16
+
+
+def round_like_python(values, digits):
+    """round(value, digits) for every element of a float array.
+
+    np.round scales by 10**digits before rounding, and the error of that
+    multiplication makes it disagree with round() on about 1% of inputs
+    (421.9 * 0.05 gives 21.1 instead of 21.09). Here the product is kept
+    exactly as a double-double, so ties and near-ties round like round():
+    half to even, on the exact binary value.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size <= SMALL_BATCH:
+        return np.array([round(v, digits) for v in values.ravel().tolist()]).reshape(values.shape)
+    scale = 10.0 ** digits  # exact for the digit counts used here
+    product = values * scale
+    # Dekker's split: values * scale == product + error exactly
+    split = 134217729.0 * values
+    v_hi = split - (split - values)
+    v_lo = values - v_hi
+    split = 134217729.0 * scale
+    s_hi = split - (split - scale)
+    s_lo = scale - s_hi
+    error = ((v_hi * s_hi - product) + v_hi * s_lo + v_lo * s_hi) + v_lo * s_lo
+    nearest = np.rint(product)
+    fraction = product - nearest  # exact; within [-0.5, 0.5]
+    nearest += np.where((fraction == 0.5) & (error > 0), 1, 0)
+    nearest -= np.where((fraction == -0.5) & (error < 0), 1, 0)
+    result = nearest / scale
+    # Already integral at this scale (or not finite): round() returns the value as is
+    return np.where(np.isfinite(product) & (np.abs(product) < 2.0 ** 52), result, values)
+
 
 class CarbonCalculator:
     def __init__(self):
@@ -19,67 +55,133 @@ class CarbonCalculator:
             'drone': 20  # km per kWh
         }
     
+    def warm_up(self, load=True):
+        """Import pandas ahead of the first request"""
+        import pandas
+
+    def vehicle_codes(self, vehicle_type):
+        """Factorise vehicle types into (codes, per-code emission factor, fuel rate, is-electric)"""
+        vehicle_type = np.asarray(vehicle_type, dtype=object).ravel()
+        if len(vehicle_type) <= SMALL_BATCH:
+            positions = {}
+            codes = np.array([positions.setdefault(v, len(positions)) for v in vehicle_type.tolist()], dtype=np.intp)
+            uniques = list(positions)
+        else:
+            import pandas as pd
+            codes, uniques = pd.factorize(vehicle_type)
+        factors = np.array([self.emission_factors.get(v, 0.12) for v in uniques], dtype=float)
+        rates = np.array([self.fuel_consumption.get(v, 5.5) for v in uniques], dtype=float)
+        electric = np.array([v in ('electric_vehicle', 'drone') for v in uniques], dtype=bool)
+        return codes, factors, rates, electric
+
+    @timed
+    def calculate_emissions_batch(self, distance_km, vehicle_type):
+        """Emissions, fuel and best greener vehicle for whole route tables.
+
+        Takes equal-length arrays (or pandas columns) of distances and vehicle
+        types and returns a dict of NumPy arrays, one entry per row.
+        best_alternative is None where no other vehicle emits less.
+        """
+        distance = np.asarray(distance_km, dtype=float).ravel()
+        codes, factors, rates, electric = self.vehicle_codes(vehicle_type)
+        emissions = distance * factors[codes]
+        fuel = distance / rates[codes]
+
+        vehicles = list(self.emission_factors)
+        all_factors = np.array([self.emission_factors[v] for v in vehicles])
+        greenest = int(np.argmin(all_factors))
+        savings = emissions - distance * all_factors[greenest]
+        has_alternative = savings > 0
+        best = np.where(has_alternative, vehicles[greenest], None)
+
+        return {
+            'emissions_kg_co2': round_like_python(emissions, 2),
+            'fuel_consumption': round_like_python(fuel, 2),
+            'fuel_unit': np.where(electric[codes], 'kWh', 'liters'),
+            'best_alternative': best,
+            'best_alternative_emissions_kg_co2': np.where(
+                has_alternative, round_like_python(distance * all_factors[greenest], 2), np.nan),
+            'savings_kg_co2': np.where(has_alternative, round_like_python(savings, 2), 0.0)
+        }
+
+    @timed
+    def eco_friendly_options_batch(self, distance_km, vehicle_type):
+        """Per-row emissions, savings and reduction for every vehicle type.
+
+        Returns (vehicles, emissions, savings, percentage_reduction, better);
+        the matrices have one row per route and one column per vehicle, and
+        better is True where switching to that vehicle would save emissions.
+        Values are rounded like suggest_eco_friendly_options rounds them.
+        """
+        distance = np.asarray(distance_km, dtype=float).ravel()
+        codes, factors, _, _ = self.vehicle_codes(vehicle_type)
+        vehicles = list(self.emission_factors)
+        all_factors = np.array([self.emission_factors[v] for v in vehicles])
+
+        current = (distance * factors[codes])[:, None]
+        emissions = distance[:, None] * all_factors[None, :]
+        savings = current - emissions
+        percentage = np.divide(savings, current, out=np.zeros_like(savings), where=current > 0) * 100
+        return (vehicles, round_like_python(emissions, 2), round_like_python(savings, 2),
+                round_like_python(percentage, 1), savings > 0)
+
+    @timed
     def calculate_delivery_emissions(self, delivery_data):
         """Calculate CO2 emissions for delivery"""
         distance = delivery_data.get('distance', 0)
         vehicle_type = delivery_data.get('vehicle_type', 'truck')
-        
-        # Calculate emissions
-        emission_factor = self.emission_factors.get(vehicle_type, 0.12)
-        total_emissions = distance * emission_factor
+        batch = self.calculate_emissions_batch([distance], [vehicle_type])
         
         return {
             'distance': distance,
             'vehicle_type': vehicle_type,
-            'emissions_kg_co2': round(total_emissions, 2),
-            'fuel_consumption': self.calculate_fuel_consumption(distance, vehicle_type)
+            'emissions_kg_co2': float(batch['emissions_kg_co2'][0]),
+            'fuel_consumption': f"{float(batch['fuel_consumption'][0])} {batch['fuel_unit'][0]}"
         }
     
     def calculate_fuel_consumption(self, distance, vehicle_type):
         """Calculate fuel consumption"""
-        consumption_rate = self.fuel_consumption.get(vehicle_type, 5.5)
-        
-        if vehicle_type in ['electric_vehicle', 'drone']:
-            return f"{round(distance / consumption_rate, 2)} kWh"
-        else:
-            return f"{round(distance / consumption_rate, 2)} liters"
+        return self.calculate_delivery_emissions(
+            {'distance': distance, 'vehicle_type': vehicle_type})['fuel_consumption']
     
+    @timed
     def suggest_eco_friendly_options(self, delivery_data):
         """Suggest eco-friendly delivery alternatives"""
         distance = delivery_data.get('distance', 0)
         current_vehicle = delivery_data.get('vehicle_type', 'truck')
+        vehicles, emissions, savings, percentage, better = self.eco_friendly_options_batch(
+            [distance], [current_vehicle])
         
-        suggestions = []
-        
-        for vehicle, factor in self.emission_factors.items():
-            if vehicle != current_vehicle:
-                emissions = distance * factor
-                savings = (distance * self.emission_factors[current_vehicle]) - emissions
-                
-                if savings > 0:
-                    suggestions.append({
-                        'vehicle_type': vehicle,
-                        'emissions_kg_co2': round(emissions, 2),
-                        'savings_kg_co2': round(savings, 2),
-                        'percentage_reduction': round((savings / (distance * self.emission_factors[current_vehicle])) * 100, 1)
-                    })
+        suggestions = [{
+            'vehicle_type': vehicle,
+            'emissions_kg_co2': float(emissions[0, i]),
+            'savings_kg_co2': float(savings[0, i]),
+            'percentage_reduction': float(percentage[0, i])
+        } for i, vehicle in enumerate(vehicles) if vehicle != current_vehicle and better[0, i]]
         
         return sorted(suggestions, key=lambda x: x['savings_kg_co2'], reverse=True)
     
     def calculate_carbon_offset_cost(self, emissions_kg):
-        """Calculate cost to offset carbon emissions"""
+        """Calculate cost to offset carbon emissions (a number, or an array of them)"""
         # Average cost of carbon offset: $15-25 per ton
         cost_per_kg = 0.02  # $0.02 per kg
-        return round(emissions_kg * cost_per_kg, 2)
+        return self.rounded(np.asarray(emissions_kg, dtype=float) * cost_per_kg, 2)
     
     def get_environmental_impact(self, emissions_kg):
-        """Convert emissions to relatable environmental impact"""
+        """Convert emissions to relatable environmental impact (a number, or an array of them)"""
+        emissions_kg = np.asarray(emissions_kg, dtype=float)
         # Conversion factors
         trees_needed = emissions_kg / 21  # 1 tree absorbs ~21 kg CO2 per year
         km_by_car = emissions_kg / 0.12  # Average car emissions
         
         return {
-            'trees_needed_per_year': round(trees_needed, 1),
-            'equivalent_km_by_car': round(km_by_car, 1),
-            'phones_charged': round(emissions_kg / 0.008, 0)  # 8g CO2 per phone charge
+            'trees_needed_per_year': self.rounded(trees_needed, 1),
+            'equivalent_km_by_car': self.rounded(km_by_car, 1),
+            'phones_charged': self.rounded(emissions_kg / 0.008, 0)  # 8g CO2 per phone charge
         }
+
+    def rounded(self, values, digits):
+        """round() for a single number, round_like_python for an array"""
+        if values.ndim == 0:
+            return round(float(values), digits)
+        return round_like_python(values, digits)
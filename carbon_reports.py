@@ -0,0 +1,206 @@
+"""Carbon reporting from columnar snapshots of the daily rollups.
+
+carbon_rollup.py keeps smartflow.carbon_daily_rollup current and writes it
+out as Parquet, one hive-style partition per month:
+
+    <CARBON_SNAPSHOT_DIR>/month=2026-10/part-0.parquet
+    <CARBON_SNAPSHOT_DIR>/_snapshot.json        (written last; readers key off it)
+
+Rows are sorted by day, so a date range skips whole months by partition and
+row groups by their min/max statistics, and warehouse or vehicle filters
+are evaluated inside the scan. CarbonReport answers the report API from
+these files alone; delivery_route is never read.
+
+pyarrow is imported on first use (see startup.py).
+"""
+import json
+import os
+import threading
+import time
+from datetime import date
+
+import numpy as np
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts', 'carbon_rollups')
+MANIFEST = '_snapshot.json'
+MEASURES = ('deliveries', 'distance_km', 'emissions_kg', 'unrated')
+GROUPINGS = {'day': ('day',), 'month': ('month',), 'warehouse': ('warehouse_id',),
+             'vehicle_type': ('vehicle_type',), 'warehouse_vehicle': ('warehouse_id', 'vehicle_type')}
+ROW_GROUP_SIZE = 50000
+
+
+def snapshot_dir():
+    return os.environ.get('CARBON_SNAPSHOT_DIR', DEFAULT_DIR)
+
+
+def month_key(day):
+    return day.strftime('%Y-%m')
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([('day', pa.date32()), ('warehouse_id', pa.int32()), ('vehicle_type', pa.string()),
+                      ('deliveries', pa.int64()), ('distance_km', pa.float64()),
+                      ('emissions_kg', pa.float64()), ('unrated', pa.int64())])
+
+
+def write_month(directory, month, rows):
+    """Replace one month's partition with `rows` ((day, warehouse_id, vehicle_type, *MEASURES),
+    sorted by day); no rows removes it. Readers see the old file or the new one."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    partition = os.path.join(directory, f'month={month}')
+    path = os.path.join(partition, 'part-0.parquet')
+    if not rows:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    os.makedirs(partition, exist_ok=True)
+    columns = list(zip(*rows))
+    table = pa.Table.from_arrays([pa.array(values, type=field.type)
+                                  for values, field in zip(columns, arrow_schema())], schema=arrow_schema())
+    # Dot-prefixed, so a dataset scan never picks up a half-written file
+    tmp = os.path.join(partition, f'.part-0.parquet.{os.getpid()}.tmp')
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE, compression='zstd',
+                   use_dictionary=['vehicle_type'], write_statistics=True)
+    os.replace(tmp, path)
+    return len(rows)
+
+
+def write_manifest(directory, manifest):
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f'.{MANIFEST}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+
+class CarbonReport:
+    """Totals, offsets and trees-equivalent over the Parquet snapshot.
+
+    The snapshot's manifest is re-checked at most every `check_interval`
+    seconds and the dataset reopened when it changed.
+    """
+
+    def __init__(self, calculator, directory=None, check_interval=30):
+        self.calculator = calculator
+        self.directory = directory or snapshot_dir()
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.dataset = None
+        self.manifest = None
+        self.mtime = None
+        self.checked_at = None
+
+    def warm_up(self, load=True):
+        """Import pyarrow and, with `load`, open the snapshot"""
+        import pyarrow.dataset
+        if load:
+            try:
+                self.current()
+            except FileNotFoundError:
+                pass
+
+    def report_args(self, args):
+        """report() keyword arguments from query-string values (ValueError when malformed)"""
+        return {
+            'start': date.fromisoformat(args['start']) if args.get('start') else None,
+            'end': date.fromisoformat(args['end']) if args.get('end') else None,
+            'warehouse_id': int(args['warehouse_id']) if args.get('warehouse_id') else None,
+            'vehicle_type': args.get('vehicle_type') or None,
+            'group_by': args.get('group_by') or None,
+        }
+
+    def current(self):
+        """(dataset, manifest); FileNotFoundError before the first snapshot"""
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= self.check_interval:
+            with self.lock:
+                if self.checked_at is None or now - self.checked_at >= self.check_interval:
+                    self.reopen()
+                    self.checked_at = now
+        if self.dataset is None:
+            raise FileNotFoundError(f"No carbon snapshot in {self.directory}; run carbon_rollup.py")
+        return self.dataset, self.manifest
+
+    def reopen(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        try:
+            mtime = os.stat(os.path.join(self.directory, MANIFEST)).st_mtime_ns
+        except OSError:
+            self.dataset = self.manifest = self.mtime = None
+            return
+        if mtime != self.mtime:
+            self.manifest = read_manifest(self.directory)
+            self.dataset = ds.dataset(self.directory, format='parquet', schema=arrow_schema().append(
+                pa.field('month', pa.string())), partitioning=ds.partitioning(
+                pa.schema([('month', pa.string())]), flavor='hive'))
+            self.mtime = mtime
+
+    def filter(self, start=None, end=None, warehouse_id=None, vehicle_type=None):
+        """Scan predicate: the month bounds prune partitions, the day bounds row groups"""
+        import pyarrow.dataset as ds
+
+        conditions = []
+        if start is not None:
+            conditions += [ds.field('month') >= month_key(start), ds.field('day') >= start]
+        if end is not None:
+            conditions += [ds.field('month') <= month_key(end), ds.field('day') <= end]
+        if warehouse_id is not None:
+            conditions.append(ds.field('warehouse_id') == int(warehouse_id))
+        if vehicle_type:
+            conditions.append(ds.field('vehicle_type') == vehicle_type)
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def metrics(self, deliveries, distance, emissions, unrated):
+        """Report fields for equal-length arrays of totals (one entry per group)"""
+        offset = self.calculator.calculate_carbon_offset_cost(emissions)
+        impact = self.calculator.get_environmental_impact(emissions)
+        return [{
+            'deliveries': int(deliveries[i]),
+            'distance_km': round(float(distance[i]), 2),
+            'emissions_kg_co2': round(float(emissions[i]), 2),
+            'unrated_deliveries': int(unrated[i]),
+            'offset_cost_usd': float(offset[i]),
+            'environmental_impact': {key: float(values[i]) for key, values in impact.items()},
+        } for i in range(len(emissions))]
+
+    def report(self, start=None, end=None, warehouse_id=None, vehicle_type=None, group_by=None):
+        """Totals for the filtered days and, with `group_by` (see GROUPINGS), one entry per group"""
+        if group_by is not None and group_by not in GROUPINGS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+        if start is not None and end is not None and start > end:
+            raise ValueError("start is after end")
+        dataset, manifest = self.current()
+        keys = GROUPINGS[group_by] if group_by else ()
+        table = dataset.to_table(columns=list(dict.fromkeys(keys + MEASURES)),
+                                 filter=self.filter(start, end, warehouse_id, vehicle_type))
+
+        totals = [np.array([table[m].to_numpy().sum()]) for m in MEASURES]
+        result = {
+            'filters': {'start': start.isoformat() if start else None, 'end': end.isoformat() if end else None,
+                        'warehouse_id': warehouse_id, 'vehicle_type': vehicle_type},
+            'snapshot': {'generated_at': manifest.get('generated_at'), 'rows': table.num_rows},
+            'totals': self.metrics(*totals)[0],
+        }
+        if keys:
+            grouped = table.group_by(list(keys)).aggregate([(m, 'sum') for m in MEASURES]).sort_by(
+                [(key, 'ascending') for key in keys])
+            groups = self.metrics(*(grouped[f'{m}_sum'].to_numpy() for m in MEASURES))
+            for key in keys:
+                for entry, value in zip(groups, grouped[key].to_pylist()):
+                    entry[key] = value.isoformat() if isinstance(value, date) else value
+            result['groups'] = groups
+        return result
@@ -0,0 +1,153 @@
+"""Maintain smartflow.carbon_daily_rollup and its Parquet snapshot.
+
+    python carbon_rollup.py [--full] [--overlap-minutes 10] [--snapshot-dir artifacts/carbon_rollups]
+
+Run it from cron (e.g. every few minutes). Only the days that have
+delivery_route rows created or updated since the previous run (updated_at,
+see migrations/0006_carbon_rollups.sql) are re-aggregated. Each of those
+days is replaced in the rollup table, in one transaction together with the
+job checkpoint. The months those days fall in are then rewritten as Parquet
+partitions (see carbon_reports.py), which the report API reads. The first
+run, or --full, rebuilds every day and every month; deleted routes are only
+dropped from the totals by --full.
+
+The watermark is the database time the previous run started, less
+--overlap-minutes for transactions still open at that moment; recomputing
+a day twice is harmless. Months whose export failed are kept in the
+checkpoint and written by the next run.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from psycopg2 import extras
+
+from carbon_reports import month_key, read_manifest, snapshot_dir, write_manifest, write_month
+from init_db import get_connection
+
+JOB_NAME = 'carbon_rollup'
+
+ROLLUP_SQL = """
+    INSERT INTO smartflow.carbon_daily_rollup
+        (day, warehouse_id, vehicle_type, deliveries, distance_km, emissions_kg, unrated)
+    SELECT created_at::date, COALESCE(source_warehouse_id, 0), vehicle_type, count(*),
+           COALESCE(sum(distance_km), 0), COALESCE(sum(carbon_emissions), 0),
+           count(*) FILTER (WHERE carbon_emissions IS NULL)
+    FROM smartflow.delivery_route
+    {where}
+    GROUP BY 1, 2, 3
+"""
+
+
+def load_checkpoint(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT state FROM smartflow.job_checkpoint WHERE job_name = %s", (JOB_NAME,))
+        row = cur.fetchone()
+    return (row[0] or {}) if row else None
+
+
+def save_checkpoint(cur, state):
+    cur.execute("""
+        INSERT INTO smartflow.job_checkpoint (job_name, last_id, state, updated_at)
+        VALUES (%s, 0, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (job_name) DO UPDATE SET state = EXCLUDED.state, updated_at = EXCLUDED.updated_at
+    """, (JOB_NAME, extras.Json(state)))
+
+
+def month_bounds(month):
+    first = datetime.strptime(month, '%Y-%m').date()
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+
+def refresh_rollup(cur, since):
+    """Recompute the days touched since `since` (every day when None); returns those days"""
+    if since is None:
+        cur.execute("DELETE FROM smartflow.carbon_daily_rollup")
+        cur.execute(ROLLUP_SQL.format(where=''))
+        cur.execute("SELECT DISTINCT day FROM smartflow.carbon_daily_rollup")
+        return sorted(row[0] for row in cur.fetchall())
+
+    cur.execute("""
+        SELECT DISTINCT created_at::date FROM smartflow.delivery_route WHERE updated_at > %s::timestamp
+    """, (since,))
+    days = sorted(row[0] for row in cur.fetchall())
+    if days:
+        cur.execute("DELETE FROM smartflow.carbon_daily_rollup WHERE day = ANY(%s)", (days,))
+        # The range lets the planner use delivery_route_created_at_idx
+        cur.execute(ROLLUP_SQL.format(where="""
+            WHERE created_at >= %(first)s AND created_at < %(last)s::date + 1 AND created_at::date = ANY(%(days)s)
+        """), {'first': days[0], 'last': days[-1], 'days': days})
+    return days
+
+
+def export_months(conn, directory, months, full=False):
+    """Rewrite the Parquet partitions of `months` and the manifest; returns rows written"""
+    try:
+        manifest = read_manifest(directory)
+    except FileNotFoundError:
+        manifest = {'months': {}}
+    if full:
+        months = sorted(set(months) | set(manifest['months']))
+    written = 0
+    with conn.cursor() as cur:
+        for month in months:
+            first, after = month_bounds(month)
+            cur.execute("""
+                SELECT day, warehouse_id, vehicle_type, deliveries, distance_km, emissions_kg, unrated
+                FROM smartflow.carbon_daily_rollup
+                WHERE day >= %s AND day < %s
+                ORDER BY day, warehouse_id, vehicle_type
+            """, (first, after))
+            rows = write_month(directory, month, cur.fetchall())
+            if rows:
+                manifest['months'][month] = rows
+            else:
+                manifest['months'].pop(month, None)
+            written += rows
+    conn.rollback()
+    manifest['generated_at'] = datetime.now().isoformat(timespec='seconds')
+    write_manifest(directory, manifest)
+    return written
+
+
+def run(directory, full=False, overlap_minutes=10):
+    conn = get_connection()
+    started = time.monotonic()
+    try:
+        state = load_checkpoint(conn)
+        full = full or not state or not state.get('watermark')
+        state = state or {}
+        with conn.cursor() as cur:
+            cur.execute("SELECT LOCALTIMESTAMP")
+            run_started = cur.fetchone()[0]
+            since = None if full else (datetime.fromisoformat(state['watermark'])
+                                       - timedelta(minutes=overlap_minutes)).isoformat()
+            days = refresh_rollup(cur, since)
+            months = sorted({month_key(day) for day in days} | set(state.get('unexported', [])))
+            state = {'watermark': run_started.isoformat(), 'unexported': months,
+                     'full_export': full or state.get('full_export', False)}
+            save_checkpoint(cur, state)
+        conn.commit()
+        print(f"{'Rebuilt' if full else 'Refreshed'} {len(days)} day(s) of carbon rollups "
+              f"({time.monotonic() - started:.1f}s)")
+
+        if not months:
+            return
+        rows = export_months(conn, directory, months, state['full_export'])
+        state.update(unexported=[], full_export=False)
+        with conn.cursor() as cur:
+            save_checkpoint(cur, state)
+        conn.commit()
+        print(f"Wrote {len(months)} month partition(s), {rows} rows, to {directory} "
+              f"({time.monotonic() - started:.1f}s)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the daily carbon rollups and their Parquet snapshot")
+    parser.add_argument('--full', action='store_true', help="rebuild every day and month")
+    parser.add_argument('--overlap-minutes', type=float, default=10)
+    parser.add_argument('--snapshot-dir', default=snapshot_dir())
+    args = parser.parse_args()
+    run(args.snapshot_dir, args.full, args.overlap_minutes)
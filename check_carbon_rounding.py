@@ -0,0 +1,115 @@
+"""Check that CarbonCalculator's scalar and batch paths return the original numbers.
+
+    python check_carbon_rounding.py [--rows 20000] [--seed 0]
+
+Compares calculate_delivery_emissions, suggest_eco_friendly_options, the
+offset and impact helpers (scalar and array input), calculate_emissions_batch
+and eco_friendly_options_batch with the original per-delivery formulas, on
+random distances (realistic ones, exact half-cent ties and large values).
+Exits non-zero on any difference.
+"""
+import argparse
+import random
+import sys
+
+import numpy as np
+
+from carbon_calculator import CarbonCalculator
+
+VEHICLES = ['truck', 'bike', 'electric_vehicle', 'drone']
+
+
+def reference_emissions(calculator, distance, vehicle_type):
+    emissions = distance * calculator.emission_factors.get(vehicle_type, 0.12)
+    rate = calculator.fuel_consumption.get(vehicle_type, 5.5)
+    unit = 'kWh' if vehicle_type in ['electric_vehicle', 'drone'] else 'liters'
+    return round(emissions, 2), f"{round(distance / rate, 2)} {unit}"
+
+
+def reference_suggestions(calculator, distance, current_vehicle):
+    current = distance * calculator.emission_factors.get(current_vehicle, 0.12)
+    suggestions = []
+    for vehicle, factor in calculator.emission_factors.items():
+        if vehicle != current_vehicle:
+            emissions = distance * factor
+            savings = current - emissions
+            if savings > 0:
+                suggestions.append({
+                    'vehicle_type': vehicle,
+                    'emissions_kg_co2': round(emissions, 2),
+                    'savings_kg_co2': round(savings, 2),
+                    'percentage_reduction': round((savings / current) * 100, 1)
+                })
+    return sorted(suggestions, key=lambda x: x['savings_kg_co2'], reverse=True)
+
+
+def reference_impact(emissions_kg):
+    return {
+        'trees_needed_per_year': round(emissions_kg / 21, 1),
+        'equivalent_km_by_car': round(emissions_kg / 0.12, 1),
+        'phones_charged': round(emissions_kg / 0.008, 0)
+    }
+
+
+def distances(rows, seed):
+    rng = random.Random(seed)
+    values = [round(rng.uniform(0.5, 800), 1) for _ in range(rows // 2)]
+    values += [rng.uniform(0, 2000) for _ in range(rows // 4)]
+    values += [rng.randint(0, 40000) / 8 for _ in range(rows // 8)]  # ties after scaling
+    values += [rng.uniform(1e6, 1e12) for _ in range(rows - len(values))]
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    calculator = CarbonCalculator()
+    rng = random.Random(args.seed)
+    distance = distances(args.rows, args.seed)
+    vehicle = [rng.choice(VEHICLES) for _ in distance]
+    failures = []
+
+    batch = calculator.calculate_emissions_batch(distance, vehicle)
+    vehicles, emissions, savings, percentage, better = calculator.eco_friendly_options_batch(distance, vehicle)
+    offsets = calculator.calculate_carbon_offset_cost(np.array(distance))
+    impacts = calculator.get_environmental_impact(np.array(distance))
+    for i, (d, v) in enumerate(zip(distance, vehicle)):
+        expected_emissions, expected_fuel = reference_emissions(calculator, d, v)
+        scalar = calculator.calculate_delivery_emissions({'distance': d, 'vehicle_type': v})
+        if (scalar['emissions_kg_co2'], scalar['fuel_consumption']) != (expected_emissions, expected_fuel):
+            failures.append(('calculate_delivery_emissions', d, v, scalar))
+        if (float(batch['emissions_kg_co2'][i]), f"{float(batch['fuel_consumption'][i])} {batch['fuel_unit'][i]}") \
+                != (expected_emissions, expected_fuel):
+            failures.append(('calculate_emissions_batch', d, v, batch['emissions_kg_co2'][i]))
+
+        expected = reference_suggestions(calculator, d, v)
+        if calculator.suggest_eco_friendly_options({'distance': d, 'vehicle_type': v}) != expected:
+            failures.append(('suggest_eco_friendly_options', d, v, None))
+        from_batch = sorted(({
+            'vehicle_type': name,
+            'emissions_kg_co2': float(emissions[i, j]),
+            'savings_kg_co2': float(savings[i, j]),
+            'percentage_reduction': float(percentage[i, j])
+        } for j, name in enumerate(vehicles) if name != v and better[i, j]),
+            key=lambda x: x['savings_kg_co2'], reverse=True)
+        if from_batch != expected:
+            failures.append(('eco_friendly_options_batch', d, v, None))
+
+        if calculator.calculate_carbon_offset_cost(d) != round(d * 0.02, 2) or float(offsets[i]) != round(d * 0.02, 2):
+            failures.append(('calculate_carbon_offset_cost', d, v, None))
+        expected = reference_impact(d)
+        if calculator.get_environmental_impact(d) != expected \
+                or {key: float(values[i]) for key, values in impacts.items()} != expected:
+            failures.append(('get_environmental_impact', d, v, None))
+
+    for name, d, v, got in failures[:20]:
+        print(f"FAIL {name}: distance={d!r} vehicle_type={v} got={got!r}")
+    print(f"{len(distance)} inputs, {len(failures)} mismatches")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Import-time report and regression check for the Flask app.
+
+    python check_import_time.py [--mode lazy] [--budget-ms 1000] [--top 15]
+
+Imports `app` in a fresh interpreter under `python -X importtime` with the
+given STARTUP_MODE and prints the slowest top-level packages (self time
+summed over their submodules) and the total. In lazy and background modes
+none of the heavy dependencies may be imported at startup. Exits non-zero
+when one is, or when the total goes over the budget. DATABASE_URL defaults
+to a throwaway SQLite URL; importing the app does not connect.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Must stay off the startup path unless STARTUP_MODE=eager
+HEAVY = ('pandas', 'scipy', 'sklearn', 'textblob', 'nltk', 'requests', 'pyarrow')
+
+
+def import_times(mode, module='app'):
+    """[(module name, self us, cumulative us)] for `import module`, in import order"""
+    env = dict(os.environ, STARTUP_MODE=mode)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(result.stderr)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['eager', 'lazy', 'background'], default='lazy')
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    rows = import_times(args.mode)
+    by_package = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split('.')[0]] += self_us
+    total_ms = next(cumulative for name, _, cumulative in rows if name == 'app') / 1000
+
+    print(f"{'package':<28}{'ms':>9}")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<28}{self_us / 1000:>9.1f}")
+    print(f"{'total (import app)':<28}{total_ms:>9.1f}")
+
+    problems = []
+    if args.mode != 'eager':
+        heavy = sorted(package for package in by_package if package in HEAVY)
+        if heavy:
+            problems.append('imported at startup: ' + ', '.join(heavy))
+    if total_ms > args.budget_ms:
+        problems.append(f'{total_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget')
+    for problem in problems:
+        print('FAIL ' + problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Query-plan regression check for the hot query paths (Postgres only).
+
+    python check_query_plans.py [--rows 200000] [--no-seed]
+
+Seeds synthetic rows inside a transaction, ANALYZEs, and EXPLAINs each hot
+query. A query fails if it sequentially scans a non-trivial table, does not
+use the expected index, or (for the partitioned tables) scans every
+partition.
+Everything is rolled back afterwards. Exits non-zero on any failure.
+"""
+import argparse
+import json
+import sys
+
+from init_db import get_connection
+
+# Seq scans are fine on tables this small (e.g. an empty default partition)
+SMALL_TABLE_ROWS = 1000
+
+# (name, table, SQL, acceptable index name fragments, must prune partitions)
+HOT_QUERIES = [
+    ('dock timeline sync', 'dock_schedule', """
+        SELECT * FROM smartflow.dock_schedule
+        WHERE warehouse_id = 7 AND id > 0 AND scheduled_time >= CURRENT_DATE
+     """, ('warehouse_time_idx', 'warehouse_id_scheduled_time_idx'), True),
+    ('stock by product and warehouse', 'inventory_item', """
+        SELECT quantity FROM smartflow.inventory_item
+        WHERE product_id = 'P-42' AND warehouse_id = 7
+     """, ('product_shelf_key',), False),
+    ('pending deliveries', 'delivery_route', """
+        SELECT id FROM smartflow.delivery_route WHERE delivery_status = 'pending'
+     """, ('status_idx',), False),
+    ('latest weather for a location', 'weather_data', """
+        SELECT * FROM smartflow.weather_data
+        WHERE location = 'City-5' ORDER BY timestamp DESC LIMIT 1
+     """, ('location_timestamp_idx',), False),
+]
+
+
+def seed(cur, rows):
+    """Synthetic rows shaped like production: selective filters, many partitions"""
+    cur.execute("""
+        INSERT INTO smartflow.warehouse (name, location, latitude, longitude, capacity)
+        SELECT 'Plan WH ' || g, 'City-' || g, 19 + g / 100.0, 72 + g / 100.0, 1000
+        FROM generate_series(1, 100) g
+        RETURNING id
+    """)
+    warehouse_ids = [r[0] for r in cur.fetchall()]
+    low, high = min(warehouse_ids), max(warehouse_ids)
+    # Past months too: production keeps their partitions, which the timeline sync must skip
+    cur.execute("SELECT smartflow.create_monthly_partitions('dock_schedule', (CURRENT_DATE - 90)::date, CURRENT_DATE)")
+    cur.execute("""
+        INSERT INTO smartflow.dock_schedule (warehouse_id, truck_id, dock_number, scheduled_time, estimated_duration)
+        SELECT %s + g %% (%s - %s + 1), 'PLAN-' || g, g %% 10 + 1,
+               CURRENT_DATE + (g %% 180 - 90) * INTERVAL '1 day' + (g %% 20) * INTERVAL '30 minutes', 30
+        FROM generate_series(1, %s) g
+    """, (low, high, low, rows))
+    cur.execute("""
+        INSERT INTO smartflow.inventory_item (warehouse_id, product_id, product_name, quantity)
+        SELECT %s + g %% (%s - %s + 1), 'P-' || (g / (%s - %s + 1)), 'Plan product', g %% 50
+        FROM generate_series(1, %s) g
+    """, (low, high, low, high, low, rows))
+    cur.execute("""
+        INSERT INTO smartflow.delivery_route (order_id, destination_address, vehicle_type, delivery_status)
+        SELECT 'PLAN-' || g, 'Somewhere', 'truck', CASE WHEN g %% 100 = 0 THEN 'pending' ELSE 'delivered' END
+        FROM generate_series(1, %s) g
+    """, (rows,))
+    cur.execute("""
+        INSERT INTO smartflow.weather_data (location, temperature, weather_condition, timestamp)
+        SELECT 'City-' || (g %% 100), 25, 'clear', CURRENT_TIMESTAMP - (g / 100) * INTERVAL '1 hour'
+        FROM generate_series(1, %s) g
+    """, (rows,))
+    for table in ('warehouse', 'dock_schedule', 'inventory_item', 'delivery_route', 'weather_data'):
+        cur.execute(f"ANALYZE smartflow.{table}")
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def estimated_rows(cur, relation):
+    cur.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)", (f'smartflow.{relation}',))
+    return cur.fetchone()[0]
+
+
+def partition_count(cur, table):
+    cur.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass(%s)", (f'smartflow.{table}',))
+    return cur.fetchone()[0]
+
+
+def check(cur, name, table, query, index_fragments, must_prune):
+    cur.execute("EXPLAIN (FORMAT JSON) " + query)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(plan_nodes(plan[0]['Plan']))
+    relations = {n['Relation Name'] for n in nodes if n.get('Relation Name', '').startswith(table)}
+
+    problems = []
+    seq_scans = sorted(n['Relation Name'] for n in nodes
+                       if n['Node Type'] == 'Seq Scan' and n.get('Relation Name', '').startswith(table)
+                       and estimated_rows(cur, n['Relation Name']) >= SMALL_TABLE_ROWS)
+    if seq_scans:
+        problems.append('seq scan on ' + ', '.join(seq_scans))
+    indexes = {n['Index Name'] for n in nodes if 'Index Name' in n}
+    if not any(fragment in index for index in indexes for fragment in index_fragments):
+        problems.append('expected index not used (used: %s)' % (', '.join(sorted(indexes)) or 'none'))
+    partitions = partition_count(cur, table)
+    if must_prune and partitions and len(relations) >= partitions:
+        problems.append(f'no partition pruning ({len(relations)} of {partitions} partitions scanned)')
+
+    status = 'ok' if not problems else 'FAIL'
+    scanned = f'{len(relations)}/{partitions} partitions' if partitions else 'unpartitioned'
+    print(f"{status:<5}{name:<34}{nodes[0]['Node Type']:<18}{scanned:<20}{'; '.join(problems)}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000, help='synthetic rows per table')
+    parser.add_argument('--no-seed', action='store_true', help='check plans against the data already there')
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            if not args.no_seed:
+                seed(cur, args.rows)
+            results = [check(cur, *query) for query in HOT_QUERIES]
+    finally:
+        conn.rollback()
+        conn.close()
+    failed = results.count(False)
+    print(f"{len(results) - failed} of {len(results)} hot queries use their indexes")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
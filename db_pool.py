@@ -0,0 +1,168 @@
+"""Connection pool settings, pool metrics and the read-only session.
+
+Pool sizing comes from the environment (DB_POOL_SIZE, DB_MAX_OVERFLOW,
+DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING). When READ_DATABASE_URL
+is set, a second engine is bound as 'read' with its own pool, configured by
+the same variables with a READ_ prefix (READ_DB_POOL_SIZE, ...).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from sqlalchemy import exc
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from extensions import db
+
+READ_BIND = 'read'
+
+# Upper bounds (ms) of the wait-time histogram buckets; the last one is open
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """Checkout counts, wait times and hold times for one pool"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.returns = 0
+        self.held_total = 0.0
+        self.held_max = 0.0
+
+    def waited(self, seconds, timed_out=False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.wait_buckets[bisect_left(WAIT_BUCKETS_MS, seconds * 1000)] += 1
+
+    def held(self, seconds):
+        with self.lock:
+            self.returns += 1
+            self.held_total += seconds
+            self.held_max = max(self.held_max, seconds)
+
+    def stats(self):
+        with self.lock:
+            waits = self.checkouts + self.timeouts
+            labels = [f'le_{ms}ms' for ms in WAIT_BUCKETS_MS] + ['gt_%dms' % WAIT_BUCKETS_MS[-1]]
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': round(self.wait_total / waits * 1000, 3) if waits else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+                'wait_histogram': dict(zip(labels, self.wait_buckets)),
+                'held_avg_ms': round(self.held_total / self.returns * 1000, 3) if self.returns else 0.0,
+                'held_max_ms': round(self.held_max * 1000, 3)
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for, and hold, a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.waited(time.perf_counter() - started, timed_out=True)
+            raise
+        now = time.perf_counter()
+        self.metrics.waited(now - started)
+        record.info['checked_out_at'] = now
+        return record
+
+    def _do_return_conn(self, record):
+        checked_out_at = record.info.pop('checked_out_at', None)
+        if checked_out_at is not None:
+            self.metrics.held(time.perf_counter() - checked_out_at)
+        super()._do_return_conn(record)
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """TimedQueuePool for asyncio engines"""
+
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(url, prefix='', poolclass=TimedQueuePool):
+    """SQLAlchemy engine options for `url` from {prefix}DB_POOL_* variables"""
+    if url.startswith('sqlite'):
+        # In-memory SQLite needs its single shared connection
+        return {} if ':memory:' in url or url.rstrip('/') == 'sqlite:' else {'poolclass': poolclass}
+
+    def env(name, default):
+        return os.environ.get(prefix + name, default)
+
+    return {
+        'poolclass': poolclass,
+        'pool_size': int(env('DB_POOL_SIZE', 10)),
+        'max_overflow': int(env('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(env('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(env('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _flag(env('DB_POOL_PRE_PING', 'true'))
+    }
+
+
+def configure(app, url):
+    """Set the primary engine options and the optional read bind on a Flask app"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    read_url = os.environ.get('READ_DATABASE_URL')
+    if read_url:
+        app.config['SQLALCHEMY_BINDS'] = {READ_BIND: dict(engine_options(read_url, 'READ_'), url=read_url)}
+
+
+@contextmanager
+def read_session():
+    """Short-lived session for read-only queries.
+
+    Uses the read replica when one is bound, else the primary. Unlike
+    db.session it does not stay open for the rest of the request: its
+    connection goes back to the pool as soon as the block exits. Replica
+    reads may lag the primary slightly.
+    """
+    engine = db.engines.get(READ_BIND) or db.engine
+    session = Session(engine)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def pool_stats(engines=None):
+    """Pool occupancy and metrics for every engine of the current app (or of `engines`)"""
+    stats = {}
+    for key, engine in (db.engines if engines is None else engines).items():
+        pool = engine.pool
+        entry = {'pool': pool.status()}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        metrics = getattr(pool, 'metrics', None)
+        if metrics is not None:
+            entry.update(metrics.stats())
+        stats[key or 'primary'] = entry
+    return stats
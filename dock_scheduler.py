@@ -1,22 +1,46 @@
-import pandas as pd
 import numpy as np
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from sqlalchemy import insert, select
 from models import DockSchedule, InventoryItem, Warehouse
 from extensions import db
+from dock_timeline import DockTimeline
+from heatmap_summary import HeatmapSummary
+from instrumentation import timed
+from unload_model import UnloadTimePredictor, rule_minutes
 
 class DockScheduler:
     def __init__(self, db):
         self.db = db
         self.dock_capacity = 10
+        self.day_start_hour = 8
+        self.slot_minutes = 30
+        self.slots_per_day = 20
+        self.horizon_days = 7  # how far ahead the allocator may book
         self.time_slots = self.generate_time_slots()
         self.scheduled_trucks = []
+        # warehouse_id -> DockTimeline, loaded on first use
+        self.timelines = {}
+        self._timelines_lock = threading.Lock()
+        self.heatmap = HeatmapSummary()
+        # Learned unload times when a trained model is published, else the rule
+        self.unload_model = UnloadTimePredictor()
     
+    def warm_up(self, load=True):
+        """Import SciPy, map the unload-time model and, with `load`, read the
+        heatmap summary ahead of the first request"""
+        import scipy.optimize
+        self.unload_model.model()
+        if load:
+            self.heatmap.ensure_fresh()
+
     def generate_time_slots(self):
         """Generate available time slots for the day"""
         slots = []
-        start_time = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
-        for i in range(20):  # 8 AM to 8 PM, 30-minute slots
-            end_time = start_time + timedelta(minutes=30)
+        start_time = datetime.now().replace(hour=self.day_start_hour, minute=0, second=0, microsecond=0)
+        for i in range(self.slots_per_day):  # 8 AM to 8 PM, 30-minute slots
+            end_time = start_time + timedelta(minutes=self.slot_minutes)
             slots.append({
                 'start': start_time.strftime('%H:%M'),
                 'end': end_time.strftime('%H:%M'),
@@ -25,68 +49,232 @@ class DockScheduler:
             start_time = end_time
         return slots
     
-    def predict_unload_time(self, truck_data):
-        """Predict unloading time based on truck characteristics"""
-        # Simple ML model simulation
-        base_time = 30  # Base 30 minutes
-        
-        # Factors affecting unload time
-        size_factor = truck_data.get('size', 'medium')
-        cargo_type = truck_data.get('cargo_type', 'general')
-        
-        if size_factor == 'large':
-            base_time += 15
-        elif size_factor == 'small':
-            base_time -= 10
-            
-        if cargo_type == 'fragile':
-            base_time += 20
-            
-        return base_time
+    def predict_unload_time(self, truck_data, warehouse_id=None):
+        """Predict unloading time (minutes) based on truck characteristics, averaged over the docks"""
+        warehouse_id = warehouse_id or truck_data.get('warehouse_id')
+        return int(round(self.predict_unload_times([truck_data], warehouse_id)[0].mean()))
+
+    def predict_unload_times(self, trucks, warehouse_id=None, when=None, dock_count=None):
+        """(truck, dock) matrix of unload minutes, scored in one model call.
+
+        Without a model every dock gets the rule's estimate. `dock_count`
+        overrides dock_capacity (see dock_simulation.py).
+        """
+        docks = np.arange(1, (dock_count or self.dock_capacity) + 1)
+        model = self.unload_model.model()
+        if model is None:
+            minutes = np.array([rule_minutes(t.get('size', 'medium'), t.get('cargo_type', 'general'))
+                                for t in trucks], dtype=int)
+            return np.repeat(minutes[:, None], len(docks), axis=1)
+        return model.predict(trucks, warehouse_id, self.expected_hour(when or datetime.now()), docks)
+
+    def expected_hour(self, t):
+        """Hour a truck arriving at t would start unloading, within opening hours"""
+        close_hour = self.day_start_hour + (self.slots_per_day * self.slot_minutes - 1) // 60
+        return min(max(t.hour, self.day_start_hour), close_hour)
     
+    def align_to_slot(self, t, duration):
+        """First slot start at or after t where a booking of `duration` fits in opening hours"""
+        slot = timedelta(minutes=self.slot_minutes)
+        horizon = datetime.now() + timedelta(days=self.horizon_days)
+        while t <= horizon:
+            day_open = t.replace(hour=self.day_start_hour, minute=0, second=0, microsecond=0)
+            day_close = day_open + slot * self.slots_per_day
+            if t <= day_open:
+                start = day_open
+            else:
+                # Round up to the next slot boundary
+                start = day_open + slot * -(-(t - day_open) // slot)
+            if start + duration <= day_close:
+                return start
+            t = day_open + timedelta(days=1)
+        return None
+
+    def get_timeline(self, warehouse_id):
+        """Booking index for a warehouse, created on first use"""
+        with self._timelines_lock:
+            timeline = self.timelines.get(warehouse_id)
+            if timeline is None:
+                timeline = self.timelines[warehouse_id] = DockTimeline(self.dock_capacity)
+            return timeline
+
+    def bookings_query(self, timeline, warehouse_id):
+        """Bookings written since the timeline last looked at the table"""
+        window_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return select(DockSchedule).where(
+            DockSchedule.warehouse_id == warehouse_id,
+            DockSchedule.id > timeline.last_seen_id,
+            DockSchedule.scheduled_time >= window_start
+        )
+
+    def apply_bookings(self, timeline, rows):
+        for row in rows:
+            minutes = row.actual_duration or row.estimated_duration or self.slot_minutes
+            timeline.add(row.dock_number, row.scheduled_time,
+                         row.scheduled_time + timedelta(minutes=minutes), row.id)
+
+    @timed
+    def sync_timeline(self, timeline, warehouse_id):
+        """Apply bookings written since the timeline last looked at the table"""
+        self.apply_bookings(timeline, self.db.session.scalars(self.bookings_query(timeline, warehouse_id)))
+
+    def resolve_warehouse(self, warehouse_id=None):
+        """Requested warehouse, or the first one when none is given"""
+        query = Warehouse.query
+        if warehouse_id:
+            query = query.filter_by(id=warehouse_id)
+        return query.first()
+
+    @contextmanager
+    def locked_timeline(self, warehouse_id):
+        """Hold the warehouse's booking lock with its timeline synced to the DB"""
+        timeline = self.get_timeline(warehouse_id)
+        with timeline.lock:
+            try:
+                # Row lock on the warehouse serialises bookings across workers;
+                # anything committed before we got it is replayed into the index
+                Warehouse.query.filter_by(id=warehouse_id).with_for_update().one()
+                self.sync_timeline(timeline, warehouse_id)
+                yield timeline
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+    @timed
     def schedule_truck(self, truck_data):
-        # Find a warehouse (for demo, use the first one)
-        warehouse = Warehouse.query.first()
+        """Book the earliest free (dock, slot) pair for a truck"""
+        warehouse = self.resolve_warehouse(truck_data.get('warehouse_id'))
         if not warehouse:
             return {'status': 'no_warehouse_available'}
-        # Find next available dock number
-        dock_number = 1
-        scheduled_time = datetime.now()
-        # Create a new dock schedule
-        dock_schedule = DockSchedule(
-            warehouse_id=warehouse.id,
-            truck_id=truck_data.get('truck_id'),
-            dock_number=dock_number,
-            scheduled_time=scheduled_time,
-            estimated_duration=30,
-            status='scheduled',
-            cargo_type=truck_data.get('cargo_type'),
-            truck_size=truck_data.get('size')
-        )
-        self.db.session.add(dock_schedule)
-        self.db.session.commit()
+
+        duration = self.predict_unload_time(truck_data, warehouse.id)
+        with self.locked_timeline(warehouse.id) as timeline:
+            dock_number, scheduled_time = timeline.allocate(
+                datetime.now(), timedelta(minutes=duration), self.align_to_slot)
+            if dock_number is None:
+                self.db.session.rollback()
+                return {'status': 'no_slot_available'}
+            row = self.booking_row(warehouse.id, truck_data, dock_number, scheduled_time, duration)
+            dock_schedule = DockSchedule(**row)
+            self.db.session.add(dock_schedule)
+            self.db.session.flush()
+            booking_id = dock_schedule.id
+            self.db.session.commit()
+            timeline.add(dock_number, scheduled_time,
+                         scheduled_time + timedelta(minutes=duration), booking_id)
+        return self.booking_result(row)
+
+    def booking_row(self, warehouse_id, truck_data, dock_number, scheduled_time, duration):
+        """DockSchedule values for a booking"""
+        return {
+            'warehouse_id': warehouse_id,
+            'truck_id': truck_data.get('truck_id'),
+            'dock_number': dock_number,
+            'scheduled_time': scheduled_time,
+            'estimated_duration': duration,
+            'status': 'scheduled',
+            'cargo_type': truck_data.get('cargo_type'),
+            'truck_size': truck_data.get('size')
+        }
+
+    def booking_result(self, row):
         return {
-            'dock_assignment': dock_number,
-            'time_slot': scheduled_time.strftime('%H:%M'),
+            'dock_assignment': row['dock_number'],
+            'time_slot': row['scheduled_time'].strftime('%H:%M'),
+            'scheduled_time': row['scheduled_time'].isoformat(),
+            'estimated_duration': row['estimated_duration'],
             'status': 'scheduled'
         }
+
+    @timed
+    def assign_docks(self, durations, ready_slots):
+        """Solve the dock assignment for a batch as one linear assignment.
+
+        Minimising the sum of completion times on parallel docks is a
+        bipartite matching: truck j in the k-th position from the end of
+        dock m's queue adds ready_m + k * duration_j to the total. Durations
+        may differ per dock (a (truck, dock) matrix); the matching stays
+        exact. Returns, per truck, the dock index and its position in that
+        dock's queue.
+        """
+        from scipy.optimize import linear_sum_assignment
+
+        durations = np.asarray(durations, dtype=float)
+        ready_slots = np.asarray(ready_slots, dtype=float)
+        n, docks = len(durations), len(ready_slots)
+        durations = np.broadcast_to(durations.reshape(n, -1), (n, docks))
+        positions = np.arange(1, n + 1, dtype=float)
+        cost = ready_slots[None, :, None] + durations[:, :, None] * positions[None, None, :]
+        # Every truck gets a column; rows come back as 0..n-1 in order
+        _, cols = linear_sum_assignment(cost.reshape(n, docks * n))
+        dock_index, from_end = np.divmod(cols, n)
+        # Larger "k from the end" means served earlier
+        return dock_index, -from_end
+
+    @timed
+    def schedule_batch(self, trucks, warehouse_id=None):
+        """Schedule a burst of trucks together and store them in one insert"""
+        if not trucks:
+            return []
+        warehouse = self.resolve_warehouse(warehouse_id or trucks[0].get('warehouse_id'))
+        if not warehouse:
+            return [{'status': 'no_warehouse_available'} for _ in trucks]
+
+        with self.locked_timeline(warehouse.id) as timeline:
+            rows, placed = self.place_batch(timeline, trucks, warehouse.id)
+            try:
+                if rows:
+                    ids = self.db.session.scalars(
+                        insert(DockSchedule).returning(DockSchedule.id, sort_by_parameter_order=True),
+                        rows
+                    ).all()
+                    self.db.session.commit()
+                    timeline.last_seen_id = max(timeline.last_seen_id, max(ids))
+            except Exception:
+                # The timeline already holds these bookings; drop it so the
+                # next request reloads it from the table
+                self.drop_timeline(warehouse.id)
+                raise
+        return self.batch_results(trucks, rows, placed)
+
+    @timed
+    def place_batch(self, timeline, trucks, warehouse_id):
+        """Book a batch into the timeline; returns (DockSchedule rows, truck index per row)"""
+        now = datetime.now()
+        durations = self.predict_unload_times(trucks, warehouse_id, now)
+        slot = timedelta(minutes=self.slot_minutes)
+        slot_counts = -(-durations // self.slot_minutes)
+        ready_slots = [(timeline.free_from(dock, now) - now) / slot
+                       for dock in range(1, self.dock_capacity + 1)]
+        dock_index, order = self.assign_docks(slot_counts, ready_slots)
+
+        # Place each dock's queue in order; the timeline handles opening
+        # hours and any gaps left by earlier bookings
+        rows, placed = [], []
+        for j in np.lexsort((order, dock_index)):
+            dock_number = int(dock_index[j]) + 1
+            minutes = int(durations[j, dock_index[j]])
+            duration = timedelta(minutes=minutes)
+            start = timeline.earliest_fit(dock_number, now, duration, self.align_to_slot)
+            if start is None:
+                continue
+            timeline.add(dock_number, start, start + duration)
+            rows.append(self.booking_row(warehouse_id, trucks[j], dock_number, start, minutes))
+            placed.append(j)
+        return rows, placed
+
+    def batch_results(self, trucks, rows, placed):
+        """Per-truck results in request order"""
+        results = [{'status': 'no_slot_available'} for _ in trucks]
+        for j, row in zip(placed, rows):
+            results[j] = dict(truck_id=row['truck_id'], **self.booking_result(row))
+        return results
+
+    def drop_timeline(self, warehouse_id):
+        with self._timelines_lock:
+            self.timelines.pop(warehouse_id, None)
     
+    @timed
     def generate_heatmap_data(self):
-        """Generate heatmap data for warehouse optimization"""
-        # Simulate product turnover data
-        np.random.seed(42)
-        zones = ['A', 'B', 'C', 'D', 'E']
-        shelves = list(range(1, 21))
-        
-        heatmap_data = []
-        for zone in zones:
-            for shelf in shelves:
-                turnover_rate = np.random.randint(10, 100)
-                heatmap_data.append({
-                    'zone': zone,
-                    'shelf': shelf,
-                    'turnover_rate': turnover_rate,
-                    'recommendation': 'high_turnover' if turnover_rate > 70 else 'low_turnover'
-                })
-        
-        return heatmap_data
+        """Zone x shelf turnover from inventory, for warehouse optimization"""
+        return self.heatmap.rows()
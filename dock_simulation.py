@@ -0,0 +1,339 @@
+"""What-if simulation of dock queues, for sizing a warehouse's docks.
+
+    python dock_simulation.py [--docks 6-14] [--scenarios 2000] [--trucks-per-day 80]
+    python dock_simulation.py --replay --warehouse-id 1 [--days 90]    # resample booked days
+    python dock_simulation.py ... [--target-p95 30] [--json results.json]
+
+Each scenario is one operating day of DockScheduler (twenty 30-minute slots
+from 08:00 unless overridden). Trucks arrive either from a synthetic hourly
+profile, with a Poisson number per day and TRUCK_MIX sizes and cargo, or
+by resampling whole days of dock_schedule history. Bookings carry no
+arrival time, so in replays scheduled_time stands in for it. Unload minutes
+come from DockScheduler.predict_unload_times: the published model per dock
+and hour, else the rule. They are scaled by lognormal noise (--service-cv).
+Like the live allocator, a truck takes the dock that frees up first, starts
+on a slot boundary and holds whole slots, so waits include the wait for the
+next boundary (--no-slots to leave it out). Trucks still unloading at
+closing time, which the live allocator would push to the next day, are
+counted as overflow rather than moved.
+
+Every dock count runs on the same scenarios, so differences between dock
+counts are not sampling noise. A batch of scenarios is simulated together
+as NumPy arrays, one step per arriving truck. Batches are spread over a
+process pool, and each returns a one-minute histogram of waits that is
+merged for the percentiles. Results depend on --seed and --chunk-size,
+not on --workers.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import repeat
+
+import numpy as np
+
+SIZES = ('small', 'medium', 'large')
+CARGO = ('general', 'fragile')
+TRUCK_TYPES = [(size, cargo) for size in SIZES for cargo in CARGO]
+# Synthetic arrivals: share of each truck type, and of each opening hour
+# (a morning peak over ten hours; spread evenly for other opening hours)
+TRUCK_MIX = (2 / 9, 1 / 9, 2 / 9, 1 / 9, 2 / 9, 1 / 9)
+HOURLY_PROFILE = (0.14, 0.16, 0.14, 0.11, 0.08, 0.08, 0.09, 0.08, 0.07, 0.05)
+MAX_WAIT = 24 * 60  # histogram range in minutes; longer waits land in the last bin
+
+
+def truck_type(size, cargo_type):
+    """Index into TRUCK_TYPES; unknown values count as the rule's defaults"""
+    size = size if size in SIZES else 'medium'
+    return SIZES.index(size) * len(CARGO) + (cargo_type == 'fragile')
+
+
+def unload_table(scheduler, warehouse_id, dock_count, hours):
+    """(hour, truck type, dock) array of predicted unload minutes"""
+    day_open = datetime.now().replace(hour=scheduler.day_start_hour, minute=0, second=0, microsecond=0)
+    trucks = [{'size': size, 'cargo_type': cargo} for size, cargo in TRUCK_TYPES]
+    return np.stack([scheduler.predict_unload_times(trucks, warehouse_id, day_open + timedelta(hours=hour),
+                                                    dock_count)
+                     for hour in range(hours)]).astype(float)
+
+
+def history_days(engine, warehouse_id, since, day_start_hour, open_minutes):
+    """One (arrival minutes, truck types) pair per booked day of the warehouse"""
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+
+    from models import DockSchedule
+
+    query = select(DockSchedule.scheduled_time, DockSchedule.truck_size, DockSchedule.cargo_type).where(
+        DockSchedule.warehouse_id == warehouse_id, DockSchedule.scheduled_time >= since
+    ).order_by(DockSchedule.scheduled_time)
+    days = {}
+    with Session(engine) as session:
+        for scheduled, size, cargo in session.execute(query):
+            day_open = scheduled.replace(hour=day_start_hour, minute=0, second=0, microsecond=0)
+            minute = (scheduled - day_open).total_seconds() / 60
+            if 0 <= minute < open_minutes:
+                day = days.setdefault(day_open.date(), ([], []))
+                day[0].append(minute)
+                day[1].append(truck_type(size, cargo))
+    return [(np.array(minutes), np.array(types)) for minutes, types in days.values()]
+
+
+def sort_arrivals(minutes, types):
+    order = np.argsort(minutes, axis=1, kind='stable')
+    return np.take_along_axis(minutes, order, axis=1), np.take_along_axis(types, order, axis=1)
+
+
+def synthetic_arrivals(rng, scenarios, trucks_per_day, profile, mix):
+    """(scenarios, trucks) arrival minutes after opening, ascending and inf-padded, and truck types"""
+    counts = rng.poisson(trucks_per_day, scenarios)
+    width = int(counts.max()) if scenarios else 0
+    hours = rng.choice(len(profile), size=(scenarios, width), p=profile)
+    minutes = (hours + rng.random((scenarios, width))) * 60
+    minutes[np.arange(width) >= counts[:, None]] = np.inf
+    types = rng.choice(len(mix), size=(scenarios, width), p=mix)
+    return sort_arrivals(minutes, types)
+
+
+def replayed_arrivals(rng, scenarios, days, jitter, open_minutes):
+    """Like synthetic_arrivals, from randomly drawn history days, each arrival moved by up to
+    `jitter` minutes either way so repeated draws of a day differ"""
+    picks = rng.integers(len(days), size=scenarios)
+    width = max(len(days[i][0]) for i in picks)
+    minutes = np.full((scenarios, width), np.inf)
+    types = np.zeros((scenarios, width), dtype=int)
+    for row, i in enumerate(picks):
+        day_minutes, day_types = days[i]
+        minutes[row, :len(day_minutes)] = day_minutes
+        types[row, :len(day_types)] = day_types
+    padding = ~np.isfinite(minutes)
+    minutes = np.clip(minutes + rng.uniform(-jitter, jitter, minutes.shape), 0, open_minutes - 1e-6)
+    minutes[padding] = np.inf
+    return sort_arrivals(minutes, types)
+
+
+def simulate(arrivals, types, noise, table, docks, open_minutes, slot_minutes=None):
+    """Queue a batch of scenarios at `docks` docks.
+
+    `arrivals` is (scenarios, trucks), ascending and inf-padded; `noise`
+    scales each truck's predicted minutes. Returns each truck's wait (NaN
+    for padding), and per scenario the dock-minutes busy within opening
+    hours and the trucks still unloading at closing.
+    """
+    scenarios, width = arrivals.shape
+    live = np.isfinite(arrivals)
+    hours = np.where(live, np.minimum(np.where(live, arrivals, 0) // 60, table.shape[0] - 1), 0).astype(int)
+    free = np.zeros((scenarios, docks))
+    waits = np.full((scenarios, width), np.nan)
+    busy = np.zeros(scenarios)
+    late = np.zeros(scenarios, dtype=int)
+    for k in range(width):
+        rows = np.flatnonzero(live[:, k])
+        if not len(rows):
+            break
+        arrived = arrivals[rows, k]
+        dock = free[rows].argmin(axis=1)
+        start = np.maximum(arrived, free[rows, dock])
+        duration = table[hours[rows, k], types[rows, k], dock] * noise[rows, k]
+        if slot_minutes:
+            start = np.ceil(start / slot_minutes) * slot_minutes
+            duration = np.ceil(duration / slot_minutes) * slot_minutes
+        end = start + duration
+        free[rows, dock] = end
+        waits[rows, k] = start - arrived
+        busy[rows] += np.clip(np.minimum(end, open_minutes) - start, 0, None)
+        late[rows] += end > open_minutes
+    return waits, busy, late
+
+
+def run_chunk(spec, scenarios, seed):
+    """Simulate `scenarios` days at every dock count; per dock count, mergeable totals"""
+    rng = np.random.default_rng(seed)
+    if spec['days'] is None:
+        arrivals, types = synthetic_arrivals(rng, scenarios, spec['trucks_per_day'], spec['profile'],
+                                             spec['mix'])
+    else:
+        arrivals, types = replayed_arrivals(rng, scenarios, spec['days'], spec['jitter'],
+                                            spec['open_minutes'])
+    # Mean-one lognormal with the requested coefficient of variation
+    sigma = np.sqrt(np.log1p(spec['service_cv'] ** 2))
+    noise = rng.lognormal(-sigma ** 2 / 2, sigma, arrivals.shape)
+    totals = {}
+    for docks in spec['dock_counts']:
+        waits, busy, late = simulate(arrivals, types, noise, spec['table'], docks, spec['open_minutes'],
+                                     spec['slot_minutes'])
+        waits = waits[np.isfinite(waits)]
+        totals[docks] = {
+            'histogram': np.bincount(np.minimum(waits, MAX_WAIT).astype(int), minlength=MAX_WAIT + 1),
+            'wait_sum': float(waits.sum()),
+            'trucks': int(waits.size),
+            'busy': busy,
+            'late': int(late.sum()),
+        }
+    return totals
+
+
+def percentile(histogram, q):
+    cumulative = np.cumsum(histogram)
+    return int(np.searchsorted(cumulative, q * cumulative[-1]))
+
+
+def summarize(docks, totals, open_minutes, long_wait):
+    histogram = sum(t['histogram'] for t in totals)
+    trucks = sum(t['trucks'] for t in totals)
+    busy = np.concatenate([t['busy'] for t in totals])
+    utilization = busy / (docks * open_minutes)
+    if not trucks:
+        return {'docks': docks, 'trucks': 0}
+    return {
+        'docks': docks,
+        'trucks': trucks,
+        'wait_minutes': {
+            'mean': round(sum(t['wait_sum'] for t in totals) / trucks, 1),
+            **{f'p{q}': percentile(histogram, q / 100) for q in (50, 90, 95, 99)},
+        },
+        'waited_share': round(1 - histogram[0] / trucks, 4),
+        'long_wait_share': round(histogram[long_wait + 1:].sum() / trucks, 4),
+        'utilization': {'mean': round(float(utilization.mean()), 4),
+                        'p90': round(float(np.percentile(utilization, 90)), 4)},
+        'overflow_share': round(sum(t['late'] for t in totals) / trucks, 4),
+    }
+
+
+def run(spec, scenarios, seed=0, workers=None, chunk_size=250, long_wait=30):
+    """Per dock count summaries over `scenarios` simulated days"""
+    sizes = [min(chunk_size, scenarios - start) for start in range(0, scenarios, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(sizes) == 1:
+        chunks = list(map(run_chunk, repeat(spec), sizes, seeds))
+    else:
+        # spawn, like the request-time pools: the children import only NumPy
+        with ProcessPoolExecutor(min(workers, len(sizes)), mp_context=multiprocessing.get_context('spawn')) as pool:
+            chunks = list(pool.map(run_chunk, repeat(spec), sizes, seeds))
+    return [summarize(docks, [chunk[docks] for chunk in chunks], spec['open_minutes'], long_wait)
+            for docks in spec['dock_counts']]
+
+
+def recommend(results, target_p95, max_overflow=None):
+    """Fewest docks whose p95 wait (and, when given, overflow) is within target"""
+    for result in results:
+        if result['trucks'] and result['wait_minutes']['p95'] <= target_p95 \
+                and (max_overflow is None or result['overflow_share'] <= max_overflow):
+            return result['docks']
+    return None
+
+
+def dock_range(value):
+    low, _, high = value.partition('-')
+    counts = list(range(int(low), int(high or low) + 1))
+    if not counts or counts[0] < 1:
+        raise argparse.ArgumentTypeError("expected N or LOW-HIGH with 1 <= LOW <= HIGH")
+    return counts
+
+
+def weights(value):
+    values = np.array([float(v) for v in value.split(',')])
+    if (values < 0).any() or values.sum() <= 0:
+        raise argparse.ArgumentTypeError("expected non-negative comma-separated weights")
+    return values / values.sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docks', type=dock_range, default=dock_range('6-14'), help='dock counts to compare')
+    parser.add_argument('--scenarios', type=int, default=2000, help='simulated days per dock count')
+    parser.add_argument('--warehouse-id', type=int, help='warehouse the unload model scores for')
+    parser.add_argument('--trucks-per-day', type=float, default=80, help='mean synthetic arrivals per day')
+    parser.add_argument('--profile', type=weights, help='comma-separated arrival weight per opening hour')
+    parser.add_argument('--replay', action='store_true', help="resample the warehouse's booked days instead")
+    parser.add_argument('--days', type=int, default=90, help='history window for --replay')
+    parser.add_argument('--jitter', type=float, default=15, help='replayed arrivals move up to this many minutes')
+    parser.add_argument('--service-cv', type=float, default=0.25, help='spread of unload times around the prediction')
+    parser.add_argument('--slot-minutes', type=int, help='override DockScheduler.slot_minutes')
+    parser.add_argument('--slots-per-day', type=int, help='override DockScheduler.slots_per_day')
+    parser.add_argument('--no-slots', action='store_true', help='start and hold docks by the minute')
+    parser.add_argument('--target-p95', type=float, default=30, help='acceptable p95 wait in minutes')
+    parser.add_argument('--max-overflow', type=float, help='acceptable share of trucks past closing')
+    parser.add_argument('--workers', type=int, help='processes (default: one per CPU; 0 runs inline)')
+    parser.add_argument('--chunk-size', type=int, default=250, help='scenarios per batch')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results here')
+    args = parser.parse_args()
+    if args.replay and args.warehouse_id is None:
+        parser.error("--replay needs --warehouse-id")
+
+    from dock_scheduler import DockScheduler
+    from extensions import db
+
+    scheduler = DockScheduler(db)
+    scheduler.slot_minutes = args.slot_minutes or scheduler.slot_minutes
+    scheduler.slots_per_day = args.slots_per_day or scheduler.slots_per_day
+    open_minutes = scheduler.slots_per_day * scheduler.slot_minutes
+    hours = -(-open_minutes // 60)
+    spec = {
+        'dock_counts': args.docks,
+        'open_minutes': open_minutes,
+        'slot_minutes': None if args.no_slots else scheduler.slot_minutes,
+        'service_cv': args.service_cv,
+        'table': unload_table(scheduler, args.warehouse_id, max(args.docks), hours),
+        'days': None,
+    }
+    if args.replay:
+        from dotenv import load_dotenv
+        from sqlalchemy import create_engine
+
+        load_dotenv()
+        url = os.environ.get('READ_DATABASE_URL') or os.environ.get('DATABASE_URL')
+        if not url:
+            raise RuntimeError("DATABASE_URL environment variable not set! Please set it in your environment or .env file.")
+        spec['days'] = history_days(create_engine(url), args.warehouse_id, datetime.now() - timedelta(days=args.days),
+                                    scheduler.day_start_hour, open_minutes)
+        spec['jitter'] = args.jitter
+        if not spec['days']:
+            raise SystemExit(f"No bookings for warehouse {args.warehouse_id} in the last {args.days} days")
+        source = f"resampled from {len(spec['days'])} booked days of warehouse {args.warehouse_id}"
+    else:
+        profile = args.profile if args.profile is not None else np.array(
+            HOURLY_PROFILE if len(HOURLY_PROFILE) == hours else [1.0] * hours)
+        if len(profile) != hours:
+            parser.error(f"--profile needs {hours} weights, one per opening hour")
+        spec.update(trucks_per_day=args.trucks_per_day, profile=profile / profile.sum(), mix=np.array(TRUCK_MIX))
+        source = f"of synthetic arrivals, {args.trucks_per_day:g} trucks/day"
+
+    started = time.perf_counter()
+    results = run(spec, args.scenarios, args.seed, args.workers, args.chunk_size, long_wait=args.target_p95)
+    elapsed = time.perf_counter() - started
+    best = recommend(results, args.target_p95, args.max_overflow)
+
+    print(f"{args.scenarios} days {source}, unload times from "
+          f"{'the model' if scheduler.unload_model.model() is not None else 'the rule'} "
+          f"({elapsed:.1f}s)")
+    print(f"{'docks':>5} {'mean':>6} {'p50':>5} {'p90':>5} {'p95':>5} {'p99':>5} "
+          f"{'waited':>7} {'>' + format(args.target_p95, 'g') + 'min':>7} {'util':>6} {'overflow':>8}")
+    for r in results:
+        if not r['trucks']:
+            print(f"{r['docks']:>5}  no arrivals")
+            continue
+        w = r['wait_minutes']
+        print(f"{r['docks']:>5} {w['mean']:>6.1f} {w['p50']:>5} {w['p90']:>5} {w['p95']:>5} {w['p99']:>5} "
+              f"{r['waited_share']:>7.1%} {r['long_wait_share']:>7.1%} {r['utilization']['mean']:>6.1%} "
+              f"{r['overflow_share']:>8.1%}{'  <-' if r['docks'] == best else ''}")
+    target = f"p95 wait <= {args.target_p95:g} min"
+    if args.max_overflow is not None:
+        target += f" and overflow <= {args.max_overflow:.0%}"
+    if best is None:
+        print(f"No dock count in range has {target}")
+    else:
+        print(f"Fewest docks with {target}: {best} (configured: {scheduler.dock_capacity})")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'source': source, 'scenarios': args.scenarios, 'seed': args.seed,
+                       'target_p95': args.target_p95, 'recommended_docks': best, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
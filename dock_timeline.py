@@ -0,0 +1,77 @@
+import bisect
+import threading
+from datetime import timedelta
+
+
+class DockTimeline:
+    """In-memory booking index for the docks of one warehouse.
+
+    Each dock keeps its occupied time as a sorted list of disjoint
+    intervals, so finding the booking around a point in time is a bisect.
+    """
+
+    def __init__(self, dock_count):
+        self.dock_count = dock_count
+        self.starts = [[] for _ in range(dock_count)]
+        self.ends = [[] for _ in range(dock_count)]
+        # Highest DockSchedule id already applied; used to catch up with rows
+        # written by other workers
+        self.last_seen_id = 0
+        self.lock = threading.Lock()
+
+    def add(self, dock_number, start, end, booking_id=None):
+        """Mark [start, end) as occupied on a dock (docks are numbered from 1)"""
+        if booking_id is not None:
+            self.last_seen_id = max(self.last_seen_id, booking_id)
+        index = dock_number - 1
+        if not 0 <= index < self.dock_count or end <= start:
+            return
+        starts, ends = self.starts[index], self.ends[index]
+
+        # Merge with any booking it touches so the intervals stay disjoint
+        lo = bisect.bisect_left(ends, start)
+        hi = bisect.bisect_right(starts, end)
+        if lo < hi:
+            start = min(start, starts[lo])
+            end = max(end, ends[hi - 1])
+        starts[lo:hi] = [start]
+        ends[lo:hi] = [end]
+
+    def earliest_fit(self, dock_number, not_before, duration, align):
+        """Earliest start >= not_before where the dock is free for `duration`.
+
+        `align(t, duration)` returns the first valid slot start at or after t
+        (or None when past the planning horizon).
+        """
+        starts, ends = self.starts[dock_number - 1], self.ends[dock_number - 1]
+        t = align(not_before, duration)
+        while t is not None:
+            i = bisect.bisect_right(starts, t)
+            if i and ends[i - 1] > t:
+                # Inside a booking: jump to its end
+                t = align(ends[i - 1], duration)
+            elif i < len(starts) and starts[i] < t + duration:
+                # Next booking starts before we would finish
+                t = align(ends[i], duration)
+            else:
+                return t
+        return None
+
+    def allocate(self, not_before, durations, align):
+        """Earliest free (dock, start) pair across all docks.
+
+        `durations` is either one timedelta for every dock or a sequence with
+        one timedelta per dock. Returns (None, None) when nothing fits.
+        """
+        best_dock, best_start = None, None
+        for dock_number in range(1, self.dock_count + 1):
+            duration = durations if isinstance(durations, timedelta) else durations[dock_number - 1]
+            start = self.earliest_fit(dock_number, not_before, duration, align)
+            if start is not None and (best_start is None or start < best_start):
+                best_dock, best_start = dock_number, start
+        return best_dock, best_start
+
+    def free_from(self, dock_number, not_before):
+        """Time after which the dock has no further bookings"""
+        ends = self.ends[dock_number - 1]
+        return max(not_before, ends[-1]) if ends else not_before
@@ -1,58 +1,264 @@
-import requests
-import json
+import os
 from datetime import datetime
+from itertools import islice
+import numpy as np
 from models import Warehouse, DeliveryRoute, WeatherData
 from extensions import db
 from sqlalchemy import func
+from geo import haversine_km
+from warehouse_index import WarehouseIndex
+from stock_index import StockIndex
+from weather_cache import WeatherCache
+from traffic import HttpTrafficProvider, TableTrafficProvider, TrafficService
+from instrumentation import timed
 
 class FulfillmentEngine:
     def __init__(self, db):
         self.db = db
+        self.warehouse_index = WarehouseIndex()
+        self.stock_index = StockIndex()
+        self.weather_cache = WeatherCache()
+        table = TableTrafficProvider(os.environ.get('TRAFFIC_TABLE_PATH'))
+        feed_url = os.environ.get('TRAFFIC_FEED_URL')
+        self.traffic = TrafficService(HttpTrafficProvider(feed_url, fallback=table) if feed_url else table)
+        # Extra travel time for bad weather, matched against weather_condition
+        self.weather_delay_factors = {
+            'storm': 1.5,
+            'thunder': 1.5,
+            'snow': 1.4,
+            'rain': 1.25,
+            'fog': 1.15,
+            'mist': 1.1,
+            'haze': 1.1
+        }
+
+    def warm_up(self, load=True):
+        """Import scikit-learn and, with `load`, fill the warehouse, stock and weather caches"""
+        import sklearn.neighbors
+        if load:
+            self.warehouse_index.ensure_fresh()
+            self.stock_index.ensure_fresh()
+            self.weather_cache.get(None)
 
     def get_all_warehouses(self):
         return Warehouse.query.all()
     
     def get_weather_data(self, location):
-        # Fetch latest weather data for the location from DB
-        return WeatherData.query.filter_by(location=location).order_by(WeatherData.timestamp.desc()).first()
+        """Latest weather for the location as a dict (served from the in-process cache)"""
+        if not isinstance(location, str):
+            return None
+        return self.weather_cache.get(location)
     
-    def get_traffic_data(self, route):
-        """Get traffic data for route (simulated)"""
-        # In real implementation, use Google Maps API or similar
-        traffic_levels = ['low', 'moderate', 'high']
-        import random
-        return {
-            'level': random.choice(traffic_levels),
-            'estimated_delay': random.randint(0, 60)  # minutes
-        }
+    def get_traffic_data(self, route, when=None):
+        """Get traffic data for an (origin, destination) route at a time (default now)"""
+        # Provider is a lookup table unless TRAFFIC_FEED_URL points at a live feed
+        return self.traffic.get(route, when)
     
+    def parse_order_items(self, order_data):
+        """Normalise order items to {product_id: quantity}"""
+        if isinstance(order_data, dict):
+            order_data = [{'product_id': k, 'quantity': v} for k, v in order_data.items()]
+        needs = {}
+        for item in order_data or []:
+            if isinstance(item, dict):
+                product_id, quantity = item.get('product_id', item.get('id')), int(item.get('quantity', 1))
+            else:
+                product_id, quantity = item, 1
+            needs[str(product_id)] = needs.get(str(product_id), 0) + quantity
+        return needs
+
+    def split_shipment(self, needs, holders, distance):
+        """Greedy split: keep taking the warehouse that ships the most
+        remaining lines, preferring the nearer one on ties.
+
+        holders(product_id, quantity) gives the warehouses able to ship a
+        line; distance(warehouse_id) gives km, or None when unknown.
+        """
+        remaining = dict(needs)
+        shipments = []
+        while remaining:
+            lines = {}
+            for product_id, quantity in remaining.items():
+                for warehouse_id in holders(product_id, quantity):
+                    lines.setdefault(warehouse_id, []).append(product_id)
+            candidates = [w for w in lines if distance(w) is not None]
+            if not candidates:
+                break
+            best = max(candidates, key=lambda w: (len(lines[w]), -distance(w)))
+            shipments.append((best, lines[best]))
+            for product_id in lines[best]:
+                del remaining[product_id]
+        return shipments, list(remaining)
+
+    @timed
+    def plan_shipments(self, latitude, longitude, needs):
+        """Nearest warehouse that covers every line, else a greedy split.
+
+        Returns ([((id, location, distance_km), [product_id, ...]), ...], unfulfilled).
+        """
+        covering = self.stock_index.warehouses_covering(needs)
+        ranked = self.warehouse_index.distances(latitude, longitude, covering)
+        if ranked:
+            return [(ranked[0], list(needs))], []
+
+        def holders(product_id, quantity):
+            return [w for w, q in self.stock_index.available(product_id).items() if q >= quantity]
+
+        stocked = {w for product_id in needs for w in self.stock_index.available(product_id)}
+        known = {r[0]: r for r in self.warehouse_index.distances(latitude, longitude, stocked)}
+        shipments, unfulfilled = self.split_shipment(
+            needs, holders, lambda w: known[w][2] if w in known else None)
+        return [(known[w], items) for w, items in shipments], unfulfilled
+
+    @timed
     def select_optimal_warehouse(self, customer_location, order_data):
-        # For demo, use the first warehouse as optimal
-        warehouses = self.get_all_warehouses()
-        if not warehouses:
-            return {'warehouse': None, 'estimated_delivery_time': 'N/A'}
-        # Example: select the closest warehouse (add real logic as needed)
-        best_warehouse = warehouses[0]
+        """Pick the closest warehouse (or set of warehouses) that can serve the order"""
+        latitude, longitude = self.get_coordinates(customer_location)
+        needs = self.parse_order_items(order_data)
+        if needs:
+            shipments, unfulfilled = self.plan_shipments(latitude, longitude, needs)
+        else:
+            shipments, unfulfilled = [(w, []) for w in self.warehouse_index.nearest(latitude, longitude, k=1)], []
+        if not shipments:
+            return {'warehouse': None, 'estimated_delivery_time': 'N/A', 'unfulfilled_items': unfulfilled}
+
+        planned = []
+        for (warehouse_id, location, distance), items in shipments:
+            traffic = self.get_traffic_data((location, customer_location))
+            weather = self.get_weather_data(customer_location)
+            planned.append({
+                'warehouse': {
+                    'id': warehouse_id,
+                    'location': location,
+                    'distance_km': round(distance, 1)
+                },
+                'items': items,
+                'estimated_delivery_time': self.calculate_delivery_time(distance, traffic, weather)
+            })
+        # The order arrives with its farthest shipment
+        farthest = max(planned, key=lambda p: p['warehouse']['distance_km'])
         return {
-            'warehouse': {
-                'id': best_warehouse.id,
-                'location': best_warehouse.location
-            },
-            'estimated_delivery_time': '2h 30m'
+            'warehouse': planned[0]['warehouse'],
+            'estimated_delivery_time': farthest['estimated_delivery_time'],
+            'shipments': planned,
+            'unfulfilled_items': unfulfilled
         }
     
-    def calculate_delivery_time(self, distance, traffic):
+    @timed
+    def select_optimal_warehouses(self, orders, chunk_size=4096):
+        """Plan a wave of orders, yielding one result per order in input order.
+
+        Distances from each chunk of orders to every warehouse come from one
+        NumPy pass. Stock is reserved as orders are planned, so orders in the
+        same wave are never promised the same units. Reservations only live
+        for the duration of the call.
+        """
+        self.warehouse_index.ensure_fresh()
+        self.stock_index.ensure_fresh()
+        _, ids, locations, coords, positions = self.warehouse_index.snapshot
+        stock = self.stock_index.stock
+        reserved = {}
+
+        def holders(product_id, quantity):
+            held = reserved.get(product_id, {})
+            return [w for w, q in stock.get(product_id, {}).items()
+                    if q - held.get(w, 0) >= quantity and w in positions]
+
+        def nearest_covering(needs, row):
+            # Intersect the warehouses stocking each line (rarest first, set
+            # ops in C), then check quantities only on what survives
+            products = sorted(needs, key=lambda p: len(stock.get(p, ())))
+            candidates = stock.get(products[0], {}).keys() & positions.keys()
+            for product_id in products[1:]:
+                if not candidates:
+                    return None
+                candidates &= stock.get(product_id, {}).keys()
+            best, best_distance = None, float('inf')
+            for w in candidates:
+                distance = row[positions[w]]
+                if distance < best_distance and all(
+                        stock[p][w] - reserved.get(p, {}).get(w, 0) >= needs[p] for p in products):
+                    best, best_distance = w, distance
+            return best
+
+        orders = iter(orders)
+        while True:
+            chunk = list(islice(orders, chunk_size))
+            if not chunk:
+                break
+            points = np.array([self.get_coordinates(o.get('customer_location')) for o in chunk],
+                              dtype=float).reshape(-1, 2)
+            dist = haversine_km(points[:, 0, None], points[:, 1, None], coords[None, :, 0], coords[None, :, 1])
+            nearest = dist.argmin(axis=1) if len(ids) else None
+            # One traffic time bucket per chunk
+            now = datetime.now()
+
+            for i, order in enumerate(chunk):
+                needs = self.parse_order_items(order.get('order_items'))
+                row = dist[i].tolist()
+                if not len(ids):
+                    shipments, unfulfilled = [], list(needs)
+                elif not needs:
+                    shipments, unfulfilled = [(int(ids[nearest[i]]), [])], []
+                else:
+                    best = nearest_covering(needs, row)
+                    if best is not None:
+                        shipments, unfulfilled = [(best, list(needs))], []
+                    else:
+                        shipments, unfulfilled = self.split_shipment(
+                            needs, holders, lambda w: row[positions[w]] if w in positions else None)
+                    for warehouse_id, items in shipments:
+                        for product_id in items:
+                            held = reserved.setdefault(product_id, {})
+                            held[warehouse_id] = held.get(warehouse_id, 0) + needs[product_id]
+
+                planned = []
+                for warehouse_id, items in shipments:
+                    distance = row[positions[warehouse_id]]
+                    location = locations[positions[warehouse_id]]
+                    traffic = self.get_traffic_data((location, order.get('customer_location')), now)
+                    weather = self.get_weather_data(order.get('customer_location'))
+                    planned.append({
+                        'warehouse': {'id': warehouse_id, 'location': location, 'distance_km': round(distance, 1)},
+                        'items': items,
+                        'estimated_delivery_time': self.calculate_delivery_time(distance, traffic, weather)
+                    })
+                farthest = max(planned, key=lambda p: p['warehouse']['distance_km']) if planned else None
+                yield {
+                    'order_id': order.get('order_id'),
+                    'warehouse': planned[0]['warehouse'] if planned else None,
+                    'estimated_delivery_time': farthest['estimated_delivery_time'] if farthest else 'N/A',
+                    'shipments': planned,
+                    'unfulfilled_items': unfulfilled
+                }
+
+    def calculate_delivery_time(self, distance, traffic, weather=None):
         """Calculate estimated delivery time"""
         # Assume average speed of 40 km/h
         base_time = (distance / 40) * 60  # minutes
         
+        # Slow down for bad weather
+        condition = ((weather or {}).get('weather_condition') or '').lower()
+        for keyword, factor in self.weather_delay_factors.items():
+            if keyword in condition:
+                base_time *= factor
+                break
+        
         # Add traffic delay
         total_time = base_time + traffic['estimated_delay']
         
         return f"{int(total_time // 60)}h {int(total_time % 60)}m"
     
     def get_coordinates(self, location):
-        """Get coordinates for a location (simplified)"""
+        """Get coordinates for a location (simplified)
+
+        Accepts a city name, a (lat, lng) pair or a dict with lat/lng keys.
+        """
+        if isinstance(location, dict):
+            return (float(location.get('lat', location.get('latitude'))),
+                    float(location.get('lng', location.get('longitude'))))
+        if isinstance(location, (list, tuple)):
+            return float(location[0]), float(location[1])
         # In real implementation, use geocoding API
         location_coords = {
             'Mumbai': (19.0760, 72.8777),
@@ -0,0 +1,34 @@
+"""gunicorn settings for the Flask app.
+
+    gunicorn -c gunicorn.conf.py app:app
+    GUNICORN_PRELOAD=1 gunicorn -c gunicorn.conf.py app:app
+
+Without preloading, each worker imports the app itself; STARTUP_MODE (see
+startup.py) decides how much of that happens before it serves. With
+GUNICORN_PRELOAD=1 (or --preload) the master imports the app, binds, warms every engine
+(imports and caches) and only then forks the workers, which share that
+memory copy-on-write and start serving warm. Each worker drops the pooled
+connections it inherited and opens its own.
+"""
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import components
+        components.warm()
+        # Keep the collector from touching (and so copying) the warmed objects
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import components
+        components.after_fork()
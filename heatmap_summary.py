@@ -0,0 +1,140 @@
+import hashlib
+import json
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from db_pool import read_session
+from index_sync import on_commit
+from models import InventoryItem
+
+
+class HeatmapSummary:
+    """Materialised zone x shelf turnover summary of InventoryItem.
+
+    Loaded with one grouped aggregate, then kept current from committed
+    InventoryItem changes by adding/removing each row's contribution. Every
+    `check_interval` seconds (count, latest last_moved) is compared with the
+    table to catch moves made by other processes; a full reload also runs
+    every `reload_interval` seconds as a backstop for writes that leave
+    last_moved untouched. `external_refresh` works as in WarehouseIndex.
+    """
+
+    def __init__(self, high_turnover_threshold=70, check_interval=5, reload_interval=600):
+        self.high_turnover_threshold = high_turnover_threshold
+        self.check_interval = check_interval
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        # (zone, shelf) -> [turnover sum, rated items, items, latest last_moved]
+        self.cells = {}
+        self.item_count = 0
+        self.latest_move = None
+        self.version = 0
+        self.loaded_at = None
+        self.checked_at = 0.0
+        self.rendered = None  # (version, body, etag)
+        self.external_refresh = False
+        on_commit(InventoryItem, self.apply_changes,
+                  track=('zone', 'shelf_number', 'turnover_rate', 'last_moved'))
+
+    def signature_query(self):
+        return select(func.count(InventoryItem.id), func.max(InventoryItem.last_moved))
+
+    def rows_query(self):
+        return select(
+            InventoryItem.zone, InventoryItem.shelf_number,
+            func.sum(InventoryItem.turnover_rate), func.count(InventoryItem.turnover_rate),
+            func.count(InventoryItem.id), func.max(InventoryItem.last_moved)
+        ).group_by(InventoryItem.zone, InventoryItem.shelf_number)
+
+    def needs_reload(self, signature):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.reload_interval:
+            return True
+        count, latest = signature
+        return count != self.item_count or latest != self.latest_move
+
+    def load(self, signature, rows):
+        """Replace the summary with rows_query() results"""
+        self.cells = {(zone, shelf): [total or 0.0, rated, items, last_moved]
+                      for zone, shelf, total, rated, items, last_moved in rows}
+        self.item_count = sum(cell[2] for cell in self.cells.values())
+        moves = [cell[3] for cell in self.cells.values() if cell[3] is not None]
+        self.latest_move = max(moves) if moves else None
+        self.loaded_at = time.monotonic()
+        self.version += 1
+
+    def ensure_fresh(self):
+        if self.external_refresh:
+            return
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.checked_at < self.check_interval:
+            return
+        with self.lock:
+            if self.loaded_at is not None and now - self.checked_at < self.check_interval:
+                return
+            with read_session() as session:
+                signature = session.execute(self.signature_query()).one()
+                if self.needs_reload(signature):
+                    self.load(signature, session.execute(self.rows_query()).all())
+            self.checked_at = now
+
+    def _apply_row(self, values, sign):
+        key = (values['zone'], values['shelf_number'])
+        cell = self.cells.setdefault(key, [0.0, 0, 0, None])
+        if values['turnover_rate'] is not None:
+            cell[0] += sign * values['turnover_rate']
+            cell[1] += sign
+        cell[2] += sign
+        self.item_count += sign
+        moved = values['last_moved']
+        if sign > 0 and moved is not None:
+            cell[3] = moved if cell[3] is None else max(cell[3], moved)
+            self.latest_move = moved if self.latest_move is None else max(self.latest_move, moved)
+        if cell[2] <= 0:
+            del self.cells[key]
+
+    def apply_changes(self, changes):
+        """on_commit callback: move each changed item's contribution"""
+        with self.lock:
+            if self.loaded_at is None:
+                return
+            for op, values, previous in changes:
+                if op in ('update', 'delete'):
+                    self._apply_row(dict(values, **previous), -1)
+                if op in ('insert', 'update'):
+                    self._apply_row(values, 1)
+            self.version += 1
+
+    def rows(self):
+        """Heatmap cells ordered by zone and shelf"""
+        self.ensure_fresh()
+        heatmap_data = []
+        for (zone, shelf), (total, rated, items, last_moved) in sorted(
+                self.cells.items(), key=lambda kv: (kv[0][0] or '', kv[0][1] or 0)):
+            turnover_rate = round(total / rated, 2) if rated else None
+            heatmap_data.append({
+                'zone': zone,
+                'shelf': shelf,
+                'turnover_rate': turnover_rate,
+                'items': items,
+                'last_moved': last_moved.isoformat() if last_moved else None,
+                'recommendation': 'high_turnover'
+                if turnover_rate is not None and turnover_rate > self.high_turnover_threshold
+                else 'low_turnover'
+            })
+        return heatmap_data
+
+    def render(self):
+        """(JSON body, ETag) for the current summary, rebuilt only when it changed.
+
+        The ETag hashes the body, so every worker process hands out the same
+        tag for the same data.
+        """
+        self.ensure_fresh()
+        rendered = self.rendered
+        if rendered is None or rendered[0] != self.version:
+            version = self.version
+            body = json.dumps({'heatmap': self.rows()})
+            rendered = self.rendered = (version, body, hashlib.sha1(body.encode()).hexdigest())
+        return rendered[1], rendered[2]
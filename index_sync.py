@@ -0,0 +1,73 @@
+"""Keep in-memory indexes in step with committed ORM changes.
+
+Callbacks registered with on_commit() receive the rows of a model that a
+commit inserted, updated or deleted, as plain dicts captured at flush time.
+Changes that never commit are dropped. Writes that bypass the ORM (bulk
+updates, other services) are not seen here, so indexes that depend on this
+also reconcile with the table periodically.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+_callbacks = []
+
+
+def on_commit(model, callback, track=()):
+    """Call callback(changes) after every commit that touched rows of `model`.
+
+    Each change is (op, values, previous): op is 'insert', 'update' or
+    'delete', values maps column names to the row's values and previous maps
+    the changed columns to their old values. Old values are only guaranteed
+    for the columns in `track`; those load their prior value even when set
+    on an expired instance.
+    """
+    for key in track:
+        event.listen(getattr(model, key), 'set', _keep_old_value, active_history=True)
+    _callbacks.append((model, callback))
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def _snapshot(obj):
+    state = inspect(obj)
+    values, previous = {}, {}
+    for attr in state.mapper.column_attrs:
+        values[attr.key] = getattr(obj, attr.key)
+        history = state.attrs[attr.key].history
+        if history.deleted:
+            previous[attr.key] = history.deleted[0]
+    return values, previous
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, flush_context):
+    if not _callbacks:
+        return
+    pending = session.info.setdefault('index_sync', [])
+    for op, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            if op == 'update' and not session.is_modified(obj):
+                continue
+            for model, callback in _callbacks:
+                if isinstance(obj, model):
+                    values, previous = _snapshot(obj)
+                    pending.append((callback, (op, values, previous)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch(session):
+    pending = session.info.pop('index_sync', None)
+    if not pending:
+        return
+    grouped = {}
+    for callback, change in pending:
+        grouped.setdefault(callback, []).append(change)
+    for callback, changes in grouped.items():
+        callback(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('index_sync', None)
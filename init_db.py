@@ -1,3 +1,4 @@
+import hashlib
 import os
 import psycopg2
 from psycopg2 import sql, extras
@@ -26,112 +27,124 @@ else:
     DB_PORT = os.environ.get('DB_PORT', '5432')
 
 REQUIRED_VARS = ['DB_NAME', 'DB_USER', 'DB_PASSWORD']
-missing = [var for var in REQUIRED_VARS if not locals().get(var)]
+missing = [var for var in REQUIRED_VARS if not globals().get(var)]
 if missing:
     print(f"Warning: Missing required database parameters: {', '.join(missing)}")
 
-SCHEMA_SQL = """
--- 1. Create a custom schema for organization (optional, but recommended)
-CREATE SCHEMA IF NOT EXISTS smartflow;
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
 
--- 2. Warehouses table
-CREATE TABLE IF NOT EXISTS smartflow.warehouse (
-    id SERIAL PRIMARY KEY,
-    name VARCHAR(100) NOT NULL,
-    location VARCHAR(100) NOT NULL,
-    latitude DOUBLE PRECISION,
-    longitude DOUBLE PRECISION,
-    capacity INTEGER NOT NULL
-);
+# First line of a migration that must run outside a transaction
+# (e.g. CREATE INDEX CONCURRENTLY); its statements then run one by one
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
 
--- 3. Dock Scheduling table
-CREATE TABLE IF NOT EXISTS smartflow.dock_schedule (
-    id SERIAL PRIMARY KEY,
-    warehouse_id INTEGER NOT NULL REFERENCES smartflow.warehouse(id) ON DELETE CASCADE,
-    truck_id VARCHAR(50) NOT NULL,
-    dock_number INTEGER NOT NULL,
-    scheduled_time TIMESTAMP NOT NULL,
-    estimated_duration INTEGER, -- in minutes
-    actual_duration INTEGER,
-    status VARCHAR(20) DEFAULT 'scheduled', -- scheduled, in_progress, completed
-    cargo_type VARCHAR(50),
-    truck_size VARCHAR(20)
+MIGRATIONS_TABLE_SQL = """
+CREATE SCHEMA IF NOT EXISTS smartflow;
+CREATE TABLE IF NOT EXISTS smartflow.schema_migrations (
+    version VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    checksum VARCHAR(64) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+"""
 
--- 4. Inventory table
-CREATE TABLE IF NOT EXISTS smartflow.inventory_item (
-    id SERIAL PRIMARY KEY,
-    warehouse_id INTEGER NOT NULL REFERENCES smartflow.warehouse(id) ON DELETE CASCADE,
-    product_id VARCHAR(50) NOT NULL,
-    product_name VARCHAR(200) NOT NULL,
-    quantity INTEGER NOT NULL,
-    zone VARCHAR(10),
-    shelf_number INTEGER,
-    turnover_rate FLOAT,
-    last_moved TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+# Tables partitioned by month (migrations/0003_partition_by_time.sql, 0005_sentiment_events.sql)
+PARTITIONED_TABLES = ('dock_schedule', 'weather_data', 'sentiment_event')
+PARTITION_MONTHS_AHEAD = 3
 
--- 5. Delivery Route table
-CREATE TABLE IF NOT EXISTS smartflow.delivery_route (
-    id SERIAL PRIMARY KEY,
-    order_id VARCHAR(50) NOT NULL,
-    source_warehouse_id INTEGER REFERENCES smartflow.warehouse(id) ON DELETE SET NULL,
-    destination_address TEXT NOT NULL,
-    destination_lat DOUBLE PRECISION,
-    destination_lng DOUBLE PRECISION,
-    vehicle_type VARCHAR(50) NOT NULL,
-    distance_km FLOAT,
-    estimated_duration INTEGER, -- in minutes
-    carbon_emissions FLOAT, -- kg CO2
-    delivery_status VARCHAR(20) DEFAULT 'pending'
-);
+def get_connection():
+    return psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT
+    )
 
--- 6. Customer Profile table
-CREATE TABLE IF NOT EXISTS smartflow.customer_profile (
-    id SERIAL PRIMARY KEY,
-    customer_id VARCHAR(50) NOT NULL UNIQUE,
-    name VARCHAR(100),
-    location VARCHAR(100),
-    age INTEGER,
-    income_level VARCHAR(20),
-    preferences JSONB,
-    sentiment_history JSONB,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+def list_migrations():
+    """(version, name, path) for every migrations/NNNN_name.sql, in order"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename.endswith('.sql'):
+            version, _, name = filename[:-4].partition('_')
+            migrations.append((version, name, os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
 
--- 7. (Optional) Weather Data table for external API results caching
-CREATE TABLE IF NOT EXISTS smartflow.weather_data (
-    id SERIAL PRIMARY KEY,
-    location VARCHAR(100) NOT NULL,
-    latitude DOUBLE PRECISION,
-    longitude DOUBLE PRECISION,
-    temperature FLOAT,
-    humidity FLOAT,
-    weather_condition VARCHAR(50),
-    wind_speed FLOAT,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
-"""
+def split_statements(sql_text):
+    """Split a no-transaction migration on semicolons that end a line"""
+    statements, current = [], []
+    for line in sql_text.splitlines():
+        current.append(line)
+        if line.rstrip().endswith(';'):
+            statement = '\n'.join(current).strip()
+            if any(l.strip() and not l.strip().startswith('--') for l in current):
+                statements.append(statement)
+            current = []
+    return statements
+
+def migrate(conn):
+    """Apply pending migrations in version order; returns the versions applied"""
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(MIGRATIONS_TABLE_SQL)
+        cur.execute("SELECT version, checksum FROM smartflow.schema_migrations")
+        applied = dict(cur.fetchall())
+
+    done = []
+    for version, name, path in list_migrations():
+        with open(path) as f:
+            sql_text = f.read()
+        checksum = hashlib.sha256(sql_text.encode()).hexdigest()
+        if version in applied:
+            if applied[version] != checksum:
+                print(f"Warning: migration {version}_{name} was edited after it was applied")
+            continue
+
+        print(f"Applying migration {version}_{name}")
+        record = ("INSERT INTO smartflow.schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                  (version, name, checksum))
+        if sql_text.startswith(NO_TRANSACTION_MARKER):
+            # Not atomic: a failure leaves it unrecorded, so the next run repeats it
+            with conn.cursor() as cur:
+                for statement in split_statements(sql_text):
+                    cur.execute(statement)
+                cur.execute(*record)
+        else:
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql_text)
+                    cur.execute(*record)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+        done.append(version)
+    return done
+
+def maintain_partitions(conn, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Create the monthly partitions for the coming months (idempotent)"""
+    with conn.cursor() as cur:
+        for table in PARTITIONED_TABLES:
+            cur.execute("SELECT to_regclass(%s)", (f'smartflow.{table}_default',))
+            if cur.fetchone()[0] is None:
+                continue
+            cur.execute("""
+                SELECT smartflow.create_monthly_partitions(
+                    %s, CURRENT_DATE, (CURRENT_DATE + %s * INTERVAL '1 month')::date)
+            """, (table, months_ahead))
+    conn.commit()
 
 def init_db():
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        conn.autocommit = True
-        cur = conn.cursor()
-        cur.execute(SCHEMA_SQL)
-        print("Database initialized successfully.")
+        conn = get_connection()
+        applied = migrate(conn)
+        maintain_partitions(conn)
+        print(f"Database initialized successfully ({len(applied)} migration(s) applied).")
     except Exception as e:
         print(f"Error initializing database: {e}")
     finally:
-        if 'cur' in locals():
-            cur.close()
         if 'conn' in locals():
             conn.close()
 
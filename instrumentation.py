@@ -0,0 +1,478 @@
+"""Latency histograms for engine methods, requests and DB queries, in Prometheus format.
+
+Engine methods are wrapped with @timed; every request (Flask via init_app,
+ASGI via MetricsMiddleware) records its latency, its DB query count and
+its DB time; every SQL statement records its own duration. Everything goes
+into log-linear (HDR-style) histograms with 16 sub-buckets per power of two,
+so any recorded value is within ~6% of its bucket bound, and is served at
+/metrics. METRICS_ENABLED=0 turns it all off.
+
+A request carrying `X-Profile: <PROFILE_TOKEN>` is sampled by a stack
+profiler for its duration; the folded stacks (flamegraph.pl / speedscope
+input) are written under PROFILE_DIR and the path is returned in the
+X-Profile response header. Without PROFILE_TOKEN the header is ignored.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'smartflow-profiles'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.001))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Exported `le` bounds; the HDR buckets underneath are much finer
+SECONDS_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                  0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BOUNDS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _bucket(value):
+    """HDR bucket index of a non-negative integer"""
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def _bucket_high(index):
+    """Largest value that lands in a bucket"""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    return (((index & (SUB_BUCKETS - 1)) + SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers (ns, or plain counts)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (64 << SUB_BUCKET_BITS)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        index = _bucket(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.total, self.sum, self.max
+
+    @staticmethod
+    def quantile(counts, total, q):
+        """Upper bound of the bucket holding the q-th value"""
+        if not total:
+            return 0
+        rank, seen = q * total, 0
+        for index, count in enumerate(counts):
+            seen += count
+            if count and seen >= rank:
+                return _bucket_high(index)
+        return 0
+
+    @staticmethod
+    def cumulative(counts, bounds):
+        """Counts at or below each bound (bounds in recorded units, ascending)"""
+        result, seen, index = [], 0, 0
+        for bound in bounds:
+            while index < len(counts) and _bucket_high(index) <= bound:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class HistogramFamily:
+    """One metric name; a Histogram per combination of label values"""
+
+    def __init__(self, name, help_text, label_names=(), bounds=SECONDS_BOUNDS, scale=1e-9):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.bounds = bounds
+        self.scale = scale  # recorded unit -> exported unit
+        self.children = {}
+        self.lock = threading.Lock()
+        FAMILIES.append(self)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, Histogram())
+        return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        quantile_lines = []
+        raw_bounds = [round(bound / self.scale) for bound in self.bounds]
+        for values, child in sorted(self.children.items()):
+            counts, total, value_sum, _ = child.snapshot()
+            labels = list(zip(self.label_names, values))
+            for bound, seen in zip(self.bounds, Histogram.cumulative(counts, raw_bounds)):
+                lines.append(_sample(f'{self.name}_bucket', labels + [('le', bound)], seen))
+            lines.append(_sample(f'{self.name}_bucket', labels + [('le', '+Inf')], total))
+            lines.append(_sample(f'{self.name}_sum', labels, f'{value_sum * self.scale:.9g}'))
+            lines.append(_sample(f'{self.name}_count', labels, total))
+            for q in QUANTILES:
+                value = Histogram.quantile(counts, total, q) * self.scale
+                quantile_lines.append(_sample(f'{self.name}_quantile', labels + [('quantile', q)], f'{value:.9g}'))
+        if quantile_lines:
+            lines += [f'# HELP {self.name}_quantile {self.help_text} (quantiles, bucket upper bounds)',
+                      f'# TYPE {self.name}_quantile gauge'] + quantile_lines
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.values = Counter()
+        self.lock = threading.Lock()
+        FAMILIES.append(self)
+
+    def inc(self, *values):
+        with self.lock:
+            self.values[values] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            items = sorted(self.values.items())
+        for values, count in items:
+            lines.append(_sample(self.name, zip(self.label_names, values), count))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels, value):
+    labels = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+    return f'{name}{{{labels}}} {value}' if labels else f'{name} {value}'
+
+
+FAMILIES = []
+SPAN_SECONDS = HistogramFamily('smartflow_span_seconds', 'Time spent in instrumented engine methods', ('span',))
+REQUEST_SECONDS = HistogramFamily('smartflow_http_request_seconds', 'Request latency until the response starts',
+                                  ('method', 'endpoint'))
+REQUESTS = CounterFamily('smartflow_http_requests_total', 'Requests by endpoint and status',
+                         ('method', 'endpoint', 'status'))
+QUERY_SECONDS = HistogramFamily('smartflow_db_query_seconds', 'Duration of single SQL statements')
+REQUEST_QUERIES = HistogramFamily('smartflow_db_queries_per_request', 'SQL statements issued per request',
+                                  ('endpoint',), COUNT_BOUNDS, 1)
+REQUEST_DB_SECONDS = HistogramFamily('smartflow_db_seconds_per_request', 'Time per request spent in SQL statements',
+                                     ('endpoint',))
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for family in FAMILIES:
+        lines += family.render()
+    return '\n'.join(lines) + '\n'
+
+
+# Spans
+
+class span:
+    """Context manager recording the time spent in its block under `name`"""
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, name):
+        self.histogram = SPAN_SECONDS.labels(name)
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.started)
+
+
+def timed(fn=None, name=None):
+    """Decorator recording each call of fn under its qualified name.
+
+    Coroutine functions are timed until they return; generator functions
+    are timed for the work done inside them, not while the consumer holds
+    the generator.
+    """
+    if fn is None:
+        return functools.partial(timed, name=name)
+    if not ENABLED:
+        return fn
+    histogram = SPAN_SECONDS.labels(name or fn.__qualname__)
+    clock = time.perf_counter_ns
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def timed_coroutine(*args, **kwargs):
+            started = clock()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                histogram.record(clock() - started)
+        return timed_coroutine
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def timed_generator(*args, **kwargs):
+            inner, spent = fn(*args, **kwargs), 0
+            try:
+                while True:
+                    started = clock()
+                    try:
+                        item = next(inner)
+                    except StopIteration:
+                        return
+                    finally:
+                        spent += clock() - started
+                    yield item
+            finally:
+                inner.close()
+                histogram.record(spent)
+        return timed_generator
+
+    @functools.wraps(fn)
+    def timed_call(*args, **kwargs):
+        started = clock()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            histogram.record(clock() - started)
+    return timed_call
+
+
+# Per-request DB accounting
+
+class RequestStats:
+    __slots__ = ('queries', 'query_ns')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_ns = 0
+
+
+# Set for the duration of a request; async sessions run their queries in the
+# request task's context, so they are counted too
+_request_stats = contextvars.ContextVar('smartflow_request_stats', default=None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if ENABLED:
+        conn.info.setdefault('query_started', []).append(time.perf_counter_ns())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter_ns() - started.pop()
+    QUERY_SECONDS.labels().record(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_ns += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _query_failed(context):
+    # after_cursor_execute never runs for a failed statement; without this
+    # its start time would stay on the pooled connection for good
+    conn = context.connection
+    if conn is not None and context.execution_context is not None:
+        started = conn.info.get('query_started')
+        if started:
+            started.pop()
+
+
+def _finish(method, endpoint, status, started, stats):
+    elapsed = time.perf_counter_ns() - started
+    REQUEST_SECONDS.labels(method, endpoint).record(elapsed)
+    REQUESTS.inc(method, endpoint, str(status))
+    REQUEST_QUERIES.labels(endpoint).record(stats.queries)
+    REQUEST_DB_SECONDS.labels(endpoint).record(stats.query_ns)
+    return elapsed
+
+
+def server_timing(stats, elapsed_ns):
+    return f'db;dur={stats.query_ns / 1e6:.2f};desc="{stats.queries} queries", app;dur={elapsed_ns / 1e6:.2f}'
+
+
+# Sampling profiler
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every `interval` seconds.
+
+    Runs in a helper thread, so the profiled code is untouched; `active`
+    can veto samples (e.g. when the event loop is running another task).
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL, active=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.active = active
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.active is not None and not self.active():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_qualname} ({os.path.basename(code.co_filename)})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self, label):
+        """Stop sampling and write the folded stacks; returns the file path"""
+        self.stopped.set()
+        self.thread.join()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        slug = label.strip('/').replace('/', '_') or 'root'
+        path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{slug}-{uuid.uuid4().hex[:8]}.folded')
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+
+def profiling_requested(header_value):
+    return PROFILE_TOKEN is not None and header_value == PROFILE_TOKEN
+
+
+# Flask
+
+def init_app(app):
+    """Request metrics, Server-Timing, X-Profile and /metrics for a Flask app"""
+    if not ENABLED:
+        return
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_request():
+        g.metrics = (time.perf_counter_ns(), RequestStats())
+        g.metrics_token = _request_stats.set(g.metrics[1])
+        if profiling_requested(request.headers.get('X-Profile')):
+            g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+    @app.after_request
+    def finish_request(response):
+        started, stats = g.pop('metrics', (None, None))
+        if started is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        elapsed = _finish(request.method, endpoint, response.status_code, started, stats)
+        response.headers['Server-Timing'] = server_timing(stats, elapsed)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            response.headers['X-Profile'] = profiler.stop(endpoint)
+        return response
+
+    @app.teardown_request
+    def teardown(exc):
+        started, stats = g.pop('metrics', (None, None))
+        if started is not None:
+            # The view raised, so finish_request never ran
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            _finish(request.method, endpoint, 500, started, stats)
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop(request.path)
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            _request_stats.reset(token)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
+# ASGI
+
+class MetricsMiddleware:
+    """ASGI middleware doing what init_app does for Flask.
+
+    `routes` maps matched endpoints back to their path templates, which are
+    used as the endpoint label. Serve render_metrics() at /metrics yourself.
+    """
+
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.paths = {route.endpoint: route.path for route in routes}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not ENABLED:
+            return await self.app(scope, receive, send)
+
+        started, stats = time.perf_counter_ns(), RequestStats()
+        token = _request_stats.set(stats)
+        profiler = None
+        headers = dict(scope['headers'])
+        if profiling_requested(headers.get(b'x-profile', b'').decode('latin-1')):
+            task = asyncio.current_task()
+            loop = task.get_loop()
+            # The loop thread interleaves requests; only sample while ours runs
+            profiler = SamplingProfiler(threading.get_ident(), active=lambda: asyncio.current_task(loop) is task)
+            profiler.start()
+        status = 500
+        response_started = False
+
+        async def send_with_timing(message):
+            nonlocal status, response_started
+            if message['type'] == 'http.response.start':
+                status, response_started = message['status'], True
+                elapsed = _finish(scope['method'], self.endpoint(scope), status, started, stats)
+                extra = [(b'server-timing', server_timing(stats, elapsed).encode('latin-1'))]
+                if profiler is not None:
+                    extra.append((b'x-profile', profiler.stop(self.endpoint(scope)).encode('latin-1')))
+                message = dict(message, headers=list(message.get('headers', [])) + extra)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if not response_started:
+                _finish(scope['method'], self.endpoint(scope), status, started, stats)
+                if profiler is not None:
+                    profiler.stop(scope['path'])
+            _request_stats.reset(token)
+
+    def endpoint(self, scope):
+        return self.paths.get(scope.get('endpoint'), 'unmatched')
@@ -0,0 +1,296 @@
+"""Bulk-load CSV or Parquet files into the smartflow tables.
+
+    python load_data.py inventory_item stock.parquet [--chunk-size 200000] [--rejects bad_rows.csv]
+
+Files are read in chunks. Each chunk is validated with vectorised checks,
+streamed into a temporary staging table with COPY FROM STDIN, and merged
+into the target with one INSERT ... ON CONFLICT DO UPDATE keyed on the
+table's natural key (see migrations/0004_upsert_keys.sql and
+0007_inventory_shelf_key.sql). Each chunk
+commits on its own, so memory stays flat; because the merge is an upsert,
+re-running a file after a failure is safe. When a key appears more than
+once, the last row in the file wins. Rows that fail validation or point at
+a warehouse that doesn't exist are skipped and counted.
+
+inventory_item is keyed per shelf: (product_id, warehouse_id, zone,
+shelf_number). A file without zone or shelf_number loads those as NULL.
+
+warehouse and delivery_route are keyed on id. Files without an id column
+are appended instead.
+"""
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+
+from init_db import get_connection
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# table -> columns (name, SQL type), required columns, upsert key; optional_key
+# columns are part of the key but loaded as NULL when a file leaves them out
+TABLES = {
+    'warehouse': {
+        'columns': [('id', 'INTEGER'), ('name', 'VARCHAR(100)'), ('location', 'VARCHAR(100)'),
+                    ('latitude', 'DOUBLE PRECISION'), ('longitude', 'DOUBLE PRECISION'),
+                    ('capacity', 'INTEGER')],
+        'required': ['name', 'location', 'capacity'],
+        'key': ['id']
+    },
+    'inventory_item': {
+        'columns': [('warehouse_id', 'INTEGER'), ('product_id', 'VARCHAR(50)'), ('product_name', 'VARCHAR(200)'),
+                    ('quantity', 'INTEGER'), ('zone', 'VARCHAR(10)'), ('shelf_number', 'INTEGER'),
+                    ('turnover_rate', 'FLOAT'), ('last_moved', 'TIMESTAMP')],
+        'required': ['warehouse_id', 'product_id', 'product_name', 'quantity'],
+        'key': ['product_id', 'warehouse_id', 'zone', 'shelf_number'],
+        'optional_key': ['zone', 'shelf_number'],
+        'references': {'warehouse_id': 'warehouse'}
+    },
+    'delivery_route': {
+        'columns': [('id', 'INTEGER'), ('order_id', 'VARCHAR(50)'), ('source_warehouse_id', 'INTEGER'),
+                    ('destination_address', 'TEXT'), ('destination_lat', 'DOUBLE PRECISION'),
+                    ('destination_lng', 'DOUBLE PRECISION'), ('vehicle_type', 'VARCHAR(50)'),
+                    ('distance_km', 'FLOAT'), ('estimated_duration', 'INTEGER'), ('carbon_emissions', 'FLOAT'),
+                    ('delivery_status', 'VARCHAR(20)'), ('route_code', 'VARCHAR(50)'), ('stop_sequence', 'INTEGER'),
+                    ('created_at', 'TIMESTAMP')],
+        'required': ['order_id', 'destination_address', 'vehicle_type'],
+        'not_null': ['created_at'],
+        'key': ['id'],
+        'references': {'source_warehouse_id': 'warehouse'}
+    },
+    'weather_data': {
+        'columns': [('location', 'VARCHAR(100)'), ('latitude', 'DOUBLE PRECISION'),
+                    ('longitude', 'DOUBLE PRECISION'), ('temperature', 'FLOAT'), ('humidity', 'FLOAT'),
+                    ('weather_condition', 'VARCHAR(50)'), ('wind_speed', 'FLOAT'), ('timestamp', 'TIMESTAMP')],
+        'required': ['location', 'timestamp'],
+        'key': ['location', 'timestamp']
+    }
+}
+
+INTEGER_TYPES = ('INTEGER',)
+FLOAT_TYPES = ('FLOAT', 'DOUBLE PRECISION')
+
+# column -> (min, max) allowed when present
+RANGES = {
+    'latitude': (-90, 90), 'longitude': (-180, 180),
+    'destination_lat': (-90, 90), 'destination_lng': (-180, 180),
+    'capacity': (0, None), 'quantity': (0, None), 'humidity': (0, 100),
+    'distance_km': (0, None), 'estimated_duration': (0, None), 'carbon_emissions': (0, None),
+    'wind_speed': (0, None), 'turnover_rate': (0, None)
+}
+
+
+def read_chunks(path, chunk_size, file_format=None):
+    """Yield DataFrames of at most chunk_size rows from a CSV or Parquet file"""
+    file_format = file_format or ('parquet' if path.endswith(('.parquet', '.pq')) else 'csv')
+    if file_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet needs pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        # Everything as text; validate() does the typing so bad values are rejected, not fatal
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[''])
+
+
+def validate(frame, spec):
+    """Coerce a chunk to the table's columns; returns (valid rows, rejected rows with reasons)"""
+    columns = [name for name, _ in spec['columns'] if name in frame.columns]
+    missing = [c for c in spec['required'] if c not in frame.columns]
+    if missing:
+        raise SystemExit(f"Input is missing required column(s): {', '.join(missing)}")
+
+    for name in spec.get('optional_key', []):
+        if name not in frame.columns:
+            frame = frame.assign(**{name: None})
+            columns.append(name)
+    original = frame[columns]
+    frame = original.copy()
+    reasons = pd.Series('', index=frame.index)
+
+    def reject(mask, reason):
+        reasons[mask & (reasons == '')] = reason
+
+    for name, sql_type in spec['columns']:
+        if name not in frame.columns:
+            continue
+        raw = frame[name]
+        if sql_type in INTEGER_TYPES + FLOAT_TYPES:
+            values = pd.to_numeric(raw, errors='coerce')
+            reject(values.isna() & raw.notna(), f'{name}: not a number')
+            if sql_type in INTEGER_TYPES:
+                reject(values.notna() & (values % 1 != 0), f'{name}: not an integer')
+                values = values.round().astype('Int64')
+            frame[name] = values
+        elif sql_type == 'TIMESTAMP':
+            values = pd.to_datetime(raw, errors='coerce')
+            reject(values.isna() & raw.notna(), f'{name}: not a timestamp')
+            frame[name] = values
+        else:
+            width = int(sql_type[sql_type.index('(') + 1:-1]) if '(' in sql_type else None
+            values = raw.astype('string')
+            if width:
+                reject(values.str.len() > width, f'{name}: longer than {width} characters')
+            frame[name] = values
+        low, high = RANGES.get(name, (None, None))
+        if low is not None:
+            reject(frame[name].notna() & (frame[name] < low), f'{name}: below {low}')
+        if high is not None:
+            reject(frame[name].notna() & (frame[name] > high), f'{name}: above {high}')
+
+    # not_null: optional columns that, when the file has them, can't be empty
+    for name in spec['required'] + [c for c in spec.get('not_null', []) if c in frame.columns]:
+        reject(frame[name].isna(), f'{name}: missing')
+
+    bad = reasons != ''
+    rejected = original[bad].assign(reject_reason=reasons[bad])
+    return frame[~bad], rejected
+
+
+def create_staging(cur, table, spec, columns):
+    staging = f'{table}_staging'
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging)))
+    cur.execute(sql.SQL("CREATE TEMP TABLE {} ({}, load_line BIGINT) ON COMMIT DELETE ROWS").format(
+        sql.Identifier(staging),
+        sql.SQL(', ').join(sql.SQL('{} {}').format(sql.Identifier(name), sql.SQL(sql_type))
+                           for name, sql_type in spec['columns'] if name in columns)))
+    return staging
+
+
+def drop_orphans(cur, staging, spec, columns):
+    """Delete staged rows whose foreign keys point nowhere; returns their load_lines by column"""
+    orphans = {}
+    for column, parent in spec.get('references', {}).items():
+        if column not in columns:
+            continue
+        cur.execute(sql.SQL("""
+            DELETE FROM {staging} s
+            WHERE s.{column} IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM smartflow.{parent} p WHERE p.id = s.{column})
+            RETURNING load_line
+        """).format(staging=sql.Identifier(staging), column=sql.Identifier(column), parent=sql.Identifier(parent)))
+        orphans[column] = [r[0] for r in cur.fetchall()]
+    return orphans
+
+
+def merge_sql(table, staging, columns, key):
+    """INSERT ... SELECT DISTINCT ON (key) ... ON CONFLICT (key) DO UPDATE"""
+    target = sql.SQL('smartflow.{}').format(sql.Identifier(table))
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    if not key:
+        return sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+            target, column_list, column_list, sql.Identifier(staging))
+    key_list = sql.SQL(', ').join(map(sql.Identifier, key))
+    updates = [c for c in columns if c not in key]
+    if updates:
+        # Rows that come in unchanged are left alone instead of rewritten
+        action = sql.SQL("DO UPDATE SET {} WHERE ({}) IS DISTINCT FROM ({})").format(
+            sql.SQL(', ').join(sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c)) for c in updates),
+            sql.SQL(', ').join(sql.SQL('current.{}').format(sql.Identifier(c)) for c in updates),
+            sql.SQL(', ').join(sql.SQL('EXCLUDED.{}').format(sql.Identifier(c)) for c in updates))
+    else:
+        action = sql.SQL("DO NOTHING")
+    # One row per key (the file's last), or ON CONFLICT would hit the same row twice
+    return sql.SQL("""
+        INSERT INTO {target} AS current ({columns})
+        SELECT DISTINCT ON ({key}) {columns} FROM {staging} ORDER BY {key}, load_line DESC
+        ON CONFLICT ({key}) {action}
+    """).format(target=target, columns=column_list, key=key_list, staging=sql.Identifier(staging), action=action)
+
+
+def copy_chunk(cur, staging, frame, first_line):
+    """Stream a validated chunk into the staging table with COPY"""
+    frame = frame.assign(load_line=np.arange(first_line, first_line + len(frame)))
+    if pa is not None:
+        # Arrow's CSV writer is several times faster than DataFrame.to_csv;
+        # it quotes strings and leaves NULLs empty, which is COPY's default
+        buffer = io.BytesIO()
+        pa_csv.write_csv(pa.Table.from_pandas(frame, preserve_index=False), buffer,
+                         write_options=pa_csv.WriteOptions(include_header=False))
+        options = sql.SQL("FORMAT csv")
+    else:
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, na_rep='\\N', date_format='%Y-%m-%d %H:%M:%S.%f')
+        options = sql.SQL("FORMAT csv, NULL '\\N'")
+    buffer.seek(0)
+    cur.copy_expert(sql.SQL("COPY {} ({}) FROM STDIN WITH ({})").format(
+        sql.Identifier(staging), sql.SQL(', ').join(map(sql.Identifier, frame.columns)), options), buffer)
+
+
+def load(table, path, chunk_size=200000, file_format=None, rejects_path=None):
+    spec = TABLES[table]
+    conn = get_connection()
+    started = time.monotonic()
+    loaded = rejected = line = 0
+    staging = statement = None
+    try:
+        with conn.cursor() as cur:
+            # A lost commit after a crash just means re-running the (idempotent) load
+            cur.execute("SET synchronous_commit = off")
+            cur.execute("SET work_mem = '256MB'")
+            for chunk in read_chunks(path, chunk_size, file_format):
+                valid, bad = validate(chunk, spec)
+                if staging is None:
+                    columns = list(valid.columns)
+                    key = spec['key'] if all(k in columns for k in spec['key']) else []
+                    staging = create_staging(cur, table, spec, columns)
+                    statement = merge_sql(table, staging, columns, key)
+                    if not key:
+                        print(f"No {'/'.join(spec['key'])} column: appending rows instead of upserting")
+
+                if len(valid):
+                    copy_chunk(cur, staging, valid, line)
+                    for column, lines in drop_orphans(cur, staging, spec, columns).items():
+                        if lines:
+                            orphans = valid.iloc[np.asarray(lines) - line]
+                            valid = valid.drop(orphans.index)
+                            bad = pd.concat([bad, chunk.loc[orphans.index, columns].assign(
+                                reject_reason=f'{column}: no such warehouse')])
+                    cur.execute(statement)
+                conn.commit()  # also empties the staging table (ON COMMIT DELETE ROWS)
+
+                if len(bad) and rejects_path:
+                    bad.to_csv(rejects_path, mode='a', index=False, header=rejected == 0)
+                line += len(chunk)
+                loaded += len(valid)
+                rejected += len(bad)
+                elapsed = time.monotonic() - started
+                print(f"  {loaded:,} rows loaded, {rejected:,} rejected ({loaded / elapsed:,.0f} rows/s)")
+
+            if staging and 'id' in columns:
+                # Explicit ids bypass the sequence; move it past them
+                cur.execute(sql.SQL("""
+                    SELECT setval(pg_get_serial_sequence(%s, 'id'), GREATEST(max(id), 1)) FROM smartflow.{}
+                """).format(sql.Identifier(table)), (f'smartflow.{table}',))
+                conn.commit()
+    finally:
+        conn.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Loaded {loaded:,} rows into smartflow.{table} in {elapsed:.1f}s "
+          f"({loaded / elapsed if elapsed else 0:,.0f} rows/s); {rejected:,} rejected"
+          + (f" (see {rejects_path})" if rejected and rejects_path else ""))
+    return loaded, rejected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load CSV/Parquet files with COPY")
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('path')
+    parser.add_argument('--chunk-size', type=int, default=200000)
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="default: from the file extension")
+    parser.add_argument('--rejects', help="append rejected rows, with the reason, to this CSV")
+    args = parser.parse_args()
+    if args.rejects and os.path.exists(args.rejects):
+        os.remove(args.rejects)
+    load(args.table, args.path, args.chunk_size, args.format, args.rejects)
@@ -0,0 +1,109 @@
+-- Baseline: the schema init_db.py created before migrations existed.
+-- Every statement is idempotent, so databases built from the old script
+-- record this version without changes.
+
+-- 1. Create a custom schema for organization (optional, but recommended)
+CREATE SCHEMA IF NOT EXISTS smartflow;
+
+-- 2. Warehouses table
+CREATE TABLE IF NOT EXISTS smartflow.warehouse (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    location VARCHAR(100) NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    capacity INTEGER NOT NULL
+);
+
+-- 3. Dock Scheduling table
+CREATE TABLE IF NOT EXISTS smartflow.dock_schedule (
+    id SERIAL PRIMARY KEY,
+    warehouse_id INTEGER NOT NULL REFERENCES smartflow.warehouse(id) ON DELETE CASCADE,
+    truck_id VARCHAR(50) NOT NULL,
+    dock_number INTEGER NOT NULL,
+    scheduled_time TIMESTAMP NOT NULL,
+    estimated_duration INTEGER, -- in minutes
+    actual_duration INTEGER,
+    status VARCHAR(20) DEFAULT 'scheduled', -- scheduled, in_progress, completed
+    cargo_type VARCHAR(50),
+    truck_size VARCHAR(20)
+);
+
+-- 4. Inventory table
+CREATE TABLE IF NOT EXISTS smartflow.inventory_item (
+    id SERIAL PRIMARY KEY,
+    warehouse_id INTEGER NOT NULL REFERENCES smartflow.warehouse(id) ON DELETE CASCADE,
+    product_id VARCHAR(50) NOT NULL,
+    product_name VARCHAR(200) NOT NULL,
+    quantity INTEGER NOT NULL,
+    zone VARCHAR(10),
+    shelf_number INTEGER,
+    turnover_rate FLOAT,
+    last_moved TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 5. Delivery Route table
+CREATE TABLE IF NOT EXISTS smartflow.delivery_route (
+    id SERIAL PRIMARY KEY,
+    order_id VARCHAR(50) NOT NULL,
+    source_warehouse_id INTEGER REFERENCES smartflow.warehouse(id) ON DELETE SET NULL,
+    destination_address TEXT NOT NULL,
+    destination_lat DOUBLE PRECISION,
+    destination_lng DOUBLE PRECISION,
+    vehicle_type VARCHAR(50) NOT NULL,
+    distance_km FLOAT,
+    estimated_duration INTEGER, -- in minutes
+    carbon_emissions FLOAT, -- kg CO2
+    delivery_status VARCHAR(20) DEFAULT 'pending',
+    route_code VARCHAR(50), -- multi-stop tour from RouteOptimizer
+    stop_sequence INTEGER
+);
+ALTER TABLE smartflow.delivery_route ADD COLUMN IF NOT EXISTS route_code VARCHAR(50);
+ALTER TABLE smartflow.delivery_route ADD COLUMN IF NOT EXISTS stop_sequence INTEGER;
+
+-- 6. Customer Profile table
+CREATE TABLE IF NOT EXISTS smartflow.customer_profile (
+    id SERIAL PRIMARY KEY,
+    customer_id VARCHAR(50) NOT NULL UNIQUE,
+    name VARCHAR(100),
+    location VARCHAR(100),
+    age INTEGER,
+    income_level VARCHAR(20),
+    preferences JSONB,
+    sentiment_history JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 7. (Optional) Weather Data table for external API results caching
+CREATE TABLE IF NOT EXISTS smartflow.weather_data (
+    id SERIAL PRIMARY KEY,
+    location VARCHAR(100) NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    temperature FLOAT,
+    humidity FLOAT,
+    weather_condition VARCHAR(50),
+    wind_speed FLOAT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+-- Latest reading per location (WeatherCache uses DISTINCT ON over this)
+CREATE INDEX IF NOT EXISTS weather_data_location_timestamp_idx
+    ON smartflow.weather_data (location, timestamp DESC);
+
+-- 8. Progress of resumable batch jobs (e.g. backfill_carbon.py)
+CREATE TABLE IF NOT EXISTS smartflow.job_checkpoint (
+    job_name VARCHAR(100) PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    state JSONB,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 9. Product catalog used by the recommendation engine
+CREATE TABLE IF NOT EXISTS smartflow.product (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    price FLOAT,
+    rating FLOAT
+);
@@ -0,0 +1,23 @@
+-- migrate: no-transaction
+-- Indexes for the hot filters, built without blocking writes. CONCURRENTLY
+-- cannot run inside a transaction, so each statement commits on its own.
+-- A build that fails leaves an INVALID index behind; dropping first lets a
+-- re-run of this migration start clean.
+
+-- DockScheduler.sync_timeline: warehouse_id = ? AND scheduled_time >= ?
+DROP INDEX CONCURRENTLY IF EXISTS smartflow.dock_schedule_warehouse_time_idx;
+CREATE INDEX CONCURRENTLY dock_schedule_warehouse_time_idx
+    ON smartflow.dock_schedule (warehouse_id, scheduled_time);
+
+-- Stock lookups by product, then warehouse
+DROP INDEX CONCURRENTLY IF EXISTS smartflow.inventory_item_product_warehouse_idx;
+CREATE INDEX CONCURRENTLY inventory_item_product_warehouse_idx
+    ON smartflow.inventory_item (product_id, warehouse_id);
+
+-- Pending/planned deliveries (RouteOptimizer, carbon backfill)
+DROP INDEX CONCURRENTLY IF EXISTS smartflow.delivery_route_status_idx;
+CREATE INDEX CONCURRENTLY delivery_route_status_idx
+    ON smartflow.delivery_route (delivery_status);
+
+-- weather_data (location, timestamp DESC) already exists from the baseline
+-- as weather_data_location_timestamp_idx.
@@ -0,0 +1,93 @@
+-- Range-partition dock_schedule by scheduled_time and weather_data by
+-- timestamp, one partition per month plus a default partition. Old rows
+-- are copied into the partitioned tables, which take over the original
+-- names, id sequences and indexes. The copy rewrites both tables under
+-- lock, so run this one in a quiet window.
+--
+-- init_db.py keeps creating partitions ahead of time via
+-- smartflow.create_monthly_partitions(). Rows for a month that has no
+-- partition land in the default partition. A month's partition cannot be
+-- created while the default partition holds rows for that month.
+
+CREATE OR REPLACE FUNCTION smartflow.create_monthly_partitions(parent TEXT, first_day DATE, last_day DATE)
+RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    month_start DATE := date_trunc('month', first_day);
+BEGIN
+    WHILE month_start <= last_day LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS smartflow.%I PARTITION OF smartflow.%I FOR VALUES FROM (%L) TO (%L)',
+                       parent || '_' || to_char(month_start, 'YYYYMM'), parent,
+                       month_start, (month_start + INTERVAL '1 month')::date);
+        month_start := (month_start + INTERVAL '1 month')::date;
+    END LOOP;
+END $$;
+
+-- dock_schedule
+ALTER TABLE smartflow.dock_schedule RENAME TO dock_schedule_unpartitioned;
+ALTER TABLE smartflow.dock_schedule_unpartitioned RENAME CONSTRAINT dock_schedule_pkey TO dock_schedule_unpartitioned_pkey;
+ALTER TABLE smartflow.dock_schedule_unpartitioned
+    RENAME CONSTRAINT dock_schedule_warehouse_id_fkey TO dock_schedule_unpartitioned_warehouse_id_fkey;
+
+CREATE TABLE smartflow.dock_schedule (
+    id INTEGER NOT NULL DEFAULT nextval('smartflow.dock_schedule_id_seq'),
+    warehouse_id INTEGER NOT NULL REFERENCES smartflow.warehouse(id) ON DELETE CASCADE,
+    truck_id VARCHAR(50) NOT NULL,
+    dock_number INTEGER NOT NULL,
+    scheduled_time TIMESTAMP NOT NULL,
+    estimated_duration INTEGER, -- in minutes
+    actual_duration INTEGER,
+    status VARCHAR(20) DEFAULT 'scheduled', -- scheduled, in_progress, completed
+    cargo_type VARCHAR(50),
+    truck_size VARCHAR(20),
+    PRIMARY KEY (id, scheduled_time)
+) PARTITION BY RANGE (scheduled_time);
+
+CREATE TABLE smartflow.dock_schedule_default PARTITION OF smartflow.dock_schedule DEFAULT;
+SELECT smartflow.create_monthly_partitions('dock_schedule',
+    LEAST((SELECT min(scheduled_time) FROM smartflow.dock_schedule_unpartitioned)::date, CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 months')::date);
+
+INSERT INTO smartflow.dock_schedule (id, warehouse_id, truck_id, dock_number, scheduled_time,
+                                     estimated_duration, actual_duration, status, cargo_type, truck_size)
+SELECT id, warehouse_id, truck_id, dock_number, scheduled_time,
+       estimated_duration, actual_duration, status, cargo_type, truck_size
+FROM smartflow.dock_schedule_unpartitioned;
+
+-- Hand the sequence over before the old table (its owner) is dropped
+ALTER SEQUENCE smartflow.dock_schedule_id_seq OWNED BY smartflow.dock_schedule.id;
+DROP TABLE smartflow.dock_schedule_unpartitioned;
+CREATE INDEX dock_schedule_warehouse_time_idx ON smartflow.dock_schedule (warehouse_id, scheduled_time);
+
+-- weather_data
+ALTER TABLE smartflow.weather_data RENAME TO weather_data_unpartitioned;
+ALTER TABLE smartflow.weather_data_unpartitioned RENAME CONSTRAINT weather_data_pkey TO weather_data_unpartitioned_pkey;
+
+CREATE TABLE smartflow.weather_data (
+    id INTEGER NOT NULL DEFAULT nextval('smartflow.weather_data_id_seq'),
+    location VARCHAR(100) NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    temperature FLOAT,
+    humidity FLOAT,
+    weather_condition VARCHAR(50),
+    wind_speed FLOAT,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE TABLE smartflow.weather_data_default PARTITION OF smartflow.weather_data DEFAULT;
+SELECT smartflow.create_monthly_partitions('weather_data',
+    LEAST((SELECT min(timestamp) FROM smartflow.weather_data_unpartitioned)::date, CURRENT_DATE),
+    (CURRENT_DATE + INTERVAL '3 months')::date);
+
+-- The partition key can't be NULL; undated readings go to the epoch (the
+-- default partition), so they never look like the latest
+INSERT INTO smartflow.weather_data (id, location, latitude, longitude, temperature, humidity,
+                                    weather_condition, wind_speed, timestamp)
+SELECT id, location, latitude, longitude, temperature, humidity,
+       weather_condition, wind_speed, COALESCE(timestamp, 'epoch')
+FROM smartflow.weather_data_unpartitioned;
+
+ALTER SEQUENCE smartflow.weather_data_id_seq OWNED BY smartflow.weather_data.id;
+DROP TABLE smartflow.weather_data_unpartitioned;
+CREATE INDEX weather_data_location_timestamp_idx ON smartflow.weather_data (location, timestamp DESC);
@@ -0,0 +1,20 @@
+-- migrate: no-transaction
+-- Natural keys the bulk loader (load_data.py) upserts on. The unique index
+-- replaces the plain index on the same columns and takes over its name.
+-- Duplicate keys already in the table would make the build fail, so they
+-- are deleted first: of each set of rows sharing a key, only the newest
+-- (highest id) is kept, as an upsert would have left it. Without a
+-- transaction, a writer can add a new duplicate between the DELETE and the
+-- build; the build then fails and re-running the migration clears it.
+-- inventory_item's key is in 0007_inventory_shelf_key.sql.
+
+-- weather_data: one reading per (location, timestamp). Indexes on a
+-- partitioned table can't be built concurrently; a backward scan of this
+-- one still serves "latest reading per location".
+DELETE FROM smartflow.weather_data AS older USING smartflow.weather_data AS newer
+    WHERE older.location = newer.location AND older.timestamp = newer.timestamp AND older.id < newer.id;
+DROP INDEX IF EXISTS smartflow.weather_data_location_timestamp_key;
+CREATE UNIQUE INDEX weather_data_location_timestamp_key
+    ON smartflow.weather_data (location, timestamp);
+DROP INDEX IF EXISTS smartflow.weather_data_location_timestamp_idx;
+ALTER INDEX smartflow.weather_data_location_timestamp_key RENAME TO weather_data_location_timestamp_idx;
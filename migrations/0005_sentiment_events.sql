@@ -0,0 +1,41 @@
+-- Append-only log of the emotion detected for each recommendation, plus a
+-- per-customer rollup. Replaces rewriting customer_profile.sentiment_history
+-- (a growing JSONB blob) on every request: sentiment_log.py buffers events
+-- and writes each batch as one multi-row INSERT followed by one upsert that
+-- adds the batch's counts to customer_emotion_summary.
+--
+-- sentiment_event is partitioned by month like dock_schedule, so old months
+-- can be detached or dropped without a DELETE. init_db.py creates the
+-- partitions ahead of time.
+
+CREATE TABLE IF NOT EXISTS smartflow.sentiment_event (
+    id BIGSERIAL,
+    customer_id VARCHAR(50) NOT NULL,
+    emotion VARCHAR(20) NOT NULL,
+    polarity REAL,
+    confidence REAL,
+    source VARCHAR(10) NOT NULL DEFAULT 'text', -- text, voice
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE IF NOT EXISTS smartflow.sentiment_event_default PARTITION OF smartflow.sentiment_event DEFAULT;
+SELECT smartflow.create_monthly_partitions('sentiment_event', CURRENT_DATE,
+                                           (CURRENT_DATE + INTERVAL '3 months')::date);
+CREATE INDEX IF NOT EXISTS sentiment_event_customer_time_idx
+    ON smartflow.sentiment_event (customer_id, created_at);
+
+-- One narrow row per customer; a recommendation reads it by primary key
+CREATE TABLE IF NOT EXISTS smartflow.customer_emotion_summary (
+    customer_id VARCHAR(50) PRIMARY KEY,
+    events INTEGER NOT NULL DEFAULT 0,
+    happy INTEGER NOT NULL DEFAULT 0,
+    sad INTEGER NOT NULL DEFAULT 0,
+    excited INTEGER NOT NULL DEFAULT 0,
+    stressed INTEGER NOT NULL DEFAULT 0,
+    angry INTEGER NOT NULL DEFAULT 0,
+    neutral INTEGER NOT NULL DEFAULT 0,
+    polarity_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_emotion VARCHAR(20),
+    last_event_at TIMESTAMP
+);
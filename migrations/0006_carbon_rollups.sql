@@ -0,0 +1,36 @@
+-- migrate: no-transaction
+-- Daily carbon totals per (day, source warehouse, vehicle type) for the
+-- reporting API, maintained by carbon_rollup.py, so dashboards stop
+-- aggregating delivery_route itself.
+--
+-- delivery_route gains created_at (the day a delivery is reported under)
+-- and updated_at, which a trigger stamps on every UPDATE; the rollup job
+-- recomputes only the days of rows changed since its last run. Existing
+-- rows get the time of this migration for both (adding a column with a
+-- constant default does not rewrite the table). Re-running the migration
+-- is safe.
+
+ALTER TABLE smartflow.delivery_route ADD COLUMN IF NOT EXISTS created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE smartflow.delivery_route ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION smartflow.touch_updated_at() RETURNS TRIGGER LANGUAGE plpgsql AS $$ BEGIN NEW.updated_at := CURRENT_TIMESTAMP; RETURN NEW; END $$;
+DROP TRIGGER IF EXISTS delivery_route_touch_updated_at ON smartflow.delivery_route;
+CREATE TRIGGER delivery_route_touch_updated_at BEFORE UPDATE ON smartflow.delivery_route
+    FOR EACH ROW EXECUTE FUNCTION smartflow.touch_updated_at();
+
+-- Changed rows since the last run, and one day's rows when recomputing it
+DROP INDEX CONCURRENTLY IF EXISTS smartflow.delivery_route_updated_at_idx;
+CREATE INDEX CONCURRENTLY delivery_route_updated_at_idx ON smartflow.delivery_route (updated_at);
+DROP INDEX CONCURRENTLY IF EXISTS smartflow.delivery_route_created_at_idx;
+CREATE INDEX CONCURRENTLY delivery_route_created_at_idx ON smartflow.delivery_route (created_at);
+
+CREATE TABLE IF NOT EXISTS smartflow.carbon_daily_rollup (
+    day DATE NOT NULL,
+    warehouse_id INTEGER NOT NULL, -- 0: no source warehouse
+    vehicle_type VARCHAR(50) NOT NULL,
+    deliveries INTEGER NOT NULL,
+    distance_km DOUBLE PRECISION NOT NULL,
+    emissions_kg DOUBLE PRECISION NOT NULL,
+    unrated INTEGER NOT NULL, -- deliveries whose carbon_emissions is still NULL
+    PRIMARY KEY (day, warehouse_id, vehicle_type)
+);
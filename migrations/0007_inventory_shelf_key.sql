@@ -0,0 +1,35 @@
+-- migrate: no-transaction
+-- inventory_item's natural key for the bulk loader: one row per product per
+-- shelf, (product_id, warehouse_id, zone, shelf_number). A product can sit
+-- on several shelves of one warehouse, so (product_id, warehouse_id) alone
+-- is not a key. NULL zone or shelf_number (stock not yet shelved) counts as
+-- one value, as the loader's upsert expects.
+--
+-- Rows already repeating a whole key are merged first rather than dropped:
+-- the newest row (highest id) keeps the summed quantity. A merge and its
+-- deletes are one statement. If a writer adds a new duplicate before the
+-- build, the build fails; re-running the migration merges it. A failed
+-- concurrent build leaves an INVALID index, which the DROP removes.
+--
+-- The key's leading columns serve (product, warehouse) stock lookups, so it
+-- replaces inventory_item_product_warehouse_idx. Databases that ran an
+-- earlier version of 0004 have a unique index under that name, which would
+-- reject a second shelf of the same product; it is dropped here as well.
+
+WITH shelves AS (
+    SELECT id, max(id) OVER shelf AS keep_id, sum(quantity) OVER shelf AS quantity, count(*) OVER shelf AS rows
+    FROM smartflow.inventory_item
+    WINDOW shelf AS (PARTITION BY product_id, warehouse_id, zone, shelf_number)
+), merged AS (
+    DELETE FROM smartflow.inventory_item AS i USING shelves AS s
+    WHERE i.id = s.id AND s.rows > 1 AND s.id <> s.keep_id
+    RETURNING i.id
+)
+UPDATE smartflow.inventory_item AS i SET quantity = s.quantity
+FROM shelves AS s
+WHERE i.id = s.id AND s.rows > 1 AND s.id = s.keep_id;
+
+DROP INDEX CONCURRENTLY IF EXISTS smartflow.inventory_item_product_shelf_key;
+CREATE UNIQUE INDEX CONCURRENTLY inventory_item_product_shelf_key
+    ON smartflow.inventory_item (product_id, warehouse_id, zone, shelf_number) NULLS NOT DISTINCT;
+DROP INDEX CONCURRENTLY IF EXISTS smartflow.inventory_item_product_warehouse_idx;
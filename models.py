@@ -12,6 +12,15 @@ class Warehouse(db.Model):
     dock_schedules = db.relationship('DockSchedule', backref='warehouse', lazy=True)
     inventory_items = db.relationship('InventoryItem', backref='warehouse', lazy=True)
 
+class Product(db.Model):
+    __tablename__ = 'product'
+    __table_args__ = {'schema': 'smartflow'}
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    price = db.Column(db.Float)
+    rating = db.Column(db.Float)
+
 class DockSchedule(db.Model):
     __tablename__ = 'dock_schedule'
     __table_args__ = {'schema': 'smartflow'}
@@ -53,6 +62,11 @@ class DeliveryRoute(db.Model):
     estimated_duration = db.Column(db.Integer)
     carbon_emissions = db.Column(db.Float)
     delivery_status = db.Column(db.String(20), default='pending')
+    route_code = db.Column(db.String(50))
+    stop_sequence = db.Column(db.Integer)
+    # Stamped by the database; on Postgres a trigger moves updated_at on every UPDATE
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
 
 class CustomerProfile(db.Model):
     __tablename__ = 'customer_profile'
@@ -79,4 +93,47 @@ class WeatherData(db.Model):
     humidity = db.Column(db.Float)
     weather_condition = db.Column(db.String(50))
     wind_speed = db.Column(db.Float)
-    timestamp = db.Column(db.DateTime)
\ No newline at end of file
+    # Partition key on Postgres, so never NULL; the database stamps new rows
+    timestamp = db.Column(db.DateTime, server_default=db.func.current_timestamp())
+
+
+class SentimentEvent(db.Model):
+    """One detected emotion, appended per recommendation (see sentiment_log.py)"""
+    __tablename__ = 'sentiment_event'
+    __table_args__ = {'schema': 'smartflow'}
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    customer_id = db.Column(db.String(50), nullable=False)
+    emotion = db.Column(db.String(20), nullable=False)
+    polarity = db.Column(db.Float)
+    confidence = db.Column(db.Float)
+    source = db.Column(db.String(10), nullable=False, default='text')
+    # Partition key on Postgres
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+
+class CustomerEmotionSummary(db.Model):
+    """Running per-customer totals over SentimentEvent, updated with each flush"""
+    __tablename__ = 'customer_emotion_summary'
+    __table_args__ = {'schema': 'smartflow'}
+    customer_id = db.Column(db.String(50), primary_key=True)
+    events = db.Column(db.Integer, nullable=False, default=0)
+    happy = db.Column(db.Integer, nullable=False, default=0)
+    sad = db.Column(db.Integer, nullable=False, default=0)
+    excited = db.Column(db.Integer, nullable=False, default=0)
+    stressed = db.Column(db.Integer, nullable=False, default=0)
+    angry = db.Column(db.Integer, nullable=False, default=0)
+    neutral = db.Column(db.Integer, nullable=False, default=0)
+    polarity_sum = db.Column(db.Float, nullable=False, default=0.0)
+    last_emotion = db.Column(db.String(20))
+    last_event_at = db.Column(db.DateTime)
+
+class CarbonDailyRollup(db.Model):
+    """Daily delivery_route totals maintained by carbon_rollup.py"""
+    __tablename__ = 'carbon_daily_rollup'
+    __table_args__ = {'schema': 'smartflow'}
+    day = db.Column(db.Date, primary_key=True)
+    warehouse_id = db.Column(db.Integer, primary_key=True)  # 0: no source warehouse
+    vehicle_type = db.Column(db.String(50), primary_key=True)
+    deliveries = db.Column(db.Integer, nullable=False)
+    distance_km = db.Column(db.Float, nullable=False)
+    emissions_kg = db.Column(db.Float, nullable=False)
+    unrated = db.Column(db.Integer, nullable=False)
@@ -0,0 +1,132 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from db_pool import read_session
+from index_sync import on_commit
+from models import Product
+
+
+def _rank_key(product):
+    return (-(product['rating'] or 0), product['id'])
+
+
+class ProductIndex:
+    """Products per category, presorted by rating (best first).
+
+    Recommendation reads the head of a category's list instead of sorting
+    per request. Each category list is replaced on write (copy-on-write), so
+    readers can iterate a list without a lock; the product dicts themselves
+    are shared, never copied, and must be treated as read-only.
+
+    Rating and category changes committed through the ORM are applied
+    incrementally, so they show up straight away; every `check_interval`
+    seconds a one-row aggregate over the table is compared with the last
+    load and any difference (including changes made elsewhere) triggers a
+    reload. `external_refresh` works as in WarehouseIndex.
+    """
+
+    def __init__(self, fallback_products=None, check_interval=60):
+        self.fallback_products = fallback_products or {}
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.ranked = {}
+        self.keys = {}
+        self.by_id = {}
+        self.signature = None
+        self.checked_at = 0.0
+        self.loaded = False
+        self.external_refresh = False
+        on_commit(Product, self.apply_changes, track=('category', 'rating'))
+
+    def signature_query(self):
+        return select(func.count(Product.id), func.max(Product.id), func.sum(Product.rating))
+
+    def rows_query(self):
+        return select(Product.id, Product.name, Product.category, Product.price, Product.rating)
+
+    def table_signature(self):
+        with read_session() as session:
+            return tuple(session.execute(self.signature_query()).one())
+
+    def rebuild(self, products):
+        """Build from (category, product dict) pairs"""
+        ranked, by_id = {}, {}
+        for category, product in products:
+            ranked.setdefault(category, []).append(product)
+            by_id[product['id']] = (category, product)
+        for items in ranked.values():
+            items.sort(key=_rank_key)
+        self.keys = {c: [_rank_key(p) for p in items] for c, items in ranked.items()}
+        self.ranked = ranked
+        self.by_id = by_id
+        self.loaded = True
+
+    def needs_reload(self, signature):
+        return not self.loaded or signature != self.signature
+
+    def load(self, signature, rows):
+        """Rebuild from rows_query() results taken with `signature`"""
+        if rows:
+            self.rebuild((r.category, {'id': r.id, 'name': r.name, 'price': r.price, 'rating': r.rating})
+                         for r in rows)
+        else:
+            # Empty catalog table: serve the built-in sample products
+            self.rebuild((c, p) for c, items in self.fallback_products.items() for p in items)
+        self.signature = signature
+
+    def ensure_fresh(self):
+        if self.external_refresh:
+            return
+        now = time.monotonic()
+        if self.loaded and now - self.checked_at < self.check_interval:
+            return
+        with self.lock:
+            if self.loaded and now - self.checked_at < self.check_interval:
+                return
+            signature = self.table_signature()
+            if self.needs_reload(signature):
+                with read_session() as session:
+                    self.load(signature, session.execute(self.rows_query()).all())
+            self.checked_at = now
+
+    def top(self, category):
+        """Products of a category, best rated first (shared list; do not modify)"""
+        self.ensure_fresh()
+        return self.ranked.get(category, ())
+
+    def _remove(self, product_id):
+        category, product = self.by_id.pop(product_id, (None, None))
+        if product is None:
+            return
+        keys = list(self.keys[category])
+        i = bisect.bisect_left(keys, _rank_key(product))
+        del keys[i]
+        items = list(self.ranked[category])
+        del items[i]
+        self.keys[category], self.ranked[category] = keys, items
+
+    def _insert(self, category, product):
+        key = _rank_key(product)
+        keys = list(self.keys.get(category, ()))
+        items = list(self.ranked.get(category, ()))
+        i = bisect.bisect_left(keys, key)
+        keys.insert(i, key)
+        items.insert(i, product)
+        self.keys[category], self.ranked[category] = keys, items
+        self.by_id[product['id']] = (category, product)
+
+    def apply_changes(self, changes):
+        """on_commit callback: move changed products to their new rank"""
+        with self.lock:
+            if not self.loaded:
+                return
+            for op, values, previous in changes:
+                self._remove(values['id'])
+                if op != 'delete':
+                    self._insert(values['category'], {
+                        'id': values['id'], 'name': values['name'],
+                        'price': values['price'], 'rating': values['rating']
+                    })
@@ -1,13 +1,36 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 import numpy as np
-from textblob import TextBlob
 import json
 from models import CustomerProfile
 from extensions import db
+from cache import TTLCache
+from sentiment_worker import score_texts
+from product_index import ProductIndex
+from sentiment_log import EmotionSummaries, SentimentLog, usual_emotion
+from instrumentation import timed
 
 class EmotionAwareRecommendation:
     def __init__(self, db):
         self.db = db
+        # Quick-reply chips send the same short phrases over and over
+        self.sentiment_cache = TTLCache(
+            maxsize=int(os.environ.get('SENTIMENT_CACHE_SIZE', 10000)),
+            ttl=int(os.environ.get('SENTIMENT_CACHE_TTL', 3600))
+        )
+        # TextBlob holds the GIL; with workers > 0 scoring runs in a process pool
+        self.pool_workers = int(os.environ.get('SENTIMENT_POOL_WORKERS', 0))
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        # Emotion history of known customers: appended in batches, read as one summary row
+        self.emotion_summaries = EmotionSummaries()
+        self.sentiment_log = SentimentLog(summaries=self.emotion_summaries)
         # Product categories mapped to emotions
         self.emotion_product_mapping = {
             'happy': ['electronics', 'games', 'books', 'sports'],
@@ -17,7 +40,7 @@ class EmotionAwareRecommendation:
             'angry': ['stress_relief', 'books', 'music', 'exercise'],
             'neutral': ['essentials', 'home', 'clothing', 'food']
         }
-        # Sample products database (still hardcoded)
+        # Sample products, served while the smartflow.product table is empty
         self.products = {
             'electronics': [
                 {'id': 1, 'name': 'Smartphone', 'price': 299, 'rating': 4.5},
@@ -35,13 +58,95 @@ class EmotionAwareRecommendation:
                 {'id': 9, 'name': 'Meditation Cushion', 'price': 45, 'rating': 4.2}
             ]
         }
+        self.product_index = ProductIndex(self.products)
+        # Cultural context and local preferences per city
+        self.indian_preferences = {
+            'Mumbai': {'trending': ['electronics', 'fashion'], 'local_brands': True},
+            'Delhi': {'trending': ['books', 'home'], 'local_brands': True},
+            'Bangalore': {'trending': ['electronics', 'books'], 'local_brands': False},
+            'Chennai': {'trending': ['books', 'wellness'], 'local_brands': True}
+        }
     
+    def warm_up(self, load=True):
+        """Import TextBlob and its lexicon and, with `load`, the product catalog"""
+        score_texts(['warm up'])
+        if load:
+            self.product_index.ensure_fresh()
+
+    def normalize_text(self, text):
+        """Cache key for a text: TextBlob scores ignore case and extra whitespace"""
+        return ' '.join(text.split()).lower()
+
+    def get_pool(self):
+        """Persistent scoring pool, started on first use (None when disabled)"""
+        if self.pool_workers <= 0:
+            return None
+        with self._pool_lock:
+            if self.pool is None:
+                # spawn: forking a threaded Flask worker is not safe
+                self.pool = ProcessPoolExecutor(self.pool_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+                atexit.register(self.pool.shutdown)
+            return self.pool
+
+    @timed
     def analyze_text_sentiment(self, text):
-        """Analyze sentiment from text input"""
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
-        subjectivity = blob.sentiment.subjectivity
-        
+        """Analyze sentiment from text input (cached on the normalized text)"""
+        key = self.normalize_text(text)
+        result = self.sentiment_cache.get(key)
+        if result is None:
+            pool = self.get_pool()
+            if pool:
+                # Waiting on the pool releases the GIL for other request threads
+                polarity, subjectivity = pool.submit(score_texts, [key]).result()[0]
+            else:
+                polarity, subjectivity = score_texts([key])[0]
+            result = self.emotion_from_scores(polarity, subjectivity)
+            self.sentiment_cache.set(key, result)
+        return dict(result)
+
+    @timed
+    async def analyze_text_sentiment_async(self, text):
+        """analyze_text_sentiment for an event loop: a cache miss is scored in
+        the pool (or a thread without one) while the loop keeps serving"""
+        key = self.normalize_text(text)
+        result = self.sentiment_cache.get(key)
+        if result is None:
+            scores = await asyncio.get_running_loop().run_in_executor(self.get_pool(), score_texts, [key])
+            result = self.emotion_from_scores(*scores[0])
+            self.sentiment_cache.set(key, result)
+        return dict(result)
+
+    @timed
+    def analyze_text_sentiment_batch(self, texts, chunk_size=None):
+        """Sentiment for many texts; cache misses are scored across the pool in chunks"""
+        keys = [self.normalize_text(text) for text in texts]
+        results = {}
+        for key in keys:
+            if key not in results:
+                results[key] = self.sentiment_cache.get(key)
+        misses = [key for key, result in results.items() if result is None]
+
+        if misses:
+            pool = self.get_pool()
+            if pool:
+                chunk_size = chunk_size or max(16, -(-len(misses) // (self.pool_workers * 4)))
+                chunks = [misses[i:i + chunk_size] for i in range(0, len(misses), chunk_size)]
+                scores = [score for chunk in pool.map(score_texts, chunks) for score in chunk]
+            else:
+                scores = score_texts(misses)
+            for key, (polarity, subjectivity) in zip(misses, scores):
+                results[key] = self.emotion_from_scores(polarity, subjectivity)
+                self.sentiment_cache.set(key, results[key])
+        return [dict(results[key]) for key in keys]
+
+    def score_text_sentiment(self, text):
+        """Run TextBlob on a text and map its polarity to an emotion"""
+        polarity, subjectivity = score_texts([text])[0]
+        return self.emotion_from_scores(polarity, subjectivity)
+
+    def emotion_from_scores(self, polarity, subjectivity):
+        """Map TextBlob polarity to an emotion"""
         # Determine emotion based on polarity
         if polarity > 0.3:
             emotion = 'happy'
@@ -100,6 +205,16 @@ class EmotionAwareRecommendation:
         
         return preferences
     
+    def record_emotion(self, user_input, user_data, emotion_data):
+        """Append the detected emotion to a known customer's history (buffered)"""
+        customer_id = user_data.get('customer_id')
+        if not customer_id:
+            return
+        if self.sentiment_log.engine is None:
+            self.sentiment_log.bind(self.db.engine)
+        self.sentiment_log.record(customer_id, emotion_data, 'text' if user_input.get('type') == 'text' else 'voice')
+
+    @timed
     def recommend_products(self, user_input, user_data):
         """Generate emotion-aware product recommendations"""
         # Analyze emotion from input
@@ -107,49 +222,93 @@ class EmotionAwareRecommendation:
             emotion_data = self.analyze_text_sentiment(user_input['content'])
         else:
             emotion_data = self.analyze_voice_sentiment(user_input.get('voice_data'))
-        
-        # Get demographic preferences
-        demo_preferences = self.get_demographic_preferences(user_data)
-        
+        customer_id = user_data.get('customer_id')
+        history = self.emotion_summaries.get(customer_id) if customer_id else None
+        self.record_emotion(user_input, user_data, emotion_data)
+        return self.recommend_for_emotion(emotion_data, user_data, history)
+
+    @timed
+    async def recommend_products_async(self, user_input, user_data, history=None):
+        """recommend_products for an event loop; the caller looks up `history`
+        (the customer's emotion summary) without blocking the loop"""
+        if user_input.get('type') == 'text':
+            emotion_data = await self.analyze_text_sentiment_async(user_input['content'])
+        else:
+            emotion_data = self.analyze_voice_sentiment(user_input.get('voice_data'))
+        self.record_emotion(user_input, user_data, emotion_data)
+        return self.recommend_for_emotion(emotion_data, user_data, history)
+
+    @timed
+    def recommend_products_batch(self, requests, histories=None):
+        """Recommendations for many (user_input, user_data) pairs.
+
+        Text inputs are scored together through analyze_text_sentiment_batch,
+        so a burst of requests uses every pool worker. Customer histories
+        are read in one query unless given (customer_id -> summary).
+        """
+        texts = [user_input['content'] for user_input, _ in requests if user_input.get('type') == 'text']
+        text_emotions = iter(self.analyze_text_sentiment_batch(texts))
+        if histories is None:
+            customer_ids = [user_data['customer_id'] for _, user_data in requests if user_data.get('customer_id')]
+            histories = self.emotion_summaries.get_many(customer_ids) if customer_ids else {}
+        results = []
+        for user_input, user_data in requests:
+            if user_input.get('type') == 'text':
+                emotion_data = next(text_emotions)
+            else:
+                emotion_data = self.analyze_voice_sentiment(user_input.get('voice_data'))
+            history = histories.get(str(user_data.get('customer_id')))
+            self.record_emotion(user_input, user_data, emotion_data)
+            results.append(self.recommend_for_emotion(emotion_data, user_data, history))
+        return results
+
+    @timed
+    def recommend_for_emotion(self, emotion_data, user_data, history=None):
+        """Recommendations once the emotion is known.
+
+        `history` is the customer's emotion summary (see sentiment_log.py);
+        when they usually feel differently from now, the third category
+        comes from their usual mood.
+        """
         # Get emotion-based product categories
         emotion = emotion_data['emotion']
-        relevant_categories = self.emotion_product_mapping.get(emotion, ['essentials'])
+        relevant_categories = self.emotion_product_mapping.get(emotion, ['essentials'])[:3]  # Top 3 categories
+        usual = usual_emotion(history)
+        if usual and usual != emotion:
+            extra = next((category for category in self.emotion_product_mapping.get(usual, [])
+                          if category not in relevant_categories[:2]), None)
+            if extra:
+                relevant_categories = relevant_categories[:2] + [extra]
         
-        # Generate recommendations
+        # Generate recommendations from the presorted catalog
         recommendations = []
-        for category in relevant_categories[:3]:  # Top 3 categories
-            if category in self.products:
-                category_products = self.products[category]
-                # Sort by rating and pick top products
-                sorted_products = sorted(category_products, key=lambda x: x['rating'], reverse=True)
-                recommendations.extend(sorted_products[:2])  # Top 2 from each category
+        for category in relevant_categories:
+            recommendations.extend(islice(self.product_index.top(category), 2))  # Top 2 from each category
         
         return {
             'emotion_detected': emotion,
             'confidence': emotion_data['confidence'],
+            'usual_emotion': usual,
             'recommendations': recommendations,
             'reasoning': f"Based on your {emotion} mood, we recommend these products to enhance your experience"
         }
     
     def personalize_for_indian_market(self, recommendations, user_location):
-        """Personalize recommendations for Indian market"""
-        # Add cultural context and local preferences
-        indian_preferences = {
-            'Mumbai': {'trending': ['electronics', 'fashion'], 'local_brands': True},
-            'Delhi': {'trending': ['books', 'home'], 'local_brands': True},
-            'Bangalore': {'trending': ['electronics', 'books'], 'local_brands': False},
-            'Chennai': {'trending': ['books', 'wellness'], 'local_brands': True}
-        }
-        
-        location_prefs = indian_preferences.get(user_location, indian_preferences['Mumbai'])
+        """Personalize recommendations for Indian market
+
+        Local availability and delivery time depend only on the location, so
+        they are given once for the whole list; the product dicts are the
+        catalog index's own and are returned as they are.
+        """
+        location_prefs = self.indian_preferences.get(user_location, self.indian_preferences['Mumbai'])
         
         # Adjust recommendations based on location
-        for rec in recommendations:
-            if location_prefs['local_brands']:
-                rec['local_availability'] = True
-                rec['delivery_time'] = '1-2 days'
-            else:
-                rec['local_availability'] = False
-                rec['delivery_time'] = '2-5 days'
-        
-        return recommendations
+        if location_prefs['local_brands']:
+            availability, delivery_time = True, '1-2 days'
+        else:
+            availability, delivery_time = False, '2-5 days'
+        return {
+            'recommendations': recommendations,
+            'local_availability': availability,
+            'delivery_time': delivery_time
+        }
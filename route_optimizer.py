@@ -0,0 +1,307 @@
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import insert, select, update
+
+from carbon_calculator import CarbonCalculator
+from geo import haversine_km
+from instrumentation import timed
+from models import DeliveryRoute, Warehouse
+
+
+class RouteOptimizer:
+    """Multi-stop delivery routes from one warehouse.
+
+    Stops are swept by bearing around the warehouse into tours that respect
+    each vehicle's stop capacity and range, then every tour is improved with
+    2-opt and Or-opt moves until it is locally optimal or the time budget
+    runs out. Tours are improved one at a time; stops are not moved between
+    tours.
+    """
+
+    def __init__(self, db, carbon_calculator=None):
+        self.db = db
+        self.carbon_calculator = carbon_calculator or CarbonCalculator()
+        # Drones carry a single parcel, so they don't run multi-stop tours
+        self.vehicle_profiles = {
+            'truck': {'capacity': 60, 'range_km': 400, 'speed_kmh': 40},
+            'electric_vehicle': {'capacity': 40, 'range_km': 200, 'speed_kmh': 40},
+            'bike': {'capacity': 12, 'range_km': 40, 'speed_kmh': 25}
+        }
+        self.default_fleet = {'truck': 20, 'electric_vehicle': 10, 'bike': 10}
+        self.service_minutes = 5  # per stop
+
+    def distance_matrix(self, depot, points):
+        """Haversine km between all nodes; node 0 is the depot"""
+        nodes = np.vstack([np.asarray(depot, dtype=float).reshape(1, 2),
+                           np.asarray(points, dtype=float).reshape(-1, 2)])
+        return haversine_km(nodes[:, 0, None], nodes[:, 1, None], nodes[None, :, 0], nodes[None, :, 1])
+
+    def vehicle_order(self, fleet, objective):
+        """Vehicle types in the order tours are handed out"""
+        types = [v for v in fleet if fleet[v] > 0 and v in self.vehicle_profiles]
+        if objective == 'emissions':
+            factors = self.carbon_calculator.emission_factors
+            return sorted(types, key=lambda v: factors.get(v, 0.12))
+        # Bigger vehicles mean fewer tours, so fewer trips out and back
+        return sorted(types, key=lambda v: -self.vehicle_profiles[v]['capacity'])
+
+    def tour_length(self, tour, dist):
+        return float(dist[tour[:-1], tour[1:]].sum())
+
+    @timed
+    def sweep(self, dist, bearings, fleet, objective):
+        """Construction: fill vehicles with stops in bearing order.
+
+        Each stop goes in at the cheapest point of the open tour. Returns
+        ([(vehicle_type, tour)], unassigned stop nodes); a tour is a node
+        array starting and ending at the depot.
+        """
+        order = np.argsort(bearings) + 1
+        if len(order) > 1:
+            # Start just after the widest angular gap so no cluster is cut in two
+            ordered = np.sort(bearings)
+            gaps = np.diff(np.append(ordered, ordered[0] + 2 * np.pi))
+            order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+
+        remaining = list(order)
+        tours = []
+        for vehicle_type in self.vehicle_order(fleet, objective):
+            profile = self.vehicle_profiles[vehicle_type]
+            vehicles = fleet[vehicle_type]
+            skipped = []
+            tour, length = np.array([0, 0]), 0.0
+            for node in remaining:
+                if vehicles == 0 or 2 * dist[0, node] > profile['range_km']:
+                    skipped.append(node)
+                    continue
+                # Cheapest place to slot the stop into the tour so far
+                costs = dist[tour[:-1], node] + dist[node, tour[1:]] - dist[tour[:-1], tour[1:]]
+                k = int(np.argmin(costs))
+                if len(tour) - 2 >= profile['capacity'] or length + costs[k] > profile['range_km']:
+                    # Vehicle is full: close its tour and start the next one here
+                    tours.append((vehicle_type, tour))
+                    vehicles -= 1
+                    tour, length, k = np.array([0, 0]), 0.0, 0
+                    if vehicles == 0:
+                        skipped.append(node)
+                        continue
+                    costs = [2 * dist[0, node]]
+                length += costs[k]
+                tour = np.insert(tour, k + 1, node)
+            if len(tour) > 2:
+                tours.append((vehicle_type, tour))
+            remaining = skipped
+            if not remaining:
+                break
+        return tours, remaining
+
+    def two_opt(self, tour, dist, deadline):
+        """Best-improvement 2-opt; each pass scores every edge pair at once"""
+        while len(tour) > 4 and time.monotonic() < deadline:
+            a, b = tour[:-1], tour[1:]
+            edges = dist[a, b]
+            delta = dist[a[:, None], a[None, :]] + dist[b[:, None], b[None, :]] - edges[:, None] - edges[None, :]
+            # Only j > i + 1: adjacent edges share a node
+            delta[np.tril_indices(len(a), 1)] = 0.0
+            i, j = np.unravel_index(np.argmin(delta), delta.shape)
+            if delta[i, j] > -1e-9:
+                break
+            tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+        return tour
+
+    def or_opt(self, tour, dist, deadline):
+        """Move a run of 1-3 stops (either way round) to its best position.
+
+        Returns (tour, improved).
+        """
+        for size in (1, 2, 3):
+            for i in range(1, len(tour) - size):
+                if time.monotonic() >= deadline:
+                    return tour, False
+                first, last = tour[i], tour[i + size - 1]
+                before, after = tour[i - 1], tour[i + size]
+                gain = dist[before, first] + dist[last, after] - dist[before, after]
+                rest = np.concatenate([tour[:i], tour[i + size:]])
+                u, v = rest[:-1], rest[1:]
+                forward = dist[u, first] + dist[last, v] - dist[u, v]
+                backward = dist[u, last] + dist[first, v] - dist[u, v]
+                k_forward, k_backward = int(np.argmin(forward)), int(np.argmin(backward))
+                if min(forward[k_forward], backward[k_backward]) < gain - 1e-9:
+                    segment = tour[i:i + size]
+                    if backward[k_backward] < forward[k_forward]:
+                        k, segment = k_backward, segment[::-1]
+                    else:
+                        k = k_forward
+                    return np.concatenate([rest[:k + 1], segment, rest[k + 1:]]), True
+        return tour, False
+
+    def improve(self, tour, dist, deadline):
+        while time.monotonic() < deadline:
+            tour = self.two_opt(tour, dist, deadline)
+            tour, moved = self.or_opt(tour, dist, deadline)
+            if not moved:
+                break
+        return tour
+
+    def stop_point(self, n, stop):
+        """(lat, lng) of the n-th stop; ValueError when it has no usable coordinates"""
+        lat = stop.get('destination_lat', stop.get('lat'))
+        lng = stop.get('destination_lng', stop.get('lng'))
+        try:
+            point = (float(lat), float(lng))
+        except (TypeError, ValueError):
+            point = None
+        if point is None or not all(map(math.isfinite, point)):
+            raise ValueError(f"Stop {n} has no coordinates (lat/lng or destination_lat/destination_lng)")
+        return point
+
+    @timed
+    def optimize(self, depot, stops, fleet=None, objective='distance', time_budget=2.0):
+        """Plan tours for `stops` (dicts with lat/lng or destination_lat/destination_lng).
+
+        objective is 'distance' or 'emissions'. Returns a plan dict; each
+        route lists its stops in visiting order with leg and cumulative km
+        and an ETA in minutes from departure.
+        """
+        if objective not in ('distance', 'emissions'):
+            raise ValueError(f"Unknown objective: {objective}")
+        started = time.monotonic()
+        fleet = dict(fleet or self.default_fleet)
+        points = [self.stop_point(n, stop) for n, stop in enumerate(stops, start=1)]
+        dist = self.distance_matrix(depot, points)
+        rel = np.asarray(points, dtype=float).reshape(-1, 2) - np.asarray(depot, dtype=float)
+        bearings = np.arctan2(rel[:, 0], rel[:, 1] * np.cos(np.radians(depot[0])))
+
+        tours, unassigned = self.sweep(dist, bearings, fleet, objective)
+        construction_km = sum(self.tour_length(tour, dist) for _, tour in tours)
+
+        # Share what is left of the budget evenly over the tours still to improve
+        for n, (vehicle_type, tour) in enumerate(tours):
+            remaining = time_budget - (time.monotonic() - started)
+            deadline = time.monotonic() + max(remaining, 0) / (len(tours) - n)
+            tours[n] = (vehicle_type, self.improve(tour, dist, deadline))
+
+        lengths = [self.tour_length(tour, dist) for _, tour in tours]
+        emissions = self.carbon_calculator.calculate_emissions_batch(
+            lengths, [vehicle_type for vehicle_type, _ in tours])['emissions_kg_co2'] if tours else []
+
+        routes = []
+        for (vehicle_type, tour), length, co2 in zip(tours, lengths, emissions):
+            speed = self.vehicle_profiles[vehicle_type]['speed_kmh']
+            legs = dist[tour[:-1], tour[1:]]
+            cumulative = np.cumsum(legs)
+            planned = []
+            for position, node in enumerate(tour[1:-1]):
+                planned.append({
+                    'stop': stops[node - 1],
+                    'sequence': position + 1,
+                    'leg_km': round(float(legs[position]), 2),
+                    'cumulative_km': round(float(cumulative[position]), 2),
+                    'eta_minutes': int(round(cumulative[position] / speed * 60 + position * self.service_minutes))
+                })
+            routes.append({
+                'vehicle_type': vehicle_type,
+                'stops': planned,
+                'return_km': round(float(legs[-1]), 2),
+                'distance_km': round(length, 2),
+                'duration_minutes': int(round(length / speed * 60 + len(planned) * self.service_minutes)),
+                'emissions_kg_co2': float(co2)
+            })
+
+        return {
+            'objective': objective,
+            'routes': routes,
+            'unassigned': [stops[node - 1] for node in unassigned],
+            'total_distance_km': round(sum(lengths), 2),
+            'total_emissions_kg_co2': round(float(np.sum(emissions)), 2),
+            'construction_distance_km': round(construction_km, 2),
+            'runtime_seconds': round(time.monotonic() - started, 3)
+        }
+
+    @timed
+    def plan_deliveries(self, warehouse_id, stops=None, fleet=None, objective='distance',
+                        time_budget=2.0, save=True):
+        """Route a warehouse's deliveries and store them as DeliveryRoute rows.
+
+        Without `stops`, the warehouse's pending DeliveryRoute rows that have
+        coordinates are routed and updated in place; given stops are inserted
+        as new rows. Each row's distance_km is the leg into that stop (the
+        last stop also carries the return leg), so a route's rows add up to
+        the tour.
+        """
+        warehouse = self.db.session.get(Warehouse, warehouse_id)
+        if warehouse is None or warehouse.latitude is None or warehouse.longitude is None:
+            return {'error': 'Warehouse not found or has no coordinates'}
+
+        if stops is None:
+            stops = self.stops_from_rows(self.db.session.execute(self.pending_query(warehouse_id)))
+
+        plan = self.optimize((warehouse.latitude, warehouse.longitude), stops, fleet, objective, time_budget)
+        updates, inserts = self.plan_rows(plan, warehouse_id)
+        if save:
+            if updates:
+                self.db.session.execute(update(DeliveryRoute), updates)
+            if inserts:
+                self.db.session.execute(insert(DeliveryRoute), inserts)
+            self.db.session.commit()
+        return plan
+
+    def pending_query(self, warehouse_id):
+        """A warehouse's pending deliveries that have coordinates"""
+        return select(
+            DeliveryRoute.id, DeliveryRoute.order_id, DeliveryRoute.destination_address,
+            DeliveryRoute.destination_lat, DeliveryRoute.destination_lng
+        ).where(
+            DeliveryRoute.source_warehouse_id == warehouse_id,
+            DeliveryRoute.delivery_status == 'pending',
+            DeliveryRoute.destination_lat.isnot(None),
+            DeliveryRoute.destination_lng.isnot(None)
+        ).order_by(DeliveryRoute.id)
+
+    def stops_from_rows(self, rows):
+        return [row._asdict() for row in rows]
+
+    def plan_rows(self, plan, warehouse_id):
+        """Label the plan's routes and return (updates, inserts) DeliveryRoute values"""
+        plan['warehouse_id'] = warehouse_id
+        prefix = f"{warehouse_id}-{datetime.now():%Y%m%d%H%M%S}"
+        factors = self.carbon_calculator.emission_factors
+        updates, inserts = [], []
+        for n, route in enumerate(plan['routes'], start=1):
+            route['route_code'] = f"{prefix}-{n:03d}"
+            for planned in route['stops']:
+                stop = planned['stop']
+                leg = planned['leg_km'] + (route['return_km'] if planned is route['stops'][-1] else 0)
+                values = {
+                    'route_code': route['route_code'],
+                    'stop_sequence': planned['sequence'],
+                    'vehicle_type': route['vehicle_type'],
+                    'distance_km': round(leg, 2),
+                    'estimated_duration': planned['eta_minutes'],
+                    'carbon_emissions': round(leg * factors.get(route['vehicle_type'], 0.12), 2),
+                    'delivery_status': 'planned'
+                }
+                if stop.get('id') is not None:
+                    updates.append(dict(values, id=stop['id']))
+                else:
+                    inserts.append(dict(values,
+                                        order_id=stop.get('order_id'),
+                                        source_warehouse_id=warehouse_id,
+                                        destination_address=stop.get('destination_address', stop.get('address', '')),
+                                        destination_lat=stop.get('destination_lat', stop.get('lat')),
+                                        destination_lng=stop.get('destination_lng', stop.get('lng'))))
+        return updates, inserts
+
+
+_worker_optimizer = None
+
+
+def optimize_routes(depot, stops, fleet=None, objective='distance', time_budget=2.0):
+    """RouteOptimizer.optimize for executor workers, which have no database"""
+    global _worker_optimizer
+    if _worker_optimizer is None:
+        _worker_optimizer = RouteOptimizer(None)
+    return _worker_optimizer.optimize(depot, stops, fleet, objective, time_budget)
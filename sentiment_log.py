@@ -0,0 +1,289 @@
+"""Per-customer emotion history: an append-only event log and its rollup.
+
+Each recommendation for a known customer appends one SentimentEvent. The
+request only puts the event in a buffer; a background thread writes the
+buffer every `flush_interval` seconds (sooner once `batch_size` events are
+waiting) as one multi-row INSERT, then adds the batch's per-customer counts
+to CustomerEmotionSummary with one upsert, in the same transaction.
+
+EmotionSummaries serves those rollups to recommend_products: one primary
+key read per customer, cached for `ttl` seconds, with this process's own
+flushed events added to the cached copy. Events recorded by other workers
+show up when the entry expires.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import case, insert, or_, select
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from db_pool import read_session
+from instrumentation import timed
+from models import CustomerEmotionSummary, SentimentEvent
+
+logger = logging.getLogger(__name__)
+
+EMOTIONS = ('happy', 'sad', 'excited', 'stressed', 'angry', 'neutral')
+
+
+def summary_from_row(row):
+    """CustomerEmotionSummary row -> dict (None for a customer without history)"""
+    if row is None:
+        return None
+    return {
+        'events': row.events,
+        'counts': {emotion: getattr(row, emotion) for emotion in EMOTIONS},
+        'polarity_sum': row.polarity_sum,
+        'last_emotion': row.last_emotion,
+        'last_event_at': row.last_event_at,
+    }
+
+
+def usual_emotion(summary, min_events=3, min_share=0.4):
+    """The customer's most frequent emotion, if it is frequent enough to go by"""
+    if not summary or summary['events'] < min_events:
+        return None
+    emotion, count = max(summary['counts'].items(), key=lambda item: item[1])
+    return emotion if count >= min_share * summary['events'] else None
+
+
+def batch_deltas(events):
+    """customer_id -> summary increments for a batch of event rows"""
+    deltas = {}
+    for event in events:
+        delta = deltas.get(event['customer_id'])
+        if delta is None:
+            delta = deltas[event['customer_id']] = defaultdict(int, polarity_sum=0.0)
+        delta['events'] += 1
+        delta[event['emotion']] += 1
+        delta['polarity_sum'] += event['polarity'] or 0.0
+        if delta.get('last_event_at') is None or event['created_at'] >= delta['last_event_at']:
+            delta['last_emotion'] = event['emotion']
+            delta['last_event_at'] = event['created_at']
+    return deltas
+
+
+def upsert_summaries(session, deltas):
+    """Add per-customer increments to CustomerEmotionSummary (one statement)"""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    table = CustomerEmotionSummary.__table__
+    # Sorted, so concurrent flushes from several workers lock rows in the same order
+    rows = [{
+        'customer_id': customer_id,
+        'events': delta['events'],
+        **{emotion: delta[emotion] for emotion in EMOTIONS},
+        'polarity_sum': delta['polarity_sum'],
+        'last_emotion': delta['last_emotion'],
+        'last_event_at': delta['last_event_at'],
+    } for customer_id, delta in sorted(deltas.items())]
+    stmt = dialect_insert(table).values(rows)
+    counters = ('events', 'polarity_sum') + EMOTIONS
+    newer = or_(table.c.last_event_at.is_(None), stmt.excluded.last_event_at >= table.c.last_event_at)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.customer_id],
+        set_={
+            **{name: table.c[name] + stmt.excluded[name] for name in counters},
+            'last_emotion': case((newer, stmt.excluded.last_emotion), else_=table.c.last_emotion),
+            'last_event_at': case((newer, stmt.excluded.last_event_at), else_=table.c.last_event_at),
+        }))
+
+
+class SentimentLog:
+    """Buffered, batched writer of SentimentEvent rows and their rollups.
+
+    record() never touches the database. The buffer holds at most
+    `max_pending` events; beyond that new events are dropped and counted,
+    so a database outage costs history, not memory or latency. A failed
+    flush puts its events back for the next attempt. Call bind() with an
+    engine before the first flush (EmotionAwareRecommendation binds the
+    app's primary engine on first use).
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None, summaries=None):
+        self.batch_size = batch_size or int(os.environ.get('SENTIMENT_LOG_BATCH_SIZE', 500))
+        self.flush_interval = flush_interval or float(os.environ.get('SENTIMENT_LOG_FLUSH_INTERVAL', 2.0))
+        self.max_pending = max_pending or int(os.environ.get('SENTIMENT_LOG_MAX_PENDING', 50000))
+        self.summaries = summaries
+        self.engine = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pending = []
+        self.thread = None
+        self.pid = None
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        atexit.register(self.close)
+
+    def bind(self, engine):
+        self.engine = engine
+
+    def record(self, customer_id, emotion_data, source='text', when=None):
+        """Queue one event; returns False when the buffer was full and it was dropped"""
+        event = {
+            'customer_id': str(customer_id),
+            'emotion': emotion_data['emotion'],
+            'polarity': emotion_data.get('polarity'),
+            'confidence': emotion_data.get('confidence'),
+            'source': source,
+            'created_at': when or datetime.now(),
+        }
+        with self.lock:
+            self.ensure_thread()
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.pending.append(event)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.wake.set()
+        return True
+
+    def ensure_thread(self):
+        """Start the writer thread in this process (threads don't survive a fork)"""
+        if self.pid != os.getpid():
+            # A forked child must not write its parent's buffer a second time
+            self.pending = []
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, name='sentiment-log', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing sentiment events failed; retrying next interval")
+
+    @timed(name='SentimentLog.flush')
+    def flush(self):
+        """Write everything buffered so far; returns the number of events written"""
+        with self.flush_lock:
+            with self.lock:
+                events, self.pending = self.pending, []
+            if not events or self.engine is None:
+                self.requeue(events)
+                return 0
+            written = 0
+            try:
+                for start in range(0, len(events), self.batch_size):
+                    batch = events[start:start + self.batch_size]
+                    deltas = batch_deltas(batch)
+                    with Session(self.engine) as session, session.begin():
+                        session.execute(insert(SentimentEvent), batch)
+                        upsert_summaries(session, deltas)
+                    written += len(batch)
+                    if self.summaries is not None:
+                        self.summaries.apply(deltas)
+            except Exception:
+                self.failed_flushes += 1
+                self.requeue(events[written:])
+                raise
+            finally:
+                self.written += written
+            return written
+
+    def close(self):
+        """Final flush at interpreter exit"""
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Dropping %d unwritten sentiment events", len(self.pending))
+
+    def requeue(self, events):
+        """Put unwritten events back in front of newer ones, within max_pending"""
+        if not events:
+            return
+        with self.lock:
+            keep = max(self.max_pending - len(self.pending), 0)
+            self.dropped += max(len(events) - keep, 0)
+            self.pending = events[:keep] + self.pending
+
+    def stats(self):
+        with self.lock:
+            return {
+                'pending': len(self.pending),
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed_flushes': self.failed_flushes,
+                'batch_size': self.batch_size,
+                'flush_interval_seconds': self.flush_interval,
+            }
+
+
+class EmotionSummaries:
+    """Cached CustomerEmotionSummary lookups by customer_id"""
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.cache = TTLCache(
+            maxsize=maxsize or int(os.environ.get('EMOTION_SUMMARY_CACHE_SIZE', 50000)),
+            ttl=ttl or int(os.environ.get('EMOTION_SUMMARY_CACHE_TTL', 60))
+        )
+
+    def query(self, customer_ids):
+        return select(CustomerEmotionSummary).where(CustomerEmotionSummary.customer_id.in_(customer_ids))
+
+    def cached(self, customer_id):
+        """(found, summary) from the cache alone"""
+        entry = self.cache.get(customer_id)
+        return (False, None) if entry is None else (True, entry[0])
+
+    def store(self, rows, customer_ids):
+        """Cache query() results for `customer_ids`; returns customer_id -> summary"""
+        found = {row.customer_id: summary_from_row(row) for row in rows}
+        for customer_id in customer_ids:
+            # In a list, so "no history yet" is cached too and apply() can
+            # update the entry without pushing back its expiry
+            self.cache.set(customer_id, [found.get(customer_id)])
+        return {customer_id: found.get(customer_id) for customer_id in customer_ids}
+
+    def lookup(self, customer_ids):
+        """(customer_id -> summary for the cached ones, customer_ids to read with query())"""
+        result, missing = {}, []
+        for customer_id in dict.fromkeys(str(c) for c in customer_ids):
+            found, summary = self.cached(customer_id)
+            if found:
+                result[customer_id] = summary
+            else:
+                missing.append(customer_id)
+        return result, missing
+
+    def get_many(self, customer_ids):
+        """customer_id -> summary (or None), reading the misses in one query"""
+        result, missing = self.lookup(customer_ids)
+        if missing:
+            with read_session() as session:
+                rows = session.execute(self.query(missing)).scalars().all()
+            result.update(self.store(rows, missing))
+        return result
+
+    def get(self, customer_id):
+        return self.get_many([customer_id])[str(customer_id)]
+
+    def apply(self, deltas):
+        """Add a flushed batch to the cached summaries it touches"""
+        for customer_id, delta in deltas.items():
+            entry = self.cache.get(customer_id)
+            if entry is None:
+                continue
+            summary = dict(entry[0] or {'events': 0, 'counts': dict.fromkeys(EMOTIONS, 0), 'polarity_sum': 0.0,
+                                       'last_emotion': None, 'last_event_at': None})
+            summary['counts'] = {emotion: summary['counts'][emotion] + delta[emotion] for emotion in EMOTIONS}
+            summary['events'] += delta['events']
+            summary['polarity_sum'] += delta['polarity_sum']
+            if summary['last_event_at'] is None or delta['last_event_at'] >= summary['last_event_at']:
+                summary['last_emotion'] = delta['last_emotion']
+                summary['last_event_at'] = delta['last_event_at']
+            entry[0] = summary
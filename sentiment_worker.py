@@ -0,0 +1,16 @@
+"""TextBlob scoring run inside sentiment pool workers.
+
+Kept free of Flask/SQLAlchemy imports so spawned workers start quickly;
+TextBlob itself is imported on the first call.
+"""
+
+
+def score_texts(texts):
+    """(polarity, subjectivity) for each text"""
+    from textblob import TextBlob
+
+    scores = []
+    for text in texts:
+        sentiment = TextBlob(text).sentiment
+        scores.append((sentiment.polarity, sentiment.subjectivity))
+    return scores
@@ -0,0 +1,121 @@
+"""When the app's engines are built and their heavy dependencies imported.
+
+STARTUP_MODE picks one of:
+
+    eager       build every engine at import and import pandas, SciPy,
+                scikit-learn, TextBlob and pyarrow straight away (the default)
+    lazy        build each engine, and import what it needs, on the first
+                request that uses it
+    background  lazy, plus a daemon thread that warms every engine (imports
+                and caches) as soon as the app is loaded
+
+With gunicorn, GUNICORN_PRELOAD=1 (see gunicorn.conf.py) warms everything
+once in the master after it binds, then forks: workers share the imported
+modules and loaded indexes copy-on-write instead of each paying for them.
+"""
+import os
+import threading
+import time
+
+from extensions import db
+
+MODES = ('eager', 'lazy', 'background')
+
+
+def mode():
+    value = os.environ.get('STARTUP_MODE', 'eager').lower()
+    if value not in MODES:
+        raise RuntimeError(f"STARTUP_MODE must be one of {', '.join(MODES)}, not {value!r}")
+    return value
+
+
+class LazyComponent:
+    """Stands in for an engine until something touches it, then builds it once.
+
+    Attribute access is forwarded to the built engine, so handlers keep
+    calling `dock_scheduler.schedule_truck(...)` unchanged.
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        return f"<LazyComponent {self._name} {'loaded' if self.loaded else 'not loaded'}>"
+
+
+class Components:
+    """The app's engines, built according to STARTUP_MODE"""
+
+    def __init__(self, app):
+        self.app = app
+        self.mode = mode()
+        self.registry = {}
+        self.warm_thread = None
+
+    def add(self, name, factory):
+        """Register an engine; returns it built (eager) or as a LazyComponent"""
+        if self.mode == 'eager':
+            component = factory()
+            warm_up = getattr(component, 'warm_up', None)
+            if warm_up:
+                warm_up(load=False)
+        else:
+            component = LazyComponent(name, factory)
+        self.registry[name] = component
+        return component
+
+    def warm(self):
+        """Build every engine, import its dependencies and load its caches.
+
+        Failures (e.g. the database not reachable yet) are logged and left
+        for the first request to retry.
+        """
+        if self.warm_thread is not None and self.warm_thread is not threading.current_thread():
+            self.warm_thread.join()
+        with self.app.app_context():
+            for name, component in self.registry.items():
+                started = time.perf_counter()
+                try:
+                    warm_up = getattr(component, 'warm_up', None)
+                    if warm_up:
+                        warm_up()
+                except Exception:
+                    self.app.logger.exception('warming %s failed', name)
+                    continue
+                self.app.logger.info('warmed %s in %.0f ms', name, (time.perf_counter() - started) * 1000)
+
+    def warm_in_background(self):
+        """Start warm() on a daemon thread (once)"""
+        if self.warm_thread is None:
+            self.warm_thread = threading.Thread(target=self.warm, name='startup-warm', daemon=True)
+            self.warm_thread.start()
+        return self.warm_thread
+
+    def after_fork(self):
+        """Drop pooled connections inherited from a preloading parent.
+
+        The parent's sockets must not be shared; close=False leaves them
+        for the parent, and the child opens its own on demand.
+        """
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
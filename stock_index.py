@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.dialects.postgresql import BIT
+
+from db_pool import read_session
+from index_sync import on_commit
+from models import InventoryItem
+
+
+def product_hash(product_id):
+    """28-bit hash of a product id, the same number product_hash_sql() gives"""
+    return int(hashlib.md5(product_id.encode()).hexdigest()[:7], 16)
+
+
+def product_hash_sql(column):
+    return cast(cast(func.concat('x', func.substr(func.md5(column), 1, 7)), BIT(28)), BigInteger)
+
+
+class StockIndex:
+    """In-memory product_id -> {warehouse_id: quantity} view of InventoryItem.
+
+    Loaded once, then kept current from committed ORM changes. The index
+    also maintains (row count, total quantity, quantity x warehouse_id and,
+    on Postgres, quantity x product_hash) as it applies changes; every
+    `check_interval` seconds that fingerprint is compared with the table,
+    and a mismatch (stock moved by another process or a bulk UPDATE)
+    triggers a full reload. A full reload also runs every `reload_interval`
+    seconds, for changes that happen to leave the sums unchanged.
+
+    `external_refresh` works as in WarehouseIndex.
+    """
+
+    def __init__(self, check_interval=30, reload_interval=600):
+        self.check_interval = check_interval
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.stock = {}
+        self.signature = None
+        self.checked_at = 0.0
+        self.loaded_at = None
+        self.loaded = False
+        self.external_refresh = False
+        on_commit(InventoryItem, self.apply_changes,
+                  track=('product_id', 'warehouse_id', 'quantity'))
+
+    def signature_query(self, dialect='postgresql'):
+        columns = [
+            func.count(InventoryItem.id),
+            func.coalesce(func.sum(InventoryItem.quantity), 0),
+            func.coalesce(func.sum(InventoryItem.quantity * InventoryItem.warehouse_id), 0)
+        ]
+        if dialect == 'postgresql':
+            # Elsewhere there is no md5(); reload_interval covers moves between products
+            columns.append(func.coalesce(
+                func.sum(InventoryItem.quantity * product_hash_sql(InventoryItem.product_id)), 0))
+        return select(*columns)
+
+    def rows_query(self):
+        return select(
+            InventoryItem.product_id, InventoryItem.warehouse_id, func.sum(InventoryItem.quantity)
+        ).group_by(InventoryItem.product_id, InventoryItem.warehouse_id)
+
+    def table_signature(self):
+        with read_session() as session:
+            return session.execute(self.signature_query(session.get_bind().dialect.name)).one()
+
+    def rebuild(self, rows):
+        """Build from (product_id, warehouse_id, quantity) rows"""
+        stock = {}
+        for product_id, warehouse_id, quantity in rows:
+            stock.setdefault(product_id, {})[warehouse_id] = int(quantity)
+        self.stock = stock
+        self.loaded = True
+
+    def needs_reload(self, signature):
+        if not self.loaded or time.monotonic() - self.loaded_at >= self.reload_interval:
+            return True
+        return [int(v) for v in signature] != self.signature
+
+    def load(self, signature, rows):
+        self.rebuild(rows)
+        # Kept as a list: apply_changes() updates it in place
+        self.signature = [int(v) for v in signature]
+        self.loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if self.external_refresh:
+            return
+        now = time.monotonic()
+        if self.loaded and now - self.checked_at < self.check_interval:
+            return
+        with self.lock:
+            if self.loaded and now - self.checked_at < self.check_interval:
+                return
+            signature = self.table_signature()
+            if self.needs_reload(signature):
+                with read_session() as session:
+                    self.load(signature, session.execute(self.rows_query()).all())
+            self.checked_at = now
+
+    def adjust(self, product_id, warehouse_id, delta):
+        """Add delta units of a product at a warehouse"""
+        by_warehouse = self.stock.setdefault(product_id, {})
+        quantity = by_warehouse.get(warehouse_id, 0) + delta
+        if quantity > 0:
+            by_warehouse[warehouse_id] = quantity
+        else:
+            by_warehouse.pop(warehouse_id, None)
+
+    def _apply_row(self, values, sign):
+        product_id, warehouse_id = values['product_id'], values['warehouse_id']
+        quantity = values['quantity'] or 0
+        self.adjust(product_id, warehouse_id, sign * quantity)
+        if self.signature is not None:
+            self.signature[0] += sign
+            self.signature[1] += sign * quantity
+            self.signature[2] += sign * quantity * warehouse_id
+            if len(self.signature) > 3:
+                self.signature[3] += sign * quantity * product_hash(product_id)
+
+    def apply_changes(self, changes):
+        """on_commit callback: replay committed InventoryItem changes"""
+        with self.lock:
+            if not self.loaded:
+                return
+            for op, values, previous in changes:
+                if op in ('update', 'delete'):
+                    self._apply_row(dict(values, **previous), -1)
+                if op in ('insert', 'update'):
+                    self._apply_row(values, 1)
+
+    def available(self, product_id):
+        """{warehouse_id: quantity} holding stock of a product"""
+        self.ensure_fresh()
+        return self.stock.get(product_id, {})
+
+    def warehouses_covering(self, needs):
+        """Warehouses that can ship every (product_id, quantity) in needs on their own"""
+        self.ensure_fresh()
+        covering = None
+        for product_id, quantity in needs.items():
+            holders = {w for w, q in self.stock.get(product_id, {}).items() if q >= quantity}
+            covering = holders if covering is None else covering & holders
+            if not covering:
+                return set()
+        return covering or set()
@@ -0,0 +1,164 @@
+"""Traffic delay providers for delivery-time estimates.
+
+A provider answers "how many minutes of delay on this corridor in this
+time-of-day bucket". TrafficService sits in front of a provider, memoises
+answers per (corridor, bucket) and collapses concurrent lookups for the
+same key into a single provider call.
+"""
+import threading
+import zlib
+from concurrent.futures import Future
+from datetime import datetime
+
+import numpy as np
+
+from cache import TTLCache
+
+TRAFFIC_LEVELS = ('low', 'moderate', 'high')
+
+
+def traffic_level(delay):
+    if delay < 15:
+        return 'low'
+    if delay < 35:
+        return 'moderate'
+    return 'high'
+
+
+class TrafficProvider:
+    """Interface for traffic sources"""
+
+    # Cheap in-process lookups don't need concurrent callers de-duplicated
+    local = False
+
+    def delay(self, corridor, bucket):
+        """Delay in minutes for a corridor key during a time-of-day bucket"""
+        raise NotImplementedError
+
+
+class TableTrafficProvider(TrafficProvider):
+    """Corridor x time-of-day delay table held in a NumPy array.
+
+    Corridor keys hash onto table rows. Without a table file a deterministic
+    synthetic one is generated: a per-corridor base delay shaped by morning
+    and evening rush hours.
+    """
+
+    local = True
+
+    def __init__(self, path=None, corridors=256, buckets_per_day=96, seed=42):
+        if path:
+            self.table = np.load(path, mmap_mode='r')
+        else:
+            rng = np.random.default_rng(seed)
+            hours = np.arange(buckets_per_day) * 24 / buckets_per_day
+            rush = (np.exp(-((hours - 9) / 1.5) ** 2) + np.exp(-((hours - 18.5) / 2) ** 2))
+            base = rng.uniform(2, 20, size=(corridors, 1))
+            peak = rng.uniform(10, 45, size=(corridors, 1))
+            self.table = np.rint(base + peak * rush[None, :]).astype(np.int16)
+        self.corridors, self.buckets_per_day = self.table.shape
+
+    def row(self, corridor):
+        return zlib.crc32(corridor.encode()) % self.corridors
+
+    def delay(self, corridor, bucket):
+        return int(self.table[self.row(corridor), bucket % self.buckets_per_day])
+
+
+class HttpTrafficProvider(TrafficProvider):
+    """Live feed over HTTP (see traffic_stub_server.py for a local stand-in).
+
+    Falls back to `fallback` when the feed errors or times out.
+    """
+
+    def __init__(self, base_url, fallback=None, timeout=0.5):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.fallback = fallback or TableTrafficProvider()
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def delay(self, corridor, bucket):
+        import requests
+
+        try:
+            response = self.session.get(f"{self.base_url}/delay",
+                                        params={'corridor': corridor, 'bucket': bucket},
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            return int(response.json()['estimated_delay'])
+        except (requests.RequestException, KeyError, ValueError):
+            return self.fallback.delay(corridor, bucket)
+
+
+class TrafficService:
+    """Memoised, de-duplicated traffic lookups per (corridor, time bucket)"""
+
+    def __init__(self, provider, bucket_minutes=15, maxsize=50000):
+        self.provider = provider
+        self.bucket_minutes = bucket_minutes
+        # An answer is good for the rest of its bucket at most
+        self.cache = TTLCache(maxsize=maxsize, ttl=bucket_minutes * 60)
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def corridor_key(self, route):
+        """Stable string key for an (origin, destination) route"""
+        return self._corridor(self.normalize(route))
+
+    def _corridor(self, places):
+        return '|'.join(place if isinstance(place, str) else f"{place[0]:.2f},{place[1]:.2f}"
+                        for place in places)
+
+    def normalize(self, route):
+        """Route as a hashable tuple of place names and rounded (lat, lng) pairs"""
+        return tuple(self._place(place) for place in route)
+
+    def _place(self, place):
+        if isinstance(place, str):
+            return place
+        if isinstance(place, dict):
+            place = (place.get('lat', place.get('latitude')), place.get('lng', place.get('longitude')))
+        if isinstance(place, (list, tuple)):
+            # ~1 km grid so nearby customers share a corridor
+            return round(float(place[0]), 2), round(float(place[1]), 2)
+        return str(place)
+
+    def bucket(self, when=None):
+        when = when or datetime.now()
+        return (when.hour * 60 + when.minute) // self.bucket_minutes
+
+    def get(self, route, when=None):
+        # Cheap tuple key; the provider's string corridor is only built on a miss
+        key = (self.normalize(route), self.bucket(when))
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        if self.provider.local:
+            return self._fetch(key)
+
+        with self.lock:
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._fetch(key)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+
+    def _fetch(self, key):
+        delay = self.provider.delay(self._corridor(key[0]), key[1])
+        result = {'level': traffic_level(delay), 'estimated_delay': delay}
+        self.cache.set(key, result)
+        return result
@@ -0,0 +1,51 @@
+"""Local stand-in for a live traffic feed.
+
+    python traffic_stub_server.py [--port 8050] [--latency-ms 20]
+
+Serves GET /delay?corridor=<key>&bucket=<n> from the same table
+TableTrafficProvider uses, optionally with added latency so caching and
+request de-duplication can be exercised. Point the app at it with
+TRAFFIC_FEED_URL=http://localhost:8050.
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from traffic import TableTrafficProvider, traffic_level
+
+
+def make_handler(provider, latency):
+    class TrafficHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path != '/delay' or 'corridor' not in params:
+                self.send_error(404)
+                return
+            time.sleep(latency)
+            delay = provider.delay(params['corridor'][0], int(params.get('bucket', ['0'])[0]))
+            body = json.dumps({'level': traffic_level(delay), 'estimated_delay': delay}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TrafficHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local traffic feed stub")
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--table', help=".npy corridor x bucket delay table")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('localhost', args.port),
+                                 make_handler(TableTrafficProvider(args.table), args.latency_ms / 1000))
+    print(f"Traffic stub listening on http://localhost:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,105 @@
+"""Train the dock unload-time model on booking history and publish it.
+
+    python train_unload_model.py [--days 180] [--min-new-rows 200] [--force]
+    python train_unload_model.py --every 3600      # keep retraining, e.g. as a sidecar
+
+Runs outside the web workers, so training never holds up a request: the
+workers notice the new file within UnloadTimePredictor.check_interval and
+memory-map it. Fits on completed bookings (actual_duration set) from the
+last --days, read from READ_DATABASE_URL when set, else DATABASE_URL.
+
+Retraining is incremental in when it happens: a run is skipped until at
+least --min-new-rows bookings have completed since the published model was
+trained. A model that does worse than the hand-written rule on held-out
+bookings is not published. The job runs at low CPU priority with --threads
+OpenMP threads, so it does not starve request workers on the same host.
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from unload_model import DEFAULT_PATH, UnloadTimeModel, history_signature_query, training_query
+
+
+def published(path):
+    try:
+        return UnloadTimeModel.load(path)
+    except FileNotFoundError:
+        return None
+
+
+def train_once(engine, path, days, max_rows, min_rows, min_new_rows, force=False):
+    """Train and publish if there is enough new history; returns True when a model was written"""
+    with Session(engine) as session:
+        completed, newest_id = session.execute(history_signature_query()).one()
+        current = published(path)
+        trained_on = current.meta.get('history') if current else None
+        if trained_on and not force and completed - trained_on[0] < min_new_rows:
+            print(f"{completed - trained_on[0]} bookings completed since the published model; nothing to do")
+            return False
+        rows = session.execute(training_query(datetime.now() - timedelta(days=days), max_rows)).all()
+    if len(rows) < min_rows:
+        print(f"Only {len(rows)} completed bookings in the last {days} days; need {min_rows}")
+        return False
+
+    started = time.perf_counter()
+    model = UnloadTimeModel.fit(rows)
+    model.meta['history'] = [completed, newest_id]
+    model.meta['fit_seconds'] = round(time.perf_counter() - started, 2)
+    print(f"Trained on {model.meta['rows']} bookings in {model.meta['fit_seconds']}s: "
+          f"held-out MAE {model.meta.get('holdout_mae', float('nan')):.1f} min "
+          f"(rule {model.meta.get('rule_mae', float('nan')):.1f} min)")
+    if not force and model.meta.get('holdout_mae', 0) > model.meta.get('rule_mae', float('inf')):
+        print("Worse than the rule on held-out bookings; not published")
+        return False
+    model.save(path)
+    print(f"Published {path}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default=os.environ.get('UNLOAD_MODEL_PATH', DEFAULT_PATH))
+    parser.add_argument('--days', type=int, default=180, help='history window')
+    parser.add_argument('--max-rows', type=int, default=500000, help='newest bookings to train on at most')
+    parser.add_argument('--min-rows', type=int, default=1000)
+    parser.add_argument('--min-new-rows', type=int, default=200,
+                        help='completed bookings since the last model needed to retrain')
+    parser.add_argument('--every', type=float, help='seconds between runs; run once when omitted')
+    parser.add_argument('--threads', type=int, default=1, help='OpenMP threads for fitting')
+    parser.add_argument('--nice', type=int, default=10)
+    parser.add_argument('--force', action='store_true', help='train and publish regardless')
+    args = parser.parse_args()
+
+    load_dotenv()
+    url = os.environ.get('READ_DATABASE_URL') or os.environ.get('DATABASE_URL')
+    if not url:
+        raise RuntimeError("DATABASE_URL environment variable not set! Please set it in your environment or .env file.")
+    engine = create_engine(url, pool_pre_ping=True)
+    if args.nice:
+        os.nice(args.nice)
+
+    from threadpoolctl import threadpool_limits
+
+    with threadpool_limits(args.threads):
+        while True:
+            try:
+                train_once(engine, args.path, args.days, args.max_rows, args.min_rows, args.min_new_rows,
+                           args.force)
+            except Exception as e:
+                if args.every is None:
+                    raise
+                # A scheduled trainer keeps going; the published model stays
+                print(f"Training failed: {e!r}")
+            if args.every is None:
+                break
+            time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
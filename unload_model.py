@@ -0,0 +1,190 @@
+"""Learned unload times for the dock scheduler.
+
+A gradient-boosted regressor maps (truck size, cargo type, dock, hour,
+warehouse) to DockSchedule.actual_duration. train_unload_model.py fits it
+from booking history and publishes it as a joblib file; the scheduler
+memory-maps that file, scores whole batches in one predict call, and picks
+up a newer file on its own. Without a usable model it falls back to
+rule_minutes, the original hand-written estimate.
+
+scikit-learn and joblib are imported on first use (see startup.py).
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import func, select
+
+from models import DockSchedule
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts', 'unload_time.joblib')
+FEATURES = ('truck_size', 'cargo_type', 'dock_number', 'hour', 'warehouse_id')
+CATEGORICAL = np.array([True, True, False, False, True])
+SIZES = ('small', 'medium', 'large')
+# HistGradientBoosting takes at most 255 categories per feature (one bin is for missing)
+MAX_CATEGORIES = 254
+MIN_MINUTES, MAX_MINUTES = 5, 480
+
+
+def rule_minutes(size, cargo_type):
+    """Hand-written estimate: 30 minutes, adjusted for truck size and fragile cargo"""
+    minutes = 30
+    if size == 'large':
+        minutes += 15
+    elif size == 'small':
+        minutes -= 10
+    if cargo_type == 'fragile':
+        minutes += 20
+    return minutes
+
+
+def codes(values, vocabulary):
+    """Category codes for `values`; anything outside the vocabulary is NaN (missing)"""
+    lookup = {value: i for i, value in enumerate(vocabulary)}
+    return np.array([lookup.get(value, np.nan) for value in values], dtype=float)
+
+
+def training_query(since=None, limit=None):
+    """Completed bookings, newest first, as (truck_size, cargo_type, dock_number,
+    scheduled_time, warehouse_id, actual_duration)"""
+    query = select(DockSchedule.truck_size, DockSchedule.cargo_type, DockSchedule.dock_number,
+                   DockSchedule.scheduled_time, DockSchedule.warehouse_id, DockSchedule.actual_duration
+                   ).where(DockSchedule.actual_duration > 0)
+    if since is not None:
+        query = query.where(DockSchedule.scheduled_time >= since)
+    return query.order_by(DockSchedule.scheduled_time.desc()).limit(limit)
+
+
+def history_signature_query():
+    """(completed bookings, newest id): how much history a model was trained on"""
+    return select(func.count(), func.max(DockSchedule.id)).where(DockSchedule.actual_duration > 0)
+
+
+class UnloadTimeModel:
+    """A fitted regressor plus the category vocabularies it was trained with"""
+
+    def __init__(self, estimator, cargo_types, warehouses, meta):
+        self.estimator = estimator
+        self.cargo_types = cargo_types
+        self.warehouses = warehouses
+        self.meta = meta
+
+    @classmethod
+    def fit(cls, rows, holdout=0.2, seed=0, **params):
+        """Fit on training_query() rows.
+
+        A random `holdout` share is scored first, against the rule as well,
+        then the model is refitted on every row. The scores land in `meta`.
+        """
+        from sklearn.ensemble import HistGradientBoostingRegressor
+
+        sizes = [size or 'medium' for size, *_ in rows]
+        cargo = [cargo_type or 'general' for _, cargo_type, *_ in rows]
+        cargo_types = [c for c, _ in Counter(cargo).most_common(MAX_CATEGORIES)]
+        warehouses = [w for w, _ in Counter(r[4] for r in rows).most_common(MAX_CATEGORIES)]
+        model = cls(None, cargo_types, warehouses, {})
+        X = model.features(sizes, cargo, [r[2] for r in rows], [r[3].hour for r in rows], [r[4] for r in rows])
+        y = np.array([r[5] for r in rows], dtype=float)
+
+        params = dict({'max_iter': 200, 'learning_rate': 0.1, 'categorical_features': CATEGORICAL,
+                       'random_state': seed}, **params)
+        shuffled = np.random.default_rng(seed).permutation(len(y))
+        test, train = shuffled[:int(len(y) * holdout)], shuffled[int(len(y) * holdout):]
+        meta = {'rows': len(y), 'trained_at': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+        if len(test):
+            estimator = HistGradientBoostingRegressor(**params).fit(X[train], y[train])
+            rule = np.array([rule_minutes(sizes[i], cargo[i]) for i in test], dtype=float)
+            meta['holdout_rows'] = len(test)
+            meta['holdout_mae'] = float(np.abs(estimator.predict(X[test]) - y[test]).mean())
+            meta['rule_mae'] = float(np.abs(rule - y[test]).mean())
+        model.estimator = HistGradientBoostingRegressor(**params).fit(X, y)
+        model.meta = meta
+        return model
+
+    def features(self, sizes, cargo_types, docks, hours, warehouses):
+        return np.column_stack([
+            codes(sizes, SIZES),
+            codes(cargo_types, self.cargo_types),
+            np.asarray(docks, dtype=float),
+            np.asarray(hours, dtype=float),
+            codes(warehouses, self.warehouses),
+        ])
+
+    def predict(self, trucks, warehouse_id, hour, docks):
+        """(truck, dock) matrix of minutes, from one predict call"""
+        sizes = [truck.get('size') or 'medium' for truck in trucks]
+        cargo = [truck.get('cargo_type') or 'general' for truck in trucks]
+        n = len(trucks)
+        docks = np.asarray(docks, dtype=float)
+        # Row i * len(docks) + k is truck i on dock k
+        X = self.features(np.repeat(sizes, len(docks)), np.repeat(cargo, len(docks)), np.tile(docks, n),
+                          np.full(n * len(docks), hour), [warehouse_id] * (n * len(docks)))
+        return self.minutes(self.estimator.predict(X)).reshape(n, len(docks))
+
+    def minutes(self, predicted):
+        return np.clip(np.rint(predicted), MIN_MINUTES, MAX_MINUTES).astype(int)
+
+    def save(self, path):
+        """Write to `path` atomically (readers see the old file or the new one)"""
+        import joblib
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        # Uncompressed, so load() can memory-map the tree arrays
+        joblib.dump(self, tmp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        """Memory-mapped: workers on one host share the arrays through the page cache"""
+        import joblib
+
+        return joblib.load(path, mmap_mode='r')
+
+
+class UnloadTimePredictor:
+    """The scheduler's handle on the current model file.
+
+    The file's mtime is checked at most every `check_interval` seconds and a
+    changed file is loaded by one caller while the others keep using the
+    previous model. No file means no model (the rule); a file that fails to
+    load is logged and the previous model stays.
+    """
+
+    def __init__(self, path=None, check_interval=60):
+        self.path = path or os.environ.get('UNLOAD_MODEL_PATH', DEFAULT_PATH)
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.current = None
+        self.mtime = None
+        self.checked_at = None
+
+    def model(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.check_interval:
+            return self.current
+        if not self.lock.acquire(blocking=self.checked_at is None):
+            return self.current
+        try:
+            self.checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                self.current = self.mtime = None
+                return None
+            if mtime != self.mtime:
+                try:
+                    self.current = UnloadTimeModel.load(self.path)
+                    logger.info("Loaded unload-time model %s (%s)", self.path, self.current.meta)
+                except Exception:
+                    logger.exception("Could not load unload-time model %s; keeping the previous one", self.path)
+                self.mtime = mtime
+            return self.current
+        finally:
+            self.lock.release()
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func, select
+
+from db_pool import read_session
+from geo import EARTH_RADIUS_KM, haversine_km
+from index_sync import on_commit
+from models import Warehouse
+
+
+class WarehouseIndex:
+    """BallTree over warehouse coordinates for nearest-warehouse lookups.
+
+    Built on first use and rebuilt only when the warehouse table changes:
+    commits made through this process mark it stale straight away, and every
+    `check_interval` seconds a one-row aggregate over the table catches
+    changes made elsewhere.
+
+    With `external_refresh` set, lookups never query the database; the
+    owner keeps the index current through signature_query(), rows_query()
+    and load() instead (the ASGI app does this with its async engine).
+    """
+
+    def __init__(self, check_interval=60):
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        # (tree, ids, locations, coords_deg, id -> row); swapped as a whole on rebuild
+        self.snapshot = None
+        self.signature = None
+        self.checked_at = 0.0
+        self.stale = True
+        self.external_refresh = False
+        on_commit(Warehouse, self.mark_stale)
+
+    def mark_stale(self, changes=None):
+        self.stale = True
+
+    def signature_query(self):
+        """Cheap fingerprint of the rows the index is built from"""
+        return select(func.count(Warehouse.id), func.max(Warehouse.id),
+                      func.sum(Warehouse.latitude), func.sum(Warehouse.longitude))
+
+    def rows_query(self):
+        return select(Warehouse.id, Warehouse.location, Warehouse.latitude, Warehouse.longitude)
+
+    def table_signature(self):
+        with read_session() as session:
+            return tuple(session.execute(self.signature_query()).one())
+
+    def rebuild(self, rows):
+        """Build the tree from (id, location, latitude, longitude) rows"""
+        from sklearn.neighbors import BallTree
+
+        rows = [r for r in rows if r[2] is not None and r[3] is not None]
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        locations = [r[1] for r in rows]
+        coords = np.array([(r[2], r[3]) for r in rows], dtype=float).reshape(-1, 2)
+        tree = BallTree(np.radians(coords), metric='haversine') if rows else None
+        positions = {int(w): i for i, w in enumerate(ids)}
+        self.snapshot = (tree, ids, locations, coords, positions)
+
+    def needs_reload(self, signature):
+        return self.stale or signature != self.signature or self.snapshot is None
+
+    def load(self, signature, rows):
+        """Rebuild from rows_query() results taken with `signature`"""
+        self.stale = False
+        self.rebuild(rows)
+        self.signature = signature
+
+    def ensure_fresh(self):
+        if self.external_refresh:
+            return
+        now = time.monotonic()
+        if not self.stale and self.snapshot is not None and now - self.checked_at < self.check_interval:
+            return
+        with self.lock:
+            if not self.stale and self.snapshot is not None and now - self.checked_at < self.check_interval:
+                return
+            signature = self.table_signature()
+            if self.needs_reload(signature):
+                with read_session() as session:
+                    self.load(signature, session.execute(self.rows_query()).all())
+            self.checked_at = now
+
+    def nearest(self, latitude, longitude, k=1):
+        """Up to k nearest warehouses as (id, location, distance_km), closest first"""
+        self.ensure_fresh()
+        tree, ids, locations, _, _ = self.snapshot
+        if tree is None:
+            return []
+        k = min(k, len(ids))
+        dist, idx = tree.query(np.radians([[latitude, longitude]]), k=k)
+        return [(int(ids[i]), locations[i], float(d) * EARTH_RADIUS_KM)
+                for d, i in zip(dist[0], idx[0])]
+
+    def distances(self, latitude, longitude, warehouse_ids):
+        """(id, location, distance_km) for the given warehouses, closest first.
+
+        Warehouses without coordinates are left out.
+        """
+        self.ensure_fresh()
+        _, ids, locations, coords, positions = self.snapshot
+        rows = [positions[w] for w in warehouse_ids if w in positions]
+        if not rows:
+            return []
+        dist = haversine_km(latitude, longitude, coords[rows, 0], coords[rows, 1])
+        order = np.argsort(dist, kind='stable')
+        return [(int(ids[rows[i]]), locations[rows[i]], float(dist[i])) for i in order]
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from db_pool import read_session
+from models import WeatherData
+
+
+class WeatherCache:
+    """Latest WeatherData row per location, held in process.
+
+    The whole map is refreshed with one query every `ttl` seconds. Only the
+    request that notices expiry runs the refresh; concurrent requests keep
+    reading the previous map instead of waiting, so lookups never touch the
+    database except for the very first load. With `external_refresh` set
+    the owner calls load() with rows_query() results instead.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.refreshed_at = None
+        self.external_refresh = False
+
+    def rows_query(self, dialect='postgresql'):
+        columns = (WeatherData.location, WeatherData.temperature, WeatherData.humidity,
+                   WeatherData.weather_condition, WeatherData.wind_speed, WeatherData.timestamp)
+        if dialect == 'postgresql':
+            # DISTINCT ON walks weather_data_location_timestamp_idx once
+            return select(*columns).distinct(WeatherData.location).order_by(
+                WeatherData.location, WeatherData.timestamp.desc())
+        newest = select(
+            WeatherData.location, func.max(WeatherData.timestamp).label('timestamp')
+        ).group_by(WeatherData.location).subquery()
+        return select(*columns).join(
+            newest, (WeatherData.location == newest.c.location) & (WeatherData.timestamp == newest.c.timestamp))
+
+    def fetch_latest(self):
+        with read_session() as session:
+            rows = session.execute(self.rows_query(session.get_bind().dialect.name)).all()
+        return self.latest_by_location(rows)
+
+    def latest_by_location(self, rows):
+        return {row.location: {
+            'location': row.location,
+            'temperature': row.temperature,
+            'humidity': row.humidity,
+            'weather_condition': row.weather_condition,
+            'wind_speed': row.wind_speed,
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None
+        } for row in rows}
+
+    def needs_reload(self, signature):
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.ttl
+
+    def load(self, signature, rows):
+        """Replace the map with rows_query() results (there is no signature)"""
+        self.latest = self.latest_by_location(rows)
+        self.refreshed_at = time.monotonic()
+
+    def refresh(self):
+        self.latest = self.fetch_latest()
+        self.refreshed_at = time.monotonic()
+
+    def get(self, location):
+        """Latest weather for a location as a dict, or None"""
+        if self.external_refresh:
+            return self.latest.get(location)
+        if self.refreshed_at is None:
+            with self.lock:
+                if self.refreshed_at is None:
+                    self.refresh()
+        elif time.monotonic() - self.refreshed_at >= self.ttl and self.lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self.lock.release()
+        return self.latest.get(location)